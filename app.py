@@ -3,16 +3,37 @@
 MCP SSH Server - Main application file
 Provides a web interface to SSH to other computers
 """
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import (Flask, Response, render_template, request, jsonify, redirect, url_for, session,
+                   copy_current_request_context, g)
 from flask_cors import CORS
 import os
+import math
 import json
 import logging
 import datetime
+import struct
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from ssh_client import SSHClient
+from ssh_client import SSHClient, bastion_pool
 from config import Config
 from mcp_loader import load_mcp_config
+from compression import ResponseCompressor
+from output_spool import SpoolManager, SpoolNotFound
+from prewarm import ConnectionPrewarmer
+from session_registry import SessionRegistry
+from session_state import SessionStore, SECRET_FIELDS
+from port_forward import ForwardManager, ForwardNotFound
+from remote_fs import FilesystemManager
+from watch import WatchManager, WatchEnded
+from remote_search import SEARCH_TOOLS, search_command, search_key, decode_cursor, iter_search_results
+from broker import BrokerClient
+from scheduler import AdmissionScheduler, Overloaded, parse_weights
+from audit import AuditLog
+from diagnostics import process_stats, tracemalloc_tracker, TRACEMALLOC_GROUPINGS
+from tuning import PROFILES, describe_profiles
 
 # Load environment variables
 load_dotenv()
@@ -27,7 +48,6 @@ logger = logging.getLogger(__name__)
 
 # Load MCP config settings
 mcp_settings = load_mcp_config()
-logger.info(f"Loaded MCP settings: {json.dumps(mcp_settings, indent=2)}")
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -41,9 +61,118 @@ CORS(app)
 def inject_now():
     return {'now': datetime.datetime.now()}
 
+@app.template_filter('jump_host_specs')
+def jump_host_specs(jump_hosts):
+    """Render saved jump hosts as a comma-separated list of user@host:port."""
+    specs = []
+    for hop in jump_hosts or []:
+        if isinstance(hop, dict):
+            hop = f"{hop.get('username')}@{hop.get('hostname')}:{hop.get('port') or 22}"
+        specs.append(hop)
+    return ','.join(specs)
+
 # Load configuration
 config = Config()
-ssh_connections = {}
+
+def redact_settings(settings):
+    """Copy MCP settings with their secrets masked, for logging."""
+    return {key: '***' if value and key in SECRET_FIELDS else value
+            for key, value in settings.items()}
+
+def parse_bool(value):
+    """Interpret a JSON, form or YAML value as a boolean."""
+    if isinstance(value, str):
+        return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+    return bool(value)
+
+# In multi-process mode (see serve.py) SSH sessions and spooled output live
+# in broker processes, reached over the Unix sockets in MCP_BROKER_SOCKETS
+broker_sockets = [path for path in os.getenv('MCP_BROKER_SOCKETS', '').split(',') if path]
+brokers = BrokerClient(broker_sockets) if broker_sockets else None
+
+if brokers:
+    ssh_connections = brokers.registry
+    output_spools = brokers.spools
+else:
+    # Live SSH sessions. Idle sessions are closed after MCP_IDLE_TIMEOUT
+    # seconds and the least recently used are evicted past MCP_MAX_SESSIONS;
+    # evicted sessions reconnect on next use.
+    ssh_connections = SessionRegistry(
+        max_sessions=int(os.getenv('MCP_MAX_SESSIONS', 0)),
+        idle_timeout=int(os.getenv('MCP_IDLE_TIMEOUT', 0))
+    )
+    
+    # Large command output is spooled to disk and retrieved in pages
+    output_spools = SpoolManager(
+        directory=os.getenv('MCP_SPOOL_DIR') or None,
+        threshold=int(os.getenv('MCP_SPOOL_THRESHOLD', 1024 * 1024)),
+        ttl=int(os.getenv('MCP_SPOOL_TTL', 600)),
+        quota=int(os.getenv('MCP_SPOOL_QUOTA', 1024 * 1024 * 1024)),
+        page_size=int(os.getenv('MCP_SPOOL_PAGE_SIZE', 64 * 1024)),
+        max_page_size=int(os.getenv('MCP_SPOOL_MAX_PAGE_SIZE', 1024 * 1024))
+    )
+
+# Port forwards over live sessions
+port_forwards = ForwardManager()
+
+# Cached SFTP views of remote filesystems, per connection
+remote_filesystems = FilesystemManager(
+    ttl=float(os.getenv('MCP_FS_CACHE_TTL', 10)),
+    max_channels=int(os.getenv('MCP_FS_CHANNELS', 4))
+)
+
+# Admission control for command execution, per worker process
+scheduler = AdmissionScheduler(
+    max_running=int(os.getenv('MCP_MAX_RUNNING', 32)),
+    max_per_connection=int(os.getenv('MCP_MAX_PER_CONNECTION', 8)),
+    queue_size=int(os.getenv('MCP_QUEUE_SIZE', 64)),
+    rate=float(os.getenv('MCP_RATE_LIMIT', 0)),
+    burst=int(os.getenv('MCP_RATE_BURST', 10)),
+    max_wait=float(os.getenv('MCP_MAX_QUEUE_WAIT', 60)),
+    weights=parse_weights(os.getenv('MCP_CLIENT_WEIGHTS')),
+    max_clients=int(os.getenv('MCP_MAX_CLIENTS', 1024))
+)
+
+def new_client():
+    """Create an unconnected SSH client, owned by a broker in multi-process mode."""
+    return brokers.new_client() if brokers else SSHClient()
+
+# Durable audit trail of executed commands, written in the background.
+# Each worker writes its own files in multi-process mode, named by its
+# index so a restarted worker carries on rotating the same files.
+audit_log = AuditLog(
+    directory=os.getenv('MCP_AUDIT_DIR') or os.path.join(config.config_dir, 'audit'),
+    name=f"audit-worker{os.getenv('MCP_WORKER_INDEX', os.getpid())}" if brokers else 'audit',
+    max_bytes=int(os.getenv('MCP_AUDIT_MAX_BYTES', 50 * 1024 * 1024)),
+    backups=int(os.getenv('MCP_AUDIT_BACKUPS', 10)),
+    queue_size=int(os.getenv('MCP_AUDIT_QUEUE_SIZE', 10000))
+)
+
+def connect_options(data):
+    """
+    Extract optional SSHClient.connect arguments from request or config data.
+    
+    Args:
+        data (dict): Request JSON, form data or a saved connection
+        
+    Returns:
+        dict: Keyword arguments for SSHClient.connect
+    """
+    options = {}
+    if data.get('key_passphrase'):
+        options['key_passphrase'] = data.get('key_passphrase')
+    if data.get('use_agent') is not None:
+        options['use_agent'] = parse_bool(data.get('use_agent'))
+    if data.get('idle_timeout') not in (None, ''):
+        options['idle_timeout'] = int(data.get('idle_timeout'))
+    jump_hosts = data.get('jump_hosts')
+    if isinstance(jump_hosts, str):
+        jump_hosts = [spec.strip() for spec in jump_hosts.split(',') if spec.strip()]
+    if jump_hosts:
+        options['jump_hosts'] = jump_hosts
+    if data.get('profile'):
+        options['profile'] = data.get('profile')
+    return options
 
 # Auto-connect function
 def auto_connect():
@@ -65,9 +194,15 @@ def auto_connect():
         connection_id = f"{username}@{hostname}:{port}"
         
         try:
+            # Another worker process may have connected it already
+            if connection_id in ssh_connections and ssh_connections[connection_id].is_connected():
+                logger.info(f"Auto-connect skipped: {connection_id} is already connected")
+                return connection_id
+            
             # Create SSH client and connect
-            client = SSHClient()
-            client.connect(hostname, port, username, password, key_path)
+            client = new_client()
+            client.connect(hostname, port, username, password, key_path,
+                           **connect_options(mcp_settings))
             
             # Store connection
             ssh_connections[connection_id] = client
@@ -89,10 +224,475 @@ def auto_connect():
     
     return None
 
-# Try auto-connect at startup
-auto_connection_id = auto_connect()
-if auto_connection_id:
-    logger.info(f"Auto-connected to {auto_connection_id} at startup")
+# Output modes for execute requests:
+#   text   - JSON with decoded (stdout, stderr), the default
+#   raw    - stdout bytes streamed as application/octet-stream
+#   frames - stdout and stderr multiplexed into length-prefixed binary frames
+OUTPUT_MODES = ('text', 'raw', 'frames')
+FRAMES_MIMETYPE = 'application/vnd.mcp-ssh.frames'
+
+# Compress large responses for clients that accept it. Raw and framed
+# output is left alone: it streams at wire speed, and compressing it would
+# flush a compressor per chunk for every client sending Accept-Encoding.
+compressor = ResponseCompressor(
+    min_size=int(os.getenv('MCP_COMPRESS_MIN_SIZE', 1024)),
+    gzip_level=int(os.getenv('MCP_COMPRESS_LEVEL', 6)),
+    exclude_types=('application/octet-stream', FRAMES_MIMETYPE)
+)
+compressor.init_app(app)
+
+# Frame stream ids. Each frame is a 1-byte stream id, a 4-byte big-endian
+# payload length and the payload. The exit frame carries a 4-byte signed
+# exit status; the error frame carries a UTF-8 message.
+FRAME_STREAM_IDS = {'stdout': 1, 'stderr': 2, 'exit': 3, 'error': 4}
+
+def encode_frame(stream, payload):
+    """Encode one output frame."""
+    return struct.pack('>BI', FRAME_STREAM_IDS[stream], len(payload)) + payload
+
+def client_key():
+    """Identify the MCP client making the current request, for scheduling."""
+    return request.headers.get('X-MCP-Client') or request.remote_addr or 'unknown'
+
+def request_source():
+    """Get the address of the current request, for rate limiting, which X-MCP-Client can't change."""
+    return request.remote_addr or 'unknown'
+
+def leased_session(connection_id):
+    """
+    Look up a session for the current request.
+
+    The session can't be evicted until the request ends, so it stays
+    connected between the lookup and the command starting.
+
+    Raises:
+        KeyError: If the connection doesn't exist
+    """
+    client = ssh_connections.lease(connection_id)
+    g.setdefault('session_leases', []).append(connection_id)
+    return client
+
+@app.teardown_request
+def release_session_leases(error=None):
+    """Release the sessions leased by leased_session."""
+    for connection_id in g.pop('session_leases', []):
+        ssh_connections.release_lease(connection_id)
+
+def overloaded_response(error):
+    """Build the 429 response for a command that wasn't admitted."""
+    response = jsonify({
+        "status": "error",
+        "message": str(error),
+        "retry_after": error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def audit_command(client_id, connection_id, command, mode, started, exit_status=None,
+                  sizes=None, error=None):
+    """Queue the audit record of a finished command."""
+    sizes = sizes or {}
+    audit_log.record(
+        client=client_id,
+        connection_id=connection_id,
+        command=command,
+        mode=mode,
+        exit_status=exit_status,
+        duration_ms=round((time.monotonic() - started) * 1000, 1),
+        stdout_bytes=sizes.get('stdout', 0),
+        stderr_bytes=sizes.get('stderr', 0),
+        stdin_bytes=sizes.get('stdin', 0),
+        error=error
+    )
+
+class StdinFeeder:
+    """Copies a request body into a command's stdin from a background thread."""
+    
+    def __init__(self, client, channel, stream):
+        self.sent = 0
+        self.error = None
+        self._client = client
+        self._channel = channel
+        self._stream = stream
+        # Output is read while stdin is written, or a command that writes
+        # before it finishes reading would block both sides
+        self._thread = threading.Thread(target=self._run, name='stdin-feeder', daemon=True)
+        self._thread.start()
+    
+    def read(self, size):
+        """Read from the stream, counting the bytes."""
+        data = self._stream.read(size)
+        self.sent += len(data)
+        return data
+    
+    def _run(self):
+        try:
+            # Counted as read, so a failed copy still reports its progress
+            self._client.write_stdin(self._channel, self)
+        except Exception as e:
+            # Usually the command exited without reading all of its input
+            self.error = str(e) or e.__class__.__name__
+            logger.warning(f"Stopped writing stdin: {self.error}")
+    
+    def join(self):
+        """Wait for the copy to end and describe it."""
+        self._thread.join()
+        return {"bytes": self.sent, "complete": self.error is None, "error": self.error}
+
+def run_captured_command(client_id, client, connection_id, command, source=None):
+    """
+    Run a command under admission control and capture its output.
+    
+    This is the execution core shared by text mode responses and the stdio
+    transport (see mcp_stdio.py).
+    
+    Args:
+        client_id (str): Identifies the requesting client for scheduling
+        client (SSHClient): The connected client
+        connection_id (str): The connection ID
+        command (str): The command to execute
+        source (str, optional): Where the request came from, for rate limiting
+        
+    Returns:
+        OutputSpool: The captured output, paged if it was spooled
+        
+    Raises:
+        Overloaded: If the command was not admitted
+        Exception: If command execution fails
+    """
+    started = time.monotonic()
+    try:
+        ticket = scheduler.admit(client_id, connection_id, source)
+    except Overloaded as e:
+        audit_command(client_id, connection_id, command, 'text', started, error=str(e))
+        raise
+    try:
+        started = time.monotonic()
+        # The command may change files behind the cached listings
+        remote_filesystems.invalidate(connection_id)
+        try:
+            spool = output_spools.capture_command(client, command)
+        except Exception as e:
+            audit_command(client_id, connection_id, command, 'text', started, error=str(e))
+            raise
+    finally:
+        scheduler.release(ticket)
+    audit_command(client_id, connection_id, command, 'text', started,
+                  spool.exit_status, spool.sizes())
+    return spool
+
+def command_output_response(client, connection_id, command, mode='text', stdin=None):
+    """
+    Run a command and build the response in the requested output mode.
+    
+    In text mode, output larger than the spool threshold is kept on disk and
+    only the first page is returned, along with a result handle for paging
+    through the rest. Raw and frames modes stream channel buffers straight
+    to the client without any text decoding.
+    
+    Args:
+        client (SSHClient): The connected client
+        connection_id (str): Connection ID, for logging
+        command (str): The command to execute
+        mode (str): One of OUTPUT_MODES
+        stdin (file-like, optional): Binary stream copied into the command's
+            stdin while its output is read; stdin is closed at its end
+        
+    Returns:
+        flask.Response: The response
+    """
+    client_id = client_key()
+    
+    if mode == 'text' and stdin is None:
+        try:
+            spool = run_captured_command(client_id, client, connection_id, command, request_source())
+            return spool_response(spool)
+        except Overloaded as e:
+            return overloaded_response(e)
+    
+    # Waits for a slot; over-limit requests get a 429 instead
+    started = time.monotonic()
+    try:
+        ticket = scheduler.admit(client_id, connection_id, request_source())
+    except Overloaded as e:
+        audit_command(client_id, connection_id, command, mode, started, error=str(e))
+        return overloaded_response(e)
+    started = time.monotonic()
+    # The command may change files behind the cached listings
+    remote_filesystems.invalidate(connection_id)
+    
+    # Start the command before streaming so startup errors still get a JSON error
+    try:
+        channel = client.open_command(command)
+    except Exception as e:
+        scheduler.release(ticket)
+        audit_command(client_id, connection_id, command, mode, started, error=str(e))
+        raise
+    feeder = StdinFeeder(client, channel, stdin) if stdin is not None else None
+    
+    if mode == 'text':
+        spool = None
+        try:
+            try:
+                spool = output_spools.capture(client.iter_channel_output(channel))
+            finally:
+                scheduler.release(ticket)
+                if spool is None:
+                    # The feeder must stop reading the request body before
+                    # the request ends; closing the channel fails its sends
+                    channel.close()
+                stdin_result = feeder.join()
+        except Exception as e:
+            audit_command(client_id, connection_id, command, mode, started, error=str(e),
+                          sizes={'stdin': stdin_result['bytes']})
+            raise
+        audit_command(client_id, connection_id, command, mode, started,
+                      spool.exit_status, {**spool.sizes(), 'stdin': stdin_result['bytes']})
+        return spool_response(spool, stdin=stdin_result)
+    
+    # Filled in as the output streams, for the audit record
+    outcome = {'sizes': {'stdout': 0, 'stderr': 0}, 'exit_status': None, 'error': None}
+    
+    def read_output():
+        for stream, data in client.iter_channel_output(channel):
+            if stream == 'exit':
+                outcome['exit_status'] = data
+            else:
+                outcome['sizes'][stream] += len(data)
+            yield stream, data
+    
+    def generate_raw():
+        try:
+            for stream, data in read_output():
+                if stream == 'stdout':
+                    yield data
+        except Exception as e:
+            logger.error(f"Raw output error on {connection_id}: {str(e)}")
+            outcome['error'] = str(e)
+    
+    def generate_frames():
+        try:
+            for stream, data in read_output():
+                if stream == 'exit':
+                    yield encode_frame('exit', struct.pack('>i', data))
+                else:
+                    yield encode_frame(stream, data)
+        except Exception as e:
+            logger.error(f"Framed output error on {connection_id}: {str(e)}")
+            outcome['error'] = str(e)
+            yield encode_frame('error', str(e).encode('utf-8'))
+    
+    def finish():
+        # The slot is held until the stream has been sent or abandoned
+        scheduler.release(ticket)
+        if feeder is not None:
+            outcome['sizes']['stdin'] = feeder.join()['bytes']
+        audit_command(client_id, connection_id, command, mode, started, **outcome)
+    
+    if mode == 'raw':
+        response = Response(generate_raw(), mimetype='application/octet-stream')
+    else:
+        response = Response(generate_frames(), mimetype=FRAMES_MIMETYPE)
+    response.call_on_close(finish)
+    return response
+
+def spool_response(spool, **extra):
+    """Build the text mode response for captured output, paged if it was spooled."""
+    if not spool.paged:
+        return jsonify({
+            "status": "ok",
+            "output": spool.text(),
+            **extra
+        })
+    
+    output, result = spool.summary(output_spools.page_size)
+    return jsonify({
+        "status": "ok",
+        "output": output,
+        "result": result,
+        **extra
+    })
+
+def run_watched_command(connection_id, command, client_id, source):
+    """
+    Run one round of a watch.
+    
+    Output too large to keep in memory is cut to the first page.
+    
+    Args:
+        connection_id (str): The connection ID
+        command (str): The command to execute
+        client_id (str): Scheduling identity of the watch
+        source (str): Address of the subscriber that started the watch
+    
+    Returns:
+        tuple: (stdout, stderr, exit_status, truncated)
+    """
+    try:
+        client = ssh_connections.lease(connection_id)
+    except KeyError:
+        raise WatchEnded(f"Connection {connection_id} was disconnected")
+    try:
+        spool = run_captured_command(client_id, client, connection_id, command, source)
+    finally:
+        ssh_connections.release_lease(connection_id)
+    if not spool.paged:
+        stdout, stderr = spool.text()
+        return stdout, stderr, spool.exit_status, False
+    (stdout, stderr), result = spool.summary(output_spools.page_size)
+    output_spools.delete(result['result_id'])
+    return stdout, stderr, spool.exit_status, True
+
+# Commands re-run at an interval, shared by all their subscribers
+watches = WatchManager(run_watched_command,
+                       min_interval=float(os.getenv('MCP_WATCH_MIN_INTERVAL', 1)),
+                       max_interval=float(os.getenv('MCP_WATCH_MAX_INTERVAL', 86400)))
+
+def invalid_profile_response(profile):
+    """Build the error response for an unknown tuning profile."""
+    return jsonify({
+        "status": "error",
+        "message": f"Invalid profile: {profile}. Expected one of {', '.join(PROFILES)}"
+    }), 400
+
+def invalid_output_mode_response(mode):
+    """Build the error response for an unknown output mode."""
+    return jsonify({
+        "status": "error",
+        "message": f"Invalid output mode: {mode}. Expected one of {', '.join(OUTPUT_MODES)}"
+    }), 400
+
+def read_output_response(data):
+    """
+    Build the response for a paged read of spooled command output.
+    
+    Args:
+        data (dict): Request parameters: result_id, and optionally stream,
+            offset, length, start_line, line_count and format ('text' or 'raw')
+            
+    Returns:
+        flask.Response: The page as JSON, or raw bytes for format 'raw'
+    """
+    result_id = data.get('result_id')
+    if not result_id:
+        return jsonify({
+            "status": "error",
+            "message": "Result ID is required"
+        }), 400
+    
+    args = {
+        'stream': data.get('stream', 'stdout'),
+        'offset': data.get('offset', 0),
+        'length': data.get('length'),
+        'start_line': data.get('start_line'),
+        'line_count': data.get('line_count')
+    }
+    
+    try:
+        if data.get('format') == 'raw':
+            return Response(output_spools.read_bytes(result_id, **args),
+                            mimetype='application/octet-stream')
+        page = output_spools.read(result_id, **args)
+        return jsonify({"status": "ok", **page})
+    
+    except SpoolNotFound as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 404
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+def connect_saved_connection(connection):
+    """
+    Connect to a saved connection unless it is already connected.
+    
+    Args:
+        connection (dict): Saved connection details
+        
+    Returns:
+        str: The connection ID
+    """
+    hostname = connection.get('hostname')
+    port = int(connection.get('port') or 22)
+    username = connection.get('username')
+    connection_id = f"{username}@{hostname}:{port}"
+    
+    if connection_id in ssh_connections and ssh_connections[connection_id].is_connected():
+        return connection_id
+    
+    client = new_client()
+    client.connect(hostname, port, username, connection.get('password', ''),
+                   connection.get('key_path', ''), **connect_options(connection))
+    ssh_connections[connection_id] = client
+    logger.info(f"Pre-warmed connection to {connection_id}")
+    return connection_id
+
+# Keep saved connections marked `prewarm` connected in the background
+prewarmer = ConnectionPrewarmer(
+    config,
+    connect_saved_connection,
+    max_workers=int(os.getenv('MCP_PREWARM_CONCURRENCY', 8)),
+    interval=int(os.getenv('MCP_PREWARM_INTERVAL', 300))
+)
+
+_initialized = False
+
+def init(connect=True):
+    """
+    Start the background work of the server and its startup connections.
+    
+    Importing this module only builds the objects above, so the handlers
+    can be reused without side effects; each entry point calls this once
+    before serving.
+    
+    Args:
+        connect (bool): Also restore saved sessions, auto-connect the MCP
+            config host and pre-warm saved connections
+    """
+    global _initialized
+    if _initialized:
+        return
+    _initialized = True
+    
+    logger.info(f"Loaded MCP settings: {json.dumps(redact_settings(mcp_settings), indent=2)}")
+    
+    if not brokers:
+        ssh_connections.start_reaper(int(os.getenv('MCP_REAP_INTERVAL', 30)))
+        output_spools.start_reaper()
+    
+    if parse_bool(os.getenv('MCP_AUDIT', 'true')):
+        audit_log.start()
+    
+    # Trace allocations from startup with this many stack frames, so leaks can
+    # be found with /mcp/diagnostics/tracemalloc without restarting
+    if int(os.getenv('MCP_TRACEMALLOC', 0)):
+        tracemalloc_tracker.start(int(os.getenv('MCP_TRACEMALLOC')))
+    
+    if not connect:
+        return
+    
+    # Sessions are saved to a state file and reconnected in the background
+    # after a restart, keeping their connection IDs
+    if not brokers and parse_bool(os.getenv('MCP_RESTORE', 'true')):
+        ssh_connections.attach_store(SessionStore(
+            os.path.join(os.getenv('MCP_STATE_DIR') or config.config_dir, 'sessions.json')))
+        ssh_connections.restore(
+            SSHClient,
+            concurrency=int(os.getenv('MCP_RESTORE_CONCURRENCY', 8)),
+            wait=float(os.getenv('MCP_RESTORE_WAIT', 10))
+        )
+    
+    auto_connection_id = auto_connect()
+    if auto_connection_id:
+        logger.info(f"Auto-connected to {auto_connection_id} at startup")
+    
+    if parse_bool(os.getenv('MCP_PREWARM', '')):
+        prewarmer.start()
 
 @app.route('/')
 def index():
@@ -127,7 +727,8 @@ def index():
                           default_host=default_host,
                           default_port=default_port,
                           default_username=default_username,
-                          default_key_path=default_key_path)
+                          default_key_path=default_key_path,
+                          profiles=PROFILES)
 
 @app.route('/connect', methods=['POST'])
 def connect():
@@ -145,8 +746,8 @@ def connect():
         logger.info(f"Web interface: Connecting to {connection_id}")
         
         # Create SSH client and connect
-        client = SSHClient()
-        client.connect(hostname, port, username, password, key_path)
+        client = new_client()
+        client.connect(hostname, port, username, password, key_path, **connect_options(request.form))
         
         # Store connection
         ssh_connections[connection_id] = client
@@ -154,12 +755,19 @@ def connect():
         
         # Save to config if 'save' is checked
         if request.form.get('save'):
-            config.add_connection({
+            saved = {
                 'hostname': hostname,
                 'port': port,
                 'username': username,
                 'key_path': key_path
-            })
+            }
+            if request.form.get('jump_hosts'):
+                saved['jump_hosts'] = connect_options(request.form)['jump_hosts']
+            if request.form.get('profile'):
+                saved['profile'] = request.form.get('profile')
+            if request.form.get('prewarm'):
+                saved['prewarm'] = True
+            config.add_connection(saved)
         
         session['current_connection'] = connection_id
         return redirect(url_for('terminal', connection_id=connection_id))
@@ -172,7 +780,10 @@ def connect():
                               default_host=hostname,
                               default_port=port,
                               default_username=username,
-                              default_key_path=key_path)
+                              default_key_path=key_path,
+                              default_jump_hosts=request.form.get('jump_hosts', ''),
+                              default_profile=request.form.get('profile', ''),
+                              profiles=PROFILES)
 
 @app.route('/terminal/<connection_id>')
 def terminal(connection_id):
@@ -180,7 +791,9 @@ def terminal(connection_id):
     if connection_id not in ssh_connections:
         return redirect(url_for('index'))
     
-    return render_template('terminal.html', connection_id=connection_id)
+    return render_template('terminal.html',
+                          connection_id=connection_id,
+                          scrollback_lines=int(os.getenv('TERMINAL_SCROLLBACK_LINES', 5000)))
 
 @app.route('/execute', methods=['POST'])
 def execute_command():
@@ -191,15 +804,25 @@ def execute_command():
     if not connection_id or not command or connection_id not in ssh_connections:
         return jsonify({"error": "Invalid request or connection lost"}), 400
     
+    started = time.monotonic()
     try:
-        client = ssh_connections[connection_id]
-        stdout, stderr = client.execute_command(command)
+        client = leased_session(connection_id)
+        with scheduler.slot(client_key(), connection_id, request_source()):
+            started = time.monotonic()
+            remote_filesystems.invalidate(connection_id)
+            stdout, stderr = client.execute_command(command)
+        audit_command(client_key(), connection_id, command, 'text', started,
+                      sizes={'stdout': len(stdout.encode('utf-8')), 'stderr': len(stderr.encode('utf-8'))})
         return jsonify({
             "stdout": stdout,
             "stderr": stderr
         })
+    except Overloaded as e:
+        audit_command(client_key(), connection_id, command, 'text', started, error=str(e))
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Command execution error: {str(e)}")
+        audit_command(client_key(), connection_id, command, 'text', started, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route('/disconnect/<connection_id>')
@@ -207,8 +830,7 @@ def disconnect(connection_id):
     """Disconnect from a remote server."""
     if connection_id in ssh_connections:
         try:
-            ssh_connections[connection_id].close()
-            del ssh_connections[connection_id]
+            ssh_connections.pop(connection_id).close()
             if session.get('current_connection') == connection_id:
                 session.pop('current_connection', None)
         except Exception as e:
@@ -259,8 +881,7 @@ def disconnect_endpoint():
         return jsonify({"status": "error", "message": "Invalid connection ID"}), 400
     
     try:
-        ssh_connections[connection_id].close()
-        del ssh_connections[connection_id]
+        ssh_connections.pop(connection_id).close()
         logger.info(f"Disconnected from {connection_id}")
         return jsonify({"status": "ok"})
     except Exception as e:
@@ -281,15 +902,25 @@ def execute_endpoint():
     if not command:
         return jsonify({"status": "error", "message": "No command provided"}), 400
     
+    started = time.monotonic()
     try:
-        client = ssh_connections[connection_id]
-        output = client.execute_command(command)
+        client = leased_session(connection_id)
+        with scheduler.slot(client_key(), connection_id, request_source()):
+            started = time.monotonic()
+            remote_filesystems.invalidate(connection_id)
+            output = client.execute_command(command)
+        audit_command(client_key(), connection_id, command, 'text', started,
+                      sizes={'stdout': len(output[0].encode('utf-8')), 'stderr': len(output[1].encode('utf-8'))})
         return jsonify({
             "status": "ok",
             "output": output
         })
+    except Overloaded as e:
+        audit_command(client_key(), connection_id, command, 'text', started, error=str(e))
+        return overloaded_response(e)
     except Exception as e:
         logger.error(f"Error executing command on {connection_id}: {str(e)}")
+        audit_command(client_key(), connection_id, command, 'text', started, error=str(e))
         return jsonify({"status": "error", "message": str(e)}), 500
 
 # MCP Protocol Endpoints - Updated to match Windsurf's expectations
@@ -329,23 +960,17 @@ def list_sessions():
 
 @app.route('/ssh', methods=['POST'])
 def ssh_command():
-    """MCP protocol endpoint for SSH operations."""
+    """
+    MCP protocol endpoint for SSH operations.
+    
+    The body is either one operation, or an array of operations that is run
+    as a batch (see run_batch).
+    """
     try:
         data = request.json
-        operation = data.get('operation')
-        
-        # Handle different operations
-        if operation == 'connect':
-            return handle_ssh_connect(data)
-        elif operation == 'execute':
-            return handle_ssh_execute(data)
-        elif operation == 'disconnect':
-            return handle_ssh_disconnect(data)
-        else:
-            return jsonify({
-                "status": "error", 
-                "message": f"Unknown operation: {operation}"
-            }), 400
+        if isinstance(data, list):
+            return run_batch(data)
+        return dispatch_operation(data)
     
     except Exception as e:
         logger.error(f"Error in SSH command: {str(e)}")
@@ -354,6 +979,182 @@ def ssh_command():
             "message": str(e)
         }), 500
 
+def dispatch_operation(data):
+    """Run one /ssh operation and return its response."""
+    operation = data.get('operation')
+    
+    # Handle different operations
+    if operation == 'connect':
+        return handle_ssh_connect(data)
+    elif operation == 'execute':
+        return handle_ssh_execute(data)
+    elif operation == 'disconnect':
+        return handle_ssh_disconnect(data)
+    elif operation == 'read_output':
+        return read_output_response(data)
+    elif operation == 'forward_open':
+        return handle_forward_open(data)
+    elif operation == 'forward_close':
+        return handle_forward_close(data)
+    elif operation == 'forward_list':
+        return handle_forward_list(data)
+    elif operation in FS_OPERATIONS:
+        return handle_fs_operation(operation, data)
+    elif operation == 'search':
+        return handle_ssh_search(data)
+    elif operation == 'watch':
+        return handle_ssh_watch(data)
+    else:
+        return jsonify({
+            "status": "error", 
+            "message": f"Unknown operation: {operation}"
+        }), 400
+
+# Limits for batched /ssh requests
+MAX_BATCH_SIZE = int(os.getenv('MCP_MAX_BATCH', 50))
+BATCH_CONCURRENCY = int(os.getenv('MCP_BATCH_CONCURRENCY', 8))
+
+class BatchReferenceError(Exception):
+    """Raised when a $ref can't be resolved against an earlier result."""
+
+def batch_references(value):
+    """Yield the operation ids referenced by $ref objects anywhere in value."""
+    if isinstance(value, dict):
+        if set(value) == {'$ref'} and isinstance(value['$ref'], str):
+            yield value['$ref'].split('.', 1)[0]
+        else:
+            for item in value.values():
+                yield from batch_references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from batch_references(item)
+
+def resolve_references(value, results):
+    """
+    Replace $ref objects with values from earlier results.
+    
+    A reference is {"$ref": "<id>.<path>"}, where the path is a dotted list
+    of keys and list indices into that operation's result, for example
+    {"$ref": "c1.connection_id"} or {"$ref": "e1.output.0"}.
+    """
+    if isinstance(value, dict):
+        if set(value) == {'$ref'} and isinstance(value['$ref'], str):
+            op_id, _, path = value['$ref'].partition('.')
+            current = results[op_id]
+            for key in path.split('.') if path else []:
+                try:
+                    current = current[int(key)] if isinstance(current, list) else current[key]
+                except (KeyError, IndexError, ValueError, TypeError):
+                    raise BatchReferenceError(f"Cannot resolve $ref {value['$ref']}")
+            return current
+        return {key: resolve_references(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(item, results) for item in value]
+    return value
+
+def batch_streaming_reason(data):
+    """Explain why an operation can't be batched, or return None if it can."""
+    operation = data.get('operation')
+    if operation == 'execute' and data.get('mode', 'text') != 'text':
+        return f"Output mode {data.get('mode')} streams its response"
+    if operation in ('search', 'watch'):
+        return f"{operation.capitalize()} streams its response"
+    if operation == 'read_output' and data.get('format') == 'raw':
+        return "Raw output reads stream their response"
+    return None
+
+def run_batch(operations):
+    """
+    Run a batch of /ssh operations.
+    
+    Each operation carries an `id`. Operations run concurrently, except
+    that an operation containing {"$ref": "<id>.<path>"} values, or listing
+    ids in `after`, waits for those earlier operations and is skipped if one
+    of them failed. References may only point at operations earlier in the
+    array. Operations that stream their response can't be batched.
+    
+    Args:
+        operations (list): The operations
+        
+    Returns:
+        flask.Response: Array of results in request order, each with the
+            operation's id and HTTP status_code added
+    """
+    if not operations:
+        return jsonify([])
+    if len(operations) > MAX_BATCH_SIZE:
+        return jsonify({
+            "status": "error",
+            "message": f"Batch of {len(operations)} operations exceeds the limit of {MAX_BATCH_SIZE}"
+        }), 400
+    
+    seen = set()
+    dependencies = []
+    for index, data in enumerate(operations):
+        if not isinstance(data, dict) or data.get('id') in (None, ''):
+            return jsonify({
+                "status": "error",
+                "message": f"Operation {index} must be an object with an id"
+            }), 400
+        op_id = str(data['id'])
+        if op_id in seen:
+            return jsonify({
+                "status": "error",
+                "message": f"Duplicate operation id: {op_id}"
+            }), 400
+        after = data.get('after') or []
+        depends = set(batch_references(data)) | {str(dep) for dep in (after if isinstance(after, list) else [after])}
+        unknown = depends - seen
+        if unknown:
+            return jsonify({
+                "status": "error",
+                "message": f"Operation {op_id} depends on {', '.join(sorted(unknown))}, "
+                           f"which must be earlier in the batch"
+            }), 400
+        reason = batch_streaming_reason(data)
+        if reason:
+            return jsonify({
+                "status": "error",
+                "message": f"Operation {op_id} can't be batched: {reason}"
+            }), 400
+        seen.add(op_id)
+        dependencies.append(depends)
+    
+    results = {}
+    futures = {}
+    
+    def run(data, depends):
+        op_id = str(data['id'])
+        # Dependencies are earlier in the batch, so they were submitted
+        # first and are already running or done
+        for dep in depends:
+            futures[dep].result()
+        failed = [dep for dep in depends if results[dep]['status_code'] >= 400]
+        if failed:
+            result = {"status": "error",
+                      "message": f"Skipped: operation {', '.join(sorted(failed))} failed",
+                      "status_code": 424}
+        else:
+            try:
+                params = resolve_references(
+                    {key: value for key, value in data.items() if key not in ('id', 'after')}, results)
+                response = app.make_response(dispatch_operation(params))
+                result = {**(response.get_json() or {}), "status_code": response.status_code}
+            except BatchReferenceError as e:
+                result = {"status": "error", "message": str(e), "status_code": 400}
+            except Exception as e:
+                logger.error(f"Batch operation {op_id} failed: {str(e)}")
+                result = {"status": "error", "message": str(e), "status_code": 500}
+        results[op_id] = {"id": data['id'], **result}
+    
+    with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(operations)),
+                            thread_name_prefix='ssh-batch') as executor:
+        for data, depends in zip(operations, dependencies):
+            # Each operation gets its own copy of the request context
+            futures[str(data['id'])] = executor.submit(copy_current_request_context(run), data, depends)
+    
+    return jsonify([results[str(data['id'])] for data in operations])
+
 def handle_ssh_connect(data):
     """Handle SSH connect operation."""
     hostname = data.get('hostname')
@@ -368,6 +1169,9 @@ def handle_ssh_connect(data):
             "message": "Hostname and username are required"
         }), 400
     
+    if data.get('profile') and data.get('profile') not in PROFILES:
+        return invalid_profile_response(data.get('profile'))
+    
     connection_id = f"{username}@{hostname}:{port}"
     
     # Check if already connected
@@ -380,15 +1184,16 @@ def handle_ssh_connect(data):
     
     try:
         logger.info(f"MCP API: Connecting to {connection_id}")
-        client = SSHClient()
-        client.connect(hostname, port, username, password, key_path)
+        client = new_client()
+        client.connect(hostname, port, username, password, key_path, **connect_options(data))
         ssh_connections[connection_id] = client
         logger.info(f"MCP API: Successfully connected to {connection_id}")
         
         return jsonify({
             "status": "ok",
             "message": f"Connected to {connection_id}",
-            "connection_id": connection_id
+            "connection_id": connection_id,
+            "transport": client.transport_info()
         })
     
     except Exception as e:
@@ -402,6 +1207,7 @@ def handle_ssh_execute(data):
     """Handle SSH execute operation."""
     connection_id = data.get('connection_id')
     command = data.get('command')
+    mode = data.get('mode', 'text')
     
     if not connection_id:
         return jsonify({
@@ -421,7 +1227,7 @@ def handle_ssh_execute(data):
             "message": f"Connection {connection_id} not found"
         }), 404
     
-    client = ssh_connections[connection_id]
+    client = leased_session(connection_id)
     
     if not client.is_connected():
         return jsonify({
@@ -429,13 +1235,12 @@ def handle_ssh_execute(data):
             "message": f"Connection {connection_id} is not active"
         }), 400
     
+    if mode not in OUTPUT_MODES:
+        return invalid_output_mode_response(mode)
+    
     try:
         logger.info(f"MCP API: Executing command on {connection_id}: {command}")
-        output = client.execute_command(command)
-        return jsonify({
-            "status": "ok",
-            "output": output
-        })
+        return command_output_response(client, connection_id, command, mode)
     
     except Exception as e:
         logger.error(f"MCP API: Command execution error on {connection_id}: {str(e)}")
@@ -462,8 +1267,7 @@ def handle_ssh_disconnect(data):
     
     try:
         logger.info(f"MCP API: Disconnecting from {connection_id}")
-        ssh_connections[connection_id].close()
-        del ssh_connections[connection_id]
+        ssh_connections.pop(connection_id).close()
         
         return jsonify({
             "status": "ok",
@@ -477,6 +1281,470 @@ def handle_ssh_disconnect(data):
             "message": f"Failed to disconnect: {str(e)}"
         }), 500
 
+def handle_forward_open(data):
+    """
+    Handle port forward open operation.
+    
+    Local forwards (direction 'local') listen on bind_host:bind_port here and
+    connect to remote_host:remote_port from the SSH server. Remote forwards
+    (direction 'remote') listen on bind_host:bind_port on the SSH server and
+    connect to local_host:local_port from here.
+    """
+    connection_id = data.get('connection_id')
+    direction = data.get('direction', 'local')
+    
+    if brokers:
+        # Forwards relay data through the transport, which lives in a broker
+        return jsonify({
+            "status": "error",
+            "message": "Port forwarding is not available in multi-process mode"
+        }), 501
+    
+    if not connection_id:
+        return jsonify({
+            "status": "error", 
+            "message": "Connection ID is required"
+        }), 400
+    
+    if direction not in ('local', 'remote'):
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid direction: {direction}. Expected local or remote"
+        }), 400
+    
+    target_host = data.get('remote_host' if direction == 'local' else 'local_host', '127.0.0.1')
+    target_port = data.get('remote_port' if direction == 'local' else 'local_port')
+    if not target_port:
+        return jsonify({
+            "status": "error",
+            "message": f"{'remote_port' if direction == 'local' else 'local_port'} is required"
+        }), 400
+    
+    if connection_id not in ssh_connections:
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} not found"
+        }), 404
+    
+    client = leased_session(connection_id)
+    
+    if not client.is_connected():
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} is not active"
+        }), 400
+    
+    try:
+        bind_host = data.get('bind_host', '127.0.0.1')
+        bind_port = int(data.get('bind_port', 0))
+        if direction == 'local':
+            forward = port_forwards.open_local(connection_id, client, target_host, int(target_port),
+                                               bind_host, bind_port)
+        else:
+            forward = port_forwards.open_remote(connection_id, client, target_host, int(target_port),
+                                                bind_host, bind_port)
+        
+        return jsonify({
+            "status": "ok",
+            "message": f"Opened {direction} forward {forward.bind[0]}:{forward.bind[1]} -> "
+                       f"{forward.target[0]}:{forward.target[1]}",
+            "forward": forward.stats()
+        })
+    
+    except Exception as e:
+        logger.error(f"MCP API: Port forward error on {connection_id}: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "message": f"Failed to open forward: {str(e)}"
+        }), 500
+
+def handle_forward_close(data):
+    """Handle port forward close operation."""
+    forward_id = data.get('forward_id')
+    
+    if not forward_id:
+        return jsonify({
+            "status": "error", 
+            "message": "Forward ID is required"
+        }), 400
+    
+    try:
+        port_forwards.close(forward_id)
+        return jsonify({
+            "status": "ok",
+            "message": f"Closed forward {forward_id}"
+        })
+    except ForwardNotFound as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 404
+
+def handle_forward_list(data):
+    """Handle port forward list operation, optionally for one connection."""
+    return jsonify({
+        "status": "ok",
+        "forwards": port_forwards.list(data.get('connection_id'))
+    })
+
+# Upper bound on max_results for one page of search results
+MAX_SEARCH_RESULTS = 10000
+
+def handle_ssh_search(data):
+    """
+    Handle remote search operation.
+    
+    Runs ripgrep on the remote host, or grep if ripgrep isn't installed,
+    and streams the matches as newline-delimited JSON: one record per file
+    with its matches, then a summary. Once max_results matches have been
+    sent the remote search is stopped, and the summary carries a cursor
+    that continues from the last match.
+    """
+    connection_id = data.get('connection_id')
+    pattern = data.get('pattern')
+    
+    if not connection_id:
+        return jsonify({
+            "status": "error", 
+            "message": "Connection ID is required"
+        }), 400
+    
+    if not pattern:
+        return jsonify({
+            "status": "error", 
+            "message": "Pattern is required"
+        }), 400
+    
+    search = {
+        'pattern': pattern,
+        'path': data.get('path') or '.',
+        'ignore_case': parse_bool(data.get('ignore_case', False)),
+        'fixed_strings': parse_bool(data.get('fixed_strings', False)),
+        'glob': data.get('glob') or None
+    }
+    
+    try:
+        max_results = min(int(data.get('max_results', 1000)), MAX_SEARCH_RESULTS)
+        command = search_command(tool=data.get('tool', 'auto'), **search)
+        cursor = data.get('cursor')
+        if cursor:
+            decode_cursor(cursor, search_key(**search))
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    
+    if connection_id not in ssh_connections:
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} not found"
+        }), 404
+    
+    client = leased_session(connection_id)
+    
+    if not client.is_connected():
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} is not active"
+        }), 400
+    
+    client_id = client_key()
+    started = time.monotonic()
+    try:
+        ticket = scheduler.admit(client_id, connection_id, request_source())
+    except Overloaded as e:
+        audit_command(client_id, connection_id, command, 'search', started, error=str(e))
+        return overloaded_response(e)
+    started = time.monotonic()
+    
+    try:
+        logger.info(f"MCP API: Searching {search['path']} on {connection_id} for {pattern!r}")
+        channel = client.open_command(command)
+    except Exception as e:
+        scheduler.release(ticket)
+        audit_command(client_id, connection_id, command, 'search', started, error=str(e))
+        return jsonify({
+            "status": "error",
+            "message": f"Search failed: {str(e)}"
+        }), 500
+    
+    outcome = {'exit_status': None, 'error': None}
+    
+    def generate():
+        try:
+            for record in iter_search_results(client.iter_channel_output(channel),
+                                              max_results=max_results, cursor=cursor, **search):
+                if record['type'] == 'summary':
+                    outcome['exit_status'] = record['exit_status']
+                yield json.dumps(record) + '\n'
+        except Exception as e:
+            logger.error(f"Search error on {connection_id}: {str(e)}")
+            outcome['error'] = str(e)
+            yield json.dumps({"type": "error", "message": str(e)}) + '\n'
+    
+    def finish():
+        scheduler.release(ticket)
+        audit_command(client_id, connection_id, command, 'search', started, **outcome)
+    
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.call_on_close(finish)
+    return response
+
+def handle_ssh_watch(data):
+    """
+    Handle watch operation.
+    
+    Re-runs a command every `interval` seconds and streams newline-delimited
+    JSON events: a snapshot of the current output, then for each run a diff
+    against the previous one, or "unchanged". Subscribers of the same
+    command, connection and interval share one watch. The stream ends after
+    max_events events or duration seconds if given, or when the client
+    goes away.
+    """
+    connection_id = data.get('connection_id')
+    command = data.get('command')
+    
+    if not connection_id or not command:
+        return jsonify({
+            "status": "error", 
+            "message": "Connection ID and command are required"
+        }), 400
+    
+    if connection_id not in ssh_connections:
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} not found"
+        }), 404
+    
+    if not ssh_connections[connection_id].is_connected():
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} is not active"
+        }), 400
+    
+    try:
+        interval = float(data.get('interval', 5))
+        max_events = int(data['max_events']) if data.get('max_events') is not None else None
+        duration = float(data['duration']) if data.get('duration') is not None else None
+        if duration is not None and not math.isfinite(duration):
+            raise ValueError("Duration must be a finite number of seconds")
+        # Watches are scheduled apart from the client's own commands, and
+        # rate limited by the address that started them
+        subscription = watches.subscribe(connection_id, command, interval,
+                                         f"watch:{client_key()}", request_source())
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+    
+    def generate():
+        for event in subscription.events(max_events, duration):
+            yield json.dumps(event) + '\n'
+    
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.call_on_close(subscription.close)
+    return response
+
+FS_OPERATIONS = ('fs_list', 'fs_stat', 'fs_walk', 'fs_write', 'fs_mkdir', 'fs_remove', 'fs_rename')
+
+def handle_fs_operation(operation, data):
+    """
+    Handle remote filesystem operations over SFTP.
+    
+    Listings and stat results are cached per connection for
+    MCP_FS_CACHE_TTL seconds. Writes through these operations, and any
+    command executed on the connection, invalidate the cache.
+    """
+    connection_id = data.get('connection_id')
+    path = data.get('path')
+    
+    if brokers:
+        # SFTP channels live on the transport, which lives in a broker
+        return jsonify({
+            "status": "error",
+            "message": "Filesystem operations are not available in multi-process mode"
+        }), 501
+    
+    if not connection_id:
+        return jsonify({
+            "status": "error", 
+            "message": "Connection ID is required"
+        }), 400
+    
+    if not path:
+        return jsonify({
+            "status": "error", 
+            "message": "Path is required"
+        }), 400
+    
+    if connection_id not in ssh_connections:
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} not found"
+        }), 404
+    
+    client = leased_session(connection_id)
+    
+    if not client.is_connected():
+        return jsonify({
+            "status": "error", 
+            "message": f"Connection {connection_id} is not active"
+        }), 400
+    
+    fs = remote_filesystems.get(connection_id, client)
+    
+    try:
+        if operation == 'fs_list':
+            return jsonify({"status": "ok", "path": path, "entries": fs.listdir(path)})
+        if operation == 'fs_stat':
+            return jsonify({"status": "ok", "entry": fs.stat(path)})
+        if operation == 'fs_walk':
+            max_depth = data.get('max_depth')
+            result = fs.walk(path, int(max_depth) if max_depth is not None else None,
+                             int(data.get('max_entries', 10000)))
+            return jsonify({"status": "ok", **result})
+        
+        if operation == 'fs_write':
+            content = data.get('content', '')
+            if data.get('encoding') == 'base64':
+                content = base64.b64decode(content)
+            else:
+                content = content.encode('utf-8')
+            fs.write_file(path, content)
+            message = f"Wrote {len(content)} bytes to {path}"
+        elif operation == 'fs_mkdir':
+            fs.mkdir(path)
+            message = f"Created {path}"
+        elif operation == 'fs_remove':
+            fs.remove(path)
+            message = f"Removed {path}"
+        else:
+            target = data.get('target')
+            if not target:
+                return jsonify({
+                    "status": "error",
+                    "message": "Target is required"
+                }), 400
+            fs.rename(path, target)
+            message = f"Renamed {path} to {target}"
+        
+        logger.info(f"MCP API: {message} on {connection_id}")
+        return jsonify({"status": "ok", "message": message})
+    
+    except FileNotFoundError:
+        return jsonify({"status": "error", "message": f"No such file: {path}"}), 404
+    except PermissionError:
+        return jsonify({"status": "error", "message": f"Permission denied: {path}"}), 403
+    except (IOError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e) or f"Failed on {path}"}), 400
+
+@app.route('/mcp/watches', methods=['GET'])
+def mcp_watches():
+    """MCP protocol endpoint to list active watches and their subscribers."""
+    return jsonify({
+        "status": "ok",
+        "watches": watches.stats()
+    })
+
+@app.route('/mcp/fs/stats', methods=['GET'])
+def mcp_fs_stats():
+    """MCP protocol endpoint to get per-connection filesystem cache statistics."""
+    return jsonify({
+        "status": "ok",
+        "connections": remote_filesystems.stats()
+    })
+
+@app.route('/mcp/diagnostics', methods=['GET'])
+def mcp_diagnostics():
+    """MCP protocol endpoint to report per-session and server-wide resource usage."""
+    filesystems = remote_filesystems.stats()
+    watched = {}
+    for watch in watches.stats():
+        watched[watch['connection_id']] = watched.get(watch['connection_id'], 0) + 1
+
+    if brokers:
+        # Sessions and spools live in the brokers; this worker only reports itself
+        reports = brokers.diagnostics()
+        sessions = {connection_id: resources
+                    for report in reports for connection_id, resources in report['sessions'].items()}
+        spools = None
+        broker_reports = [{key: report[key] for key in ('process', 'spools', 'tracemalloc')}
+                          for report in reports]
+    else:
+        sessions = {connection_id: client.resources() for connection_id, client in ssh_connections.items()}
+        spools = output_spools.stats()
+        broker_reports = None
+
+    session_list = []
+    for connection_id, resources in sessions.items():
+        session_list.append({
+            "id": connection_id,
+            **resources,
+            "filesystem": filesystems.get(connection_id),
+            "watches": watched.get(connection_id, 0)
+        })
+    session_list.sort(key=lambda session: session['buffered_bytes'], reverse=True)
+
+    result = {
+        "status": "ok",
+        "process": process_stats(),
+        "sessions": session_list,
+        "totals": {
+            "sessions": len(session_list),
+            "channels": sum(len(session['channels']) for session in session_list),
+            "buffered_bytes": sum(session['buffered_bytes'] for session in session_list),
+            "bytes_received": sum(session['bytes_received'] for session in session_list),
+            "bytes_sent": sum(session['bytes_sent'] for session in session_list)
+        },
+        "tracemalloc": tracemalloc_tracker.status()
+    }
+    if spools is not None:
+        result["spools"] = spools
+    if broker_reports is not None:
+        result["brokers"] = broker_reports
+    return jsonify(result)
+
+@app.route('/mcp/diagnostics/tracemalloc', methods=['POST'])
+def mcp_tracemalloc():
+    """MCP protocol endpoint to start or stop tracemalloc and compare snapshots."""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action', 'snapshot')
+    if action not in ('status', 'start', 'snapshot', 'stop'):
+        return jsonify({
+            "status": "error",
+            "message": f"Invalid action: {action}. Expected status, start, snapshot or stop"
+        }), 400
+
+    params = {}
+    try:
+        if action == 'start':
+            params['frames'] = max(1, int(data.get('frames', 1)))
+        elif action == 'snapshot':
+            params['limit'] = min(max(1, int(data.get('limit', 20))), 500)
+            params['group_by'] = data.get('group_by', 'lineno')
+            params['reset'] = parse_bool(data.get('reset', True))
+            if params['group_by'] not in TRACEMALLOC_GROUPINGS:
+                raise ValueError(f"Invalid group_by: {params['group_by']}. "
+                                 f"Expected one of {', '.join(TRACEMALLOC_GROUPINGS)}")
+
+        # In multi-process mode a broker's memory can be traced instead of this worker's
+        if brokers and data.get('broker') is not None:
+            result = brokers.tracemalloc(int(data.get('broker')), action, **params)
+        else:
+            result = getattr(tracemalloc_tracker, action)(**params)
+    except ValueError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    return jsonify({
+        "status": "ok",
+        **result
+    })
+
 # Additional MCP v1 Protocol Endpoints for Windsurf compatibility
 
 @app.route('/ssh/sessions', methods=['GET'])
@@ -540,6 +1808,9 @@ def mcp_connect():
                 "message": "Hostname and username are required"
             }), 400
         
+        if data.get('profile') and data.get('profile') not in PROFILES:
+            return invalid_profile_response(data.get('profile'))
+        
         connection_id = f"{username}@{hostname}:{port}"
         
         logger.info(f"MCP: Connecting to {connection_id}")
@@ -552,8 +1823,8 @@ def mcp_connect():
                 "connection_id": connection_id
             })
         
-        client = SSHClient()
-        client.connect(hostname, port, username, password, key_path)
+        client = new_client()
+        client.connect(hostname, port, username, password, key_path, **connect_options(data))
         ssh_connections[connection_id] = client
         
         logger.info(f"MCP: Successfully connected to {connection_id}")
@@ -561,7 +1832,8 @@ def mcp_connect():
         return jsonify({
             "status": "ok",
             "message": f"Connected to {connection_id}",
-            "connection_id": connection_id
+            "connection_id": connection_id,
+            "transport": client.transport_info()
         })
     
     except Exception as e:
@@ -578,6 +1850,7 @@ def mcp_execute():
         data = request.json
         connection_id = data.get('connection_id')
         command = data.get('command')
+        mode = data.get('mode', 'text')
         
         if not connection_id:
             return jsonify({
@@ -597,7 +1870,7 @@ def mcp_execute():
                 "message": f"Connection {connection_id} not found"
             }), 404
         
-        client = ssh_connections[connection_id]
+        client = leased_session(connection_id)
         
         if not client.is_connected():
             return jsonify({
@@ -605,12 +1878,11 @@ def mcp_execute():
                 "message": f"Connection {connection_id} is not active"
             }), 400
         
+        if mode not in OUTPUT_MODES:
+            return invalid_output_mode_response(mode)
+        
         logger.info(f"MCP: Executing command on {connection_id}: {command}")
-        output = client.execute_command(command)
-        return jsonify({
-            "status": "ok",
-            "output": output
-        })
+        return command_output_response(client, connection_id, command, mode)
     
     except Exception as e:
         logger.error(f"MCP Execute error: {str(e)}")
@@ -639,8 +1911,7 @@ def mcp_disconnect():
             })
         
         logger.info(f"MCP: Disconnecting from {connection_id}")
-        ssh_connections[connection_id].close()
-        del ssh_connections[connection_id]
+        ssh_connections.pop(connection_id).close()
         
         return jsonify({
             "status": "ok",
@@ -654,6 +1925,66 @@ def mcp_disconnect():
             "message": f"Failed to disconnect: {str(e)}"
         }), 500
 
+@app.route('/mcp/sessions/stats', methods=['GET'])
+def mcp_session_stats():
+    """MCP protocol endpoint to report session registry limits and counters."""
+    stats = ssh_connections.stats()
+    if not brokers:
+        # Brokers report the jump host sessions they hold themselves
+        stats['jump_hosts'] = bastion_pool.stats()
+    return jsonify({
+        "status": "ok",
+        **stats
+    })
+
+@app.route('/mcp/prewarm', methods=['GET'])
+def mcp_prewarm_status():
+    """MCP protocol endpoint to report the state of connection pre-warming."""
+    return jsonify({
+        "status": "ok",
+        "enabled": prewarmer.running,
+        **prewarmer.status()
+    })
+
+@app.route('/mcp/scheduler/stats', methods=['GET'])
+def mcp_scheduler_stats():
+    """MCP protocol endpoint to report command queue depths and wait times."""
+    return jsonify({
+        "status": "ok",
+        **scheduler.stats()
+    })
+
+@app.route('/mcp/audit', methods=['GET'])
+def mcp_audit():
+    """MCP protocol endpoint to query recent executed commands."""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "limit must be an integer"
+        }), 400
+    
+    records = audit_log.query(
+        limit=limit,
+        client=request.args.get('client'),
+        connection_id=request.args.get('connection_id'),
+        since=request.args.get('since')
+    )
+    return jsonify({
+        "status": "ok",
+        "records": records,
+        "stats": audit_log.stats()
+    })
+
+@app.route('/mcp/profiles', methods=['GET'])
+def mcp_profiles():
+    """MCP protocol endpoint to list transport tuning profiles."""
+    return jsonify({
+        "status": "ok",
+        "profiles": describe_profiles()
+    })
+
 @app.route('/capabilities', methods=['GET'])
 def capabilities():
     """MCP protocol endpoint to describe server capabilities."""
@@ -662,11 +1993,18 @@ def capabilities():
         "capabilities": {
             "type": "ssh",
             "version": "1.0.0",
-            "operations": ["connect", "execute", "disconnect"],
+            "operations": ["connect", "execute", "disconnect", "read_output",
+                       "forward_open", "forward_close", "forward_list", *FS_OPERATIONS, "search", "watch"],
             "features": {
                 "auto_connect": True,
                 "key_auth": True,
-                "password_auth": True
+                "password_auth": True,
+                "agent_auth": True,
+                "key_types": ["rsa", "ecdsa", "ed25519"],
+                "jump_hosts": True,
+                "tuning_profiles": list(PROFILES),
+                "search_tools": list(SEARCH_TOOLS),
+                "output_modes": list(OUTPUT_MODES)
             }
         }
     })
@@ -713,11 +2051,18 @@ def ssh_capabilities():
         "status": "ok",
         "type": "ssh",
         "version": "1.0.0",
-        "operations": ["connect", "execute", "disconnect"],
+        "operations": ["connect", "execute", "disconnect", "read_output",
+                       "forward_open", "forward_close", "forward_list", *FS_OPERATIONS, "search", "watch"],
         "features": {
             "auto_connect": True,
             "key_auth": True,
-            "password_auth": True
+            "password_auth": True,
+            "agent_auth": True,
+            "key_types": ["rsa", "ecdsa", "ed25519"],
+            "jump_hosts": True,
+            "tuning_profiles": list(PROFILES),
+            "search_tools": list(SEARCH_TOOLS),
+            "output_modes": list(OUTPUT_MODES)
         }
     })
 
@@ -738,6 +2083,9 @@ def ssh_connect_endpoint():
                 "message": "Hostname and username are required"
             }), 400
         
+        if data.get('profile') and data.get('profile') not in PROFILES:
+            return invalid_profile_response(data.get('profile'))
+        
         connection_id = f"{username}@{hostname}:{port}"
         
         logger.info(f"SSH API: Connecting to {connection_id}")
@@ -750,8 +2098,8 @@ def ssh_connect_endpoint():
                 "connection_id": connection_id
             })
         
-        client = SSHClient()
-        client.connect(hostname, port, username, password, key_path)
+        client = new_client()
+        client.connect(hostname, port, username, password, key_path, **connect_options(data))
         ssh_connections[connection_id] = client
         
         logger.info(f"SSH API: Successfully connected to {connection_id}")
@@ -759,7 +2107,8 @@ def ssh_connect_endpoint():
         return jsonify({
             "status": "ok",
             "message": f"Connected to {connection_id}",
-            "connection_id": connection_id
+            "connection_id": connection_id,
+            "transport": client.transport_info()
         })
     
     except Exception as e:
@@ -776,6 +2125,7 @@ def ssh_execute_endpoint():
         data = request.json or {}
         connection_id = data.get('connection_id')
         command = data.get('command')
+        mode = data.get('mode', 'text')
         
         if not connection_id or not command:
             return jsonify({
@@ -789,7 +2139,7 @@ def ssh_execute_endpoint():
                 "message": f"Connection {connection_id} not found"
             }), 404
         
-        client = ssh_connections[connection_id]
+        client = leased_session(connection_id)
         
         if not client.is_connected():
             return jsonify({
@@ -797,13 +2147,68 @@ def ssh_execute_endpoint():
                 "message": f"Connection {connection_id} is not active"
             }), 400
         
-        logger.info(f"SSH API: Executing command on {connection_id}: {command}")
-        output = client.execute_command(command)
+        if mode not in OUTPUT_MODES:
+            return invalid_output_mode_response(mode)
         
+        logger.info(f"SSH API: Executing command on {connection_id}: {command}")
+        return command_output_response(client, connection_id, command, mode)
+    
+    except Exception as e:
+        logger.error(f"SSH API: Command execution error: {str(e)}")
         return jsonify({
-            "status": "ok",
-            "output": output
-        })
+            "status": "error",
+            "message": f"Command execution failed: {str(e)}"
+        }), 500
+
+@app.route('/ssh/execute/stdin', methods=['POST'])
+def ssh_execute_stdin_endpoint():
+    """
+    SSH-specific MCP protocol endpoint for executing a command with the
+    request body as its stdin.
+    
+    The connection_id, command and mode are passed as query parameters. The
+    body is streamed into the command as it arrives, so payloads of any size
+    use a constant amount of memory. In raw and frames modes the output
+    streams back while the body is still being sent; clients must read it
+    concurrently.
+    """
+    try:
+        connection_id = request.args.get('connection_id')
+        command = request.args.get('command')
+        mode = request.args.get('mode', 'text')
+        
+        if brokers:
+            # The request body would have to be relayed through the broker
+            return jsonify({
+                "status": "error",
+                "message": "Streaming stdin is not available in multi-process mode"
+            }), 501
+        
+        if not connection_id or not command:
+            return jsonify({
+                "status": "error", 
+                "message": "Connection ID and command are required"
+            }), 400
+        
+        if connection_id not in ssh_connections:
+            return jsonify({
+                "status": "error", 
+                "message": f"Connection {connection_id} not found"
+            }), 404
+        
+        client = leased_session(connection_id)
+        
+        if not client.is_connected():
+            return jsonify({
+                "status": "error", 
+                "message": f"Connection {connection_id} is not active"
+            }), 400
+        
+        if mode not in OUTPUT_MODES:
+            return invalid_output_mode_response(mode)
+        
+        logger.info(f"SSH API: Executing command with stdin on {connection_id}: {command}")
+        return command_output_response(client, connection_id, command, mode, stdin=request.stream)
     
     except Exception as e:
         logger.error(f"SSH API: Command execution error: {str(e)}")
@@ -832,8 +2237,7 @@ def ssh_disconnect_endpoint():
             })
         
         logger.info(f"SSH API: Disconnecting from {connection_id}")
-        ssh_connections[connection_id].close()
-        del ssh_connections[connection_id]
+        ssh_connections.pop(connection_id).close()
         
         return jsonify({
             "status": "ok",
@@ -847,9 +2251,39 @@ def ssh_disconnect_endpoint():
             "message": f"Failed to disconnect: {str(e)}"
         }), 500
 
+@app.route('/ssh/forwards', methods=['GET'])
+def ssh_forwards_endpoint():
+    """List port forwards with their byte counters and throughput."""
+    return handle_forward_list(request.args)
+
+@app.route('/ssh/output/<result_id>', methods=['GET'])
+def ssh_output_endpoint(result_id):
+    """Read a page of spooled command output by byte or line range."""
+    return read_output_response({**request.args.to_dict(), 'result_id': result_id})
+
+@app.route('/ssh/output/<result_id>', methods=['DELETE'])
+def ssh_output_delete_endpoint(result_id):
+    """Release spooled command output before its TTL expires."""
+    try:
+        output_spools.delete(result_id)
+        return jsonify({
+            "status": "ok",
+            "message": f"Released output {result_id}"
+        })
+    except SpoolNotFound as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 404
+
 if __name__ == '__main__':
     # Create template directory if it doesn't exist
     os.makedirs('templates', exist_ok=True)
     
+    # With debug on, the reloader runs the server in a child process and
+    # the parent only watches for changes, so only the child starts up
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init()
+    
     # Run the Flask app
     app.run(host='0.0.0.0', port=5050, debug=True)
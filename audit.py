@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Audit log module for MCP Server
+Records who ran which command where, written in batches to rotating,
+compressed JSONL files by a background thread
+"""
+import os
+import re
+import json
+import gzip
+import glob
+import heapq
+import queue
+import atexit
+import shutil
+import logging
+import datetime
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CURRENT_SUFFIX = '.jsonl'
+ROTATED_SUFFIX = '.jsonl.gz'
+
+# Size of each block read when scanning the current file backwards
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class AuditLog:
+    """
+    Asynchronous audit trail of executed commands.
+
+    record() only puts the record on a bounded queue, so it never blocks the
+    request. A background thread writes queued records in batches to
+    <name>.jsonl in the audit directory. When that file passes max_bytes it
+    is gzipped to <name>-<timestamp>.jsonl.gz and the oldest rotated files
+    past `backups` are deleted. Records that arrive while the queue is full
+    are dropped and counted.
+
+    Several processes can share a directory as long as each uses its own
+    name; queries read the files of all of them.
+    """
+
+    def __init__(self, directory, name='audit', max_bytes=50 * 1024 * 1024, backups=10,
+                 queue_size=10000, batch_size=500, flush_interval=1.0):
+        """
+        Initialize the audit log.
+
+        Args:
+            directory (str): Directory for the audit files
+            name (str): File name prefix of this writer
+            max_bytes (int): Size at which the current file is rotated
+            backups (int): Number of rotated files to keep
+            queue_size (int): Maximum records waiting to be written
+            batch_size (int): Maximum records written per batch
+            flush_interval (float): Maximum seconds a record waits before
+                its batch is written
+        """
+        self.directory = os.path.expanduser(directory)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._file_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def path(self):
+        """str: Path of the file currently being written."""
+        return os.path.join(self.directory, self.name + CURRENT_SUFFIX)
+
+    def record(self, **fields):
+        """
+        Queue an audit record without blocking.
+
+        Records are ignored until the writer has been started.
+
+        Args:
+            **fields: Record fields; a UTC timestamp is added as `time`
+        """
+        if self._thread is None:
+            return
+        record = {"time": datetime.datetime.utcnow().isoformat(timespec='milliseconds') + 'Z', **fields}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        """Start the background writer."""
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} audit record(s): {str(e)}")
+
+    def _write(self, batch):
+        """Append a batch to the current file, rotating it if it grew too large."""
+        data = ''.join(json.dumps(record, default=str) + '\n' for record in batch)
+        with self._file_lock:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(data)
+            self._file.flush()
+            self.written += len(batch)
+            self.batches += 1
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def _rotate(self):
+        """Compress the current file and prune old ones. Call with the file lock held."""
+        self._file.close()
+        self._file = None
+        timestamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        rotated = os.path.join(self.directory, f'{self.name}-{timestamp}{ROTATED_SUFFIX}')
+        with open(self.path, 'rb') as source, gzip.open(rotated, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.unlink(self.path)
+        self.rotations += 1
+
+        for old in self._rotated_files()[self.backups:]:
+            os.unlink(old)
+
+    def _rotated_files(self, name=None):
+        """Rotated files of a writer (this one by default), newest first."""
+        pattern = re.compile(re.escape(name or self.name) + r'-\d{8}T\d{12}' + re.escape(ROTATED_SUFFIX))
+        paths = glob.glob(os.path.join(self.directory, '*' + ROTATED_SUFFIX))
+        return sorted((path for path in paths if pattern.fullmatch(os.path.basename(path))),
+                      reverse=True)
+
+    def _writer_names(self):
+        """Names of all writers with files in the directory."""
+        names = set()
+        for path in glob.glob(os.path.join(self.directory, '*' + CURRENT_SUFFIX)):
+            names.add(os.path.basename(path)[:-len(CURRENT_SUFFIX)])
+        for path in glob.glob(os.path.join(self.directory, '*' + ROTATED_SUFFIX)):
+            names.add(os.path.basename(path)[:-len(ROTATED_SUFFIX)].rsplit('-', 1)[0])
+        return names
+
+    @staticmethod
+    def _rotated_time(path):
+        """Get the ISO time a rotated file was rotated at, which no record in it is newer than."""
+        stamp = os.path.basename(path)[:-len(ROTATED_SUFFIX)].rsplit('-', 1)[1]
+        moment = datetime.datetime.strptime(stamp, '%Y%m%dT%H%M%S%f')
+        return moment.isoformat(timespec='milliseconds') + 'Z'
+
+    @staticmethod
+    def _reversed_lines(f):
+        """Yield the lines of a binary file from the last to the first, a block at a time."""
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        head = b''
+        while position > 0:
+            size = min(READ_BLOCK_SIZE, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + head).split(b'\n')
+            # The first piece may continue in the previous block
+            head = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if head:
+            yield head
+
+    def _iter_records(self, name, matches, limit, since=None):
+        """
+        Yield one writer's matching records, newest first.
+
+        The current file is read backwards and rotated files are only
+        opened once the newer ones run out, so a query stops reading as
+        soon as it has enough records. Rotated files older than `since` are
+        skipped, and only the newest `limit` matches of each are kept.
+        """
+        current = os.path.join(self.directory, name + CURRENT_SUFFIX)
+        with self._file_lock:
+            try:
+                # Still readable if it is rotated away while we read
+                f = open(current, 'rb')
+            except FileNotFoundError:
+                f = None
+            rotated = self._rotated_files(name)
+
+        def parse(line):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A partly written line from another process
+                return None
+            return record if matches(record) else None
+
+        if f is not None:
+            with f:
+                for line in self._reversed_lines(f):
+                    record = parse(line)
+                    if record is not None:
+                        yield record
+
+        for path in rotated:
+            if since and self._rotated_time(path) < since:
+                # This file and all older ones end before `since`
+                break
+            newest = deque(maxlen=limit)
+            try:
+                with gzip.open(path, 'rb') as f:
+                    for line in f:
+                        record = parse(line)
+                        if record is not None:
+                            newest.append(record)
+            except OSError:
+                # Pruned by its writer since we listed it
+                continue
+            yield from reversed(newest)
+
+    def query(self, limit=100, client=None, connection_id=None, since=None):
+        """
+        Get the most recent audit records, newest first.
+
+        Records still waiting in the queue are not included.
+
+        Args:
+            limit (int): Maximum number of records
+            client (str, optional): Only records from this client
+            connection_id (str, optional): Only records for this connection
+            since (str, optional): Only records at or after this ISO timestamp
+
+        Returns:
+            list: Matching records
+        """
+        def matches(record):
+            if client is not None and record.get('client') != client:
+                return False
+            return connection_id is None or record.get('connection_id') == connection_id
+
+        streams = [self._iter_records(name, matches, limit, since) for name in self._writer_names()]
+        results = []
+        for record in heapq.merge(*streams, key=lambda record: record.get('time', ''), reverse=True):
+            # Records come newest first, so everything after this is older
+            if since and record.get('time', '') < since:
+                break
+            results.append(record)
+            if len(results) >= limit:
+                break
+        for stream in streams:
+            stream.close()
+        return results
+
+    def stats(self):
+        """
+        Get writer statistics.
+
+        Returns:
+            dict: Queue depth and written, dropped and rotation counters
+        """
+        return {
+            "directory": self.directory,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "rotated_files": len(self._rotated_files())
+        }
+
+    def close(self):
+        """Write out queued records and stop the writer."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 5)
+            self._thread = None
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
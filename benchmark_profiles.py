@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Transport profile benchmark for MCP Server
+Measures handshake time, command latency and bulk throughput of each tuning
+profile against a host, to pick the right profile for a class of hosts.
+
+Usage:
+    python benchmark_profiles.py user@host[:port] [--key ~/.ssh/id_ed25519]
+        [--size-mb 64] [--source urandom] [--profiles lan-fast,wan]
+"""
+import sys
+import json
+import time
+import getpass
+import argparse
+from ssh_client import SSHClient
+from tuning import PROFILES
+
+# Shell commands producing the bulk payload. Zeros show the best case for
+# compression, random data the worst.
+SOURCES = {
+    'zero': "head -c {size} /dev/zero",
+    'urandom': "head -c {size} /dev/urandom",
+    'text': "yes 'the quick brown fox jumps over the lazy dog' | head -c {size}"
+}
+
+
+def parse_target(target):
+    """Split user@host[:port] into its parts."""
+    if '@' not in target:
+        raise SystemExit(f"Target must be user@host[:port], got '{target}'")
+    username, host = target.split('@', 1)
+    port = 22
+    if ':' in host:
+        host, port = host.rsplit(':', 1)
+        port = int(port)
+    return username, host, port
+
+
+def benchmark_profile(profile, args, username, hostname, port):
+    """
+    Benchmark one profile.
+
+    Returns:
+        dict: Timings and throughput for the profile
+    """
+    client = SSHClient()
+    started = time.perf_counter()
+    client.connect(hostname, port, username, args.password, args.key,
+                   key_passphrase=args.passphrase, profile=profile)
+    handshake = time.perf_counter() - started
+
+    try:
+        latencies = []
+        for _ in range(args.rounds):
+            started = time.perf_counter()
+            for _ in client.iter_command_output('true'):
+                pass
+            latencies.append(time.perf_counter() - started)
+
+        size = args.size_mb * 1024 * 1024
+        command = SOURCES[args.source].format(size=size)
+        received = 0
+        started = time.perf_counter()
+        for stream, data in client.iter_command_output(command):
+            if stream == 'stdout':
+                received += len(data)
+        elapsed = time.perf_counter() - started
+
+        return {
+            "profile": profile,
+            "transport": client.transport_info(),
+            "handshake_seconds": round(handshake, 4),
+            "command_latency_ms": round(sorted(latencies)[len(latencies) // 2] * 1000, 2),
+            "bytes": received,
+            "transfer_seconds": round(elapsed, 4),
+            "throughput_mb_s": round(received / elapsed / (1024 * 1024), 2) if elapsed else None
+        }
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSH transport tuning profiles")
+    parser.add_argument('target', help="user@host[:port]")
+    parser.add_argument('--key', help="Private key path")
+    parser.add_argument('--passphrase', help="Private key passphrase")
+    parser.add_argument('--ask-password', action='store_true', help="Prompt for a password")
+    parser.add_argument('--profiles', default=','.join(PROFILES),
+                        help="Comma-separated profiles to compare (default: all)")
+    parser.add_argument('--size-mb', type=int, default=64, help="Bulk transfer size in MiB")
+    parser.add_argument('--source', choices=sorted(SOURCES), default='urandom',
+                        help="Payload to transfer")
+    parser.add_argument('--rounds', type=int, default=20, help="Latency samples per profile")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args()
+    args.password = getpass.getpass() if args.ask_password else None
+
+    username, hostname, port = parse_target(args.target)
+    results = []
+    for profile in [name.strip() for name in args.profiles.split(',') if name.strip()]:
+        try:
+            results.append(benchmark_profile(profile, args, username, hostname, port))
+        except Exception as e:
+            results.append({"profile": profile, "error": str(e)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'profile':<12} {'handshake s':>12} {'latency ms':>11} {'MiB/s':>9}  cipher / compression")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['profile']:<12} error: {result['error']}")
+            continue
+        transport = result['transport'] or {}
+        print(f"{result['profile']:<12} {result['handshake_seconds']:>12} "
+              f"{result['command_latency_ms']:>11} {result['throughput_mb_s']:>9}  "
+              f"{transport.get('cipher')} / {transport.get('compression')}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
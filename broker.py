@@ -0,0 +1,751 @@
+#!/usr/bin/env python3
+"""
+SSH broker module for MCP Server
+Owns SSH sessions in a separate process and serves them to HTTP workers over
+a Unix socket, so several worker processes can share the same sessions
+"""
+import os
+import sys
+import json
+import zlib
+import types
+import socket
+import signal
+import struct
+import logging
+import threading
+import socketserver
+from ssh_client import SSHClient, bastion_pool
+from session_registry import SessionRegistry
+from session_state import SessionStore
+from output_spool import SpoolManager, SpoolNotFound
+from diagnostics import process_stats, tracemalloc_tracker
+
+logger = logging.getLogger(__name__)
+
+# Every message is a header length and a payload length (both 4-byte big
+# endian), a JSON header, then the payload bytes. Command output travels in
+# the payload so it never has to be encoded as JSON.
+MESSAGE_PREFIX = struct.Struct('>II')
+
+# Exceptions that keep their type when raised in the broker and re-raised in
+# the worker. Anything else is re-raised as Exception.
+REMOTE_EXCEPTIONS = {
+    'KeyError': KeyError,
+    'ValueError': ValueError,
+    'SpoolNotFound': SpoolNotFound
+}
+
+# Separates the broker shard from the broker's own ID in spooled result IDs
+RESULT_ID_SEPARATOR = '-'
+
+
+def send_message(sock, header, payload=b''):
+    """Send one message."""
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(MESSAGE_PREFIX.pack(len(data), len(payload)) + data + payload)
+
+
+def _recv_exactly(sock, size):
+    """Read exactly size bytes, raising EOFError if the peer closes first."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise EOFError("Broker connection closed")
+        received += count
+    return bytes(buffer)
+
+
+def recv_message(sock):
+    """
+    Receive one message.
+
+    Returns:
+        tuple: (header dict, payload bytes)
+
+    Raises:
+        EOFError: If the connection was closed
+    """
+    header_size, payload_size = MESSAGE_PREFIX.unpack(_recv_exactly(sock, MESSAGE_PREFIX.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    payload = _recv_exactly(sock, payload_size) if payload_size else b''
+    return header, payload
+
+
+def shard_for(connection_id, count):
+    """Pick the broker that owns a connection ID. Stable across processes."""
+    return zlib.crc32(connection_id.encode('utf-8')) % count
+
+
+def _process_alive(pid):
+    """Check whether a process exists."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remote_error(header):
+    """Rebuild an exception raised in the broker."""
+    error_class = REMOTE_EXCEPTIONS.get(header.get('type'), Exception)
+    return error_class(header.get('error', 'Broker error'))
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    """Serves requests from one worker connection until it is closed."""
+
+    def handle(self):
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (EOFError, OSError):
+                return
+            try:
+                self.server.broker.dispatch(self.request, header, payload)
+            except OSError:
+                # The worker went away mid-response
+                return
+
+
+class _BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Broker:
+    """Serves the sessions and spooled output of one shard to HTTP workers."""
+
+    def __init__(self, path, registry, spools):
+        """
+        Initialize the broker.
+
+        Args:
+            path (str): Path of the Unix socket to listen on
+            registry (SessionRegistry): The sessions owned by this broker
+            spools (SpoolManager): Spooled output of commands run here
+        """
+        self.path = path
+        self.registry = registry
+        self.spools = spools
+        self._server = None
+        # Serialises registering connected sessions
+        self._connect_lock = threading.Lock()
+        # Worker pid -> {connection ID: leases}, so the leases of a worker
+        # that died can be released
+        self._leases = {}
+        self._leases_lock = threading.Lock()
+
+    def serve_forever(self):
+        """Listen on the socket and serve requests until closed."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = _BrokerServer(self.path, _BrokerHandler)
+        self._server.broker = self
+        os.chmod(self.path, 0o600)
+        logger.info(f"SSH broker listening on {self.path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop serving, close all sessions and remove the socket."""
+        if self._server is not None:
+            self._server.server_close()
+            self._server = None
+        for connection_id in self.registry.keys():
+            self.rpc_close(connection_id)
+        self.spools.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def dispatch(self, sock, header, payload):
+        """Run one request and send its response."""
+        result = None
+        try:
+            handler = getattr(self, 'rpc_' + str(header.get('method')), None)
+            if handler is None:
+                raise Exception(f"Unknown broker method: {header.get('method')}")
+            result = handler(**header.get('params', {}))
+
+            if isinstance(result, types.GeneratorType):
+                for message, data in result:
+                    send_message(sock, {"ok": True, **message}, data)
+                send_message(sock, {"ok": True, "done": True})
+            elif isinstance(result, bytes):
+                send_message(sock, {"ok": True}, result)
+            else:
+                send_message(sock, {"ok": True, "result": result})
+        except OSError:
+            raise
+        except Exception as e:
+            send_message(sock, {"ok": False, "error": str(e), "type": type(e).__name__})
+        finally:
+            if isinstance(result, types.GeneratorType):
+                result.close()
+
+    # Methods callable by workers
+
+    def rpc_connect(self, connection_id, args):
+        client = SSHClient()
+        client.connect(**args)
+        with self._connect_lock:
+            # Several workers may connect the same ID at once (auto-connect
+            # runs in each); keep whichever session is already live
+            existing = dict(self.registry.items()).get(connection_id)
+            if existing is not None and existing.is_connected():
+                client.close()
+                return existing.transport_info()
+            previous = self.registry.pop(connection_id, None)
+            self.registry[connection_id] = client
+        if previous is not None:
+            previous.close()
+        return client.transport_info()
+
+    def rpc_contains(self, connection_id):
+        return connection_id in self.registry
+
+    def rpc_session(self, connection_id):
+        # Lookup, touch and status in one round trip
+        try:
+            client = self.registry[connection_id]
+        except KeyError:
+            return {"exists": False, "connected": False}
+        return {"exists": True, "connected": client.is_connected()}
+
+    def _release_dead_leases(self):
+        """Release the leases of worker processes that no longer exist."""
+        with self._leases_lock:
+            dead = [owner for owner in self._leases if not _process_alive(owner)]
+            released = [item for owner in dead for item in self._leases.pop(owner).items()]
+        for connection_id, count in released:
+            for _ in range(count):
+                self.registry.release_lease(connection_id)
+
+    def rpc_lease(self, connection_id, owner):
+        # Held for the worker's whole request, so the session isn't evicted
+        # between the lookup and the command
+        self._release_dead_leases()
+        client = self.registry.lease(connection_id)
+        with self._leases_lock:
+            leases = self._leases.setdefault(owner, {})
+            leases[connection_id] = leases.get(connection_id, 0) + 1
+        return client.is_connected()
+
+    def rpc_release_lease(self, connection_id, owner):
+        with self._leases_lock:
+            leases = self._leases.get(owner, {})
+            if not leases.get(connection_id):
+                return False
+            leases[connection_id] -= 1
+            if not leases[connection_id]:
+                del leases[connection_id]
+            if not leases:
+                del self._leases[owner]
+        self.registry.release_lease(connection_id)
+        return True
+
+    def rpc_is_connected(self, connection_id):
+        return self.registry[connection_id].is_connected()
+
+    def rpc_transport_info(self, connection_id):
+        return self.registry[connection_id].transport_info()
+
+    def rpc_list(self):
+        return [[connection_id, client.is_connected()]
+                for connection_id, client in self.registry.items()]
+
+    def rpc_close(self, connection_id):
+        client = self.registry.pop(connection_id, None)
+        if client is not None:
+            client.close()
+        return client is not None
+
+    def rpc_execute(self, connection_id, command):
+        return list(self.registry[connection_id].execute_command(command))
+
+    def rpc_stream(self, connection_id, command):
+        client = self.registry[connection_id]
+
+        def generate():
+            # Started inside the generator so the channel is always closed
+            channel = client.open_command(command)
+            yield {"started": True}, b''
+            for stream, data in client.iter_channel_output(channel):
+                if stream == 'exit':
+                    yield {"stream": stream, "status": data}, b''
+                else:
+                    yield {"stream": stream}, data
+
+        return generate()
+
+    def rpc_capture(self, connection_id, command):
+        spool = self.spools.capture_command(self.registry[connection_id], command)
+        captured = {"paged": spool.paged, "exit_status": spool.exit_status, "sizes": spool.sizes()}
+        if not spool.paged:
+            return {**captured, "output": spool.text()}
+        output, result = spool.summary(self.spools.page_size)
+        return {**captured, "output": output, "result": result}
+
+    def rpc_read_output(self, result_id, raw=False, **args):
+        if raw:
+            return self.spools.read_bytes(result_id, **args)
+        return self.spools.read(result_id, **args)
+
+    def rpc_delete_output(self, result_id):
+        self.spools.delete(result_id)
+        return True
+
+    def rpc_stats(self):
+        return {
+            **self.registry.stats(),
+            "pid": os.getpid(),
+            "jump_hosts": bastion_pool.stats()
+        }
+
+    def rpc_diagnostics(self):
+        return {
+            "process": process_stats(),
+            "spools": self.spools.stats(),
+            "sessions": {connection_id: client.resources()
+                         for connection_id, client in self.registry.items()},
+            "tracemalloc": tracemalloc_tracker.status()
+        }
+
+    def rpc_tracemalloc(self, action, **params):
+        if action not in ('status', 'start', 'snapshot', 'stop'):
+            raise ValueError(f"Invalid tracemalloc action: {action}")
+        return getattr(tracemalloc_tracker, action)(**params)
+
+
+def run_broker(path):
+    """
+    Run a broker process on a Unix socket until it is terminated.
+
+    Session limits, spooling and warm restart use the same environment
+    variables as the single-process server. MCP_MAX_SESSIONS applies to each
+    broker. Each broker saves its sessions to its own state file, named
+    after its socket.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    # Exit through serve_forever's cleanup on SIGTERM
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    registry = SessionRegistry(
+        max_sessions=int(os.getenv('MCP_MAX_SESSIONS', 0)),
+        idle_timeout=int(os.getenv('MCP_IDLE_TIMEOUT', 0))
+    )
+    registry.start_reaper(int(os.getenv('MCP_REAP_INTERVAL', 30)))
+    if int(os.getenv('MCP_TRACEMALLOC', 0)):
+        tracemalloc_tracker.start(int(os.getenv('MCP_TRACEMALLOC')))
+    if os.getenv('MCP_RESTORE', 'true').strip().lower() not in ('', '0', 'false', 'no', 'off'):
+        state_dir = os.getenv('MCP_STATE_DIR') or os.path.join(os.path.expanduser('~'), '.mcp')
+        name = os.path.splitext(os.path.basename(path))[0]
+        registry.attach_store(SessionStore(os.path.join(state_dir, f'sessions-{name}.json')))
+        registry.restore(
+            SSHClient,
+            concurrency=int(os.getenv('MCP_RESTORE_CONCURRENCY', 8)),
+            wait=float(os.getenv('MCP_RESTORE_WAIT', 10))
+        )
+    spools = SpoolManager(
+        directory=os.getenv('MCP_SPOOL_DIR') or None,
+        threshold=int(os.getenv('MCP_SPOOL_THRESHOLD', 1024 * 1024)),
+        ttl=int(os.getenv('MCP_SPOOL_TTL', 600)),
+        quota=int(os.getenv('MCP_SPOOL_QUOTA', 1024 * 1024 * 1024)),
+        page_size=int(os.getenv('MCP_SPOOL_PAGE_SIZE', 64 * 1024)),
+        max_page_size=int(os.getenv('MCP_SPOOL_MAX_PAGE_SIZE', 1024 * 1024))
+    )
+    spools.start_reaper()
+    Broker(path, registry, spools).serve_forever()
+
+
+class BrokerClient:
+    """Worker-side connections to the brokers, sharded by connection ID."""
+
+    def __init__(self, paths):
+        """
+        Initialize the client.
+
+        Args:
+            paths (list): Unix socket paths of the brokers, in shard order.
+                Every worker must list them in the same order.
+        """
+        self.paths = list(paths)
+        self._idle = [[] for _ in self.paths]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.registry = BrokerRegistry(self)
+        self.spools = BrokerSpools(self)
+
+    def shard(self, connection_id):
+        """Get the shard index of the broker that owns a connection ID."""
+        return shard_for(connection_id, len(self.paths))
+
+    def diagnostics(self):
+        """
+        Get the resource usage of every broker.
+
+        Returns:
+            list: Each broker's process, spool, session and tracemalloc
+                diagnostics, in shard order
+        """
+        return [self.call(shard, 'diagnostics') for shard in range(len(self.paths))]
+
+    def tracemalloc(self, shard, action, **params):
+        """Run a TracemallocTracker action in one broker."""
+        if not 0 <= shard < len(self.paths):
+            raise ValueError(f"Invalid broker: {shard}")
+        return self.call(shard, 'tracemalloc', action=action, **params)
+
+    def calls_made(self):
+        """Count the calls made by the current thread."""
+        return getattr(self._local, 'calls', 0)
+
+    def _checkout(self, shard):
+        """Get an idle connection to a broker, or open a new one."""
+        with self._lock:
+            if self._idle[shard]:
+                return self._idle[shard].pop()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.paths[shard])
+        except OSError as e:
+            sock.close()
+            raise Exception(f"SSH broker {self.paths[shard]} is unavailable: {str(e)}")
+        return sock
+
+    def _checkin(self, shard, sock):
+        """Return a connection with no request in flight to the idle pool."""
+        with self._lock:
+            self._idle[shard].append(sock)
+
+    def call(self, shard, method, **params):
+        """
+        Call a broker method and wait for its result.
+
+        Returns:
+            The method's result, or bytes for methods returning raw data
+
+        Raises:
+            Exception: The broker's error, re-raised with the same type for
+                the types in REMOTE_EXCEPTIONS
+        """
+        self._local.calls = self.calls_made() + 1
+        sock = self._checkout(shard)
+        try:
+            send_message(sock, {"method": method, "params": params})
+            header, payload = recv_message(sock)
+        except (EOFError, OSError) as e:
+            sock.close()
+            raise Exception(f"SSH broker request failed: {str(e)}")
+
+        self._checkin(shard, sock)
+        if not header.get('ok'):
+            raise _remote_error(header)
+        return header['result'] if 'result' in header else payload
+
+    def stream(self, shard, method, **params):
+        """
+        Call a broker method that streams its result.
+
+        The connection is dropped if the generator is closed before the
+        stream ends, which makes the broker stop the command.
+
+        Yields:
+            tuple: (header dict, payload bytes) for each message
+        """
+        self._local.calls = self.calls_made() + 1
+        sock = self._checkout(shard)
+        finished = False
+        try:
+            send_message(sock, {"method": method, "params": params})
+            while True:
+                header, payload = recv_message(sock)
+                if not header.get('ok'):
+                    finished = True
+                    raise _remote_error(header)
+                if header.get('done'):
+                    finished = True
+                    return
+                yield header, payload
+        except (EOFError, OSError) as e:
+            raise Exception(f"SSH broker request failed: {str(e)}")
+        finally:
+            if finished:
+                self._checkin(shard, sock)
+            else:
+                sock.close()
+
+    def new_client(self):
+        """Create an unconnected client whose session will live in a broker."""
+        return RemoteSSHClient(self)
+
+
+class RemoteSSHClient:
+    """
+    Stand-in for SSHClient whose session is owned by a broker process.
+
+    Supports the SSHClient methods the HTTP endpoints use. Port forwarding
+    needs the transport in-process and is not available.
+    """
+
+    def __init__(self, brokers, connection_id=None, connected=None):
+        self.brokers = brokers
+        self.connection_id = connection_id
+        self.forwards = set()
+        self._transport_info = None
+        # Status from the lookup that created this client, answered by the
+        # first is_connected call without another round trip
+        self._connected = connected
+
+    @property
+    def shard(self):
+        return self.brokers.shard(self.connection_id)
+
+    def connect(self, hostname, port, username, password=None, key_path=None, **options):
+        """Connect in the owning broker. Takes the same arguments as SSHClient.connect."""
+        self.connection_id = f"{username}@{hostname}:{port}"
+        args = {
+            'hostname': hostname,
+            'port': port,
+            'username': username,
+            'password': password,
+            'key_path': key_path,
+            **options
+        }
+        self._transport_info = self.brokers.call(self.shard, 'connect',
+                                                 connection_id=self.connection_id, args=args)
+
+    def is_connected(self):
+        if self._connected is not None:
+            connected, self._connected = self._connected, None
+            return connected
+        try:
+            return self.brokers.call(self.shard, 'is_connected', connection_id=self.connection_id)
+        except KeyError:
+            return False
+
+    def transport_info(self):
+        if self._transport_info is None:
+            self._transport_info = self.brokers.call(self.shard, 'transport_info',
+                                                     connection_id=self.connection_id)
+        return self._transport_info
+
+    def execute_command(self, command):
+        stdout, stderr = self.brokers.call(self.shard, 'execute',
+                                           connection_id=self.connection_id, command=command)
+        return stdout, stderr
+
+    def open_command(self, command):
+        """
+        Start a command in the broker.
+
+        Returns:
+            generator: Handle to pass to iter_channel_output
+        """
+        stream = self.brokers.stream(self.shard, 'stream',
+                                     connection_id=self.connection_id, command=command)
+        # The first message confirms the command started
+        next(stream)
+        return stream
+
+    def iter_channel_output(self, channel, chunk_size=None):
+        """Read a command's output, like SSHClient.iter_channel_output."""
+        try:
+            for header, payload in channel:
+                if header['stream'] == 'exit':
+                    yield 'exit', header['status']
+                else:
+                    yield header['stream'], payload
+        finally:
+            channel.close()
+
+    def iter_command_output(self, command, chunk_size=None):
+        return self.iter_channel_output(self.open_command(command))
+
+    def close(self):
+        """Disconnect the session in the broker."""
+        self.brokers.call(self.shard, 'close', connection_id=self.connection_id)
+
+
+class BrokerRegistry:
+    """
+    Worker-side view of the sessions in all brokers, with the parts of the
+    SessionRegistry interface the HTTP endpoints use.
+    """
+
+    def __init__(self, brokers):
+        self.brokers = brokers
+        # Status of the last session checked with `in` by each thread, so
+        # the usual check, lookup and is_connected take one round trip. It
+        # is only reused if the thread made no broker call in between.
+        self._checked = threading.local()
+
+    def _client(self, connection_id, connected=None):
+        return RemoteSSHClient(self.brokers, connection_id, connected)
+
+    def _session(self, connection_id):
+        return self.brokers.call(self.brokers.shard(connection_id), 'session',
+                                 connection_id=connection_id)
+
+    def __contains__(self, connection_id):
+        status = self._session(connection_id)
+        self._checked.status = (connection_id, status, self.brokers.calls_made())
+        return status['exists']
+
+    def __getitem__(self, connection_id):
+        checked = getattr(self._checked, 'status', None)
+        self._checked.status = None
+        if checked is not None and checked[0] == connection_id \
+                and checked[2] == self.brokers.calls_made():
+            status = checked[1]
+        else:
+            status = self._session(connection_id)
+        if not status['exists']:
+            raise KeyError(connection_id)
+        return self._client(connection_id, status['connected'])
+
+    def __setitem__(self, connection_id, client):
+        # The broker registered the session when it connected
+        pass
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def lease(self, connection_id):
+        # Leased in the broker that owns the session, on behalf of this process
+        connected = self.brokers.call(self.brokers.shard(connection_id), 'lease',
+                                      connection_id=connection_id, owner=os.getpid())
+        return self._client(connection_id, connected)
+
+    def release_lease(self, connection_id):
+        try:
+            self.brokers.call(self.brokers.shard(connection_id), 'release_lease',
+                              connection_id=connection_id, owner=os.getpid())
+        except Exception as e:
+            logger.error(f"Failed to release lease on {connection_id}: {str(e)}")
+
+    def get(self, connection_id, default=None):
+        try:
+            return self[connection_id]
+        except KeyError:
+            return default
+
+    def pop(self, connection_id, *default):
+        """
+        Get a session for removal. The broker forgets it when the returned
+        client is closed.
+        """
+        if self.brokers.call(self.brokers.shard(connection_id), 'contains', connection_id=connection_id):
+            return self._client(connection_id)
+        if default:
+            return default[0]
+        raise KeyError(connection_id)
+
+    def _list(self):
+        sessions = []
+        for shard in range(len(self.brokers.paths)):
+            sessions.extend(self.brokers.call(shard, 'list'))
+        return sessions
+
+    def keys(self):
+        return [connection_id for connection_id, _ in self._list()]
+
+    def items(self):
+        return [(connection_id, self._client(connection_id)) for connection_id, _ in self._list()]
+
+    def values(self):
+        return [client for _, client in self.items()]
+
+    def stats(self):
+        """
+        Get registry statistics summed over all brokers.
+
+        Returns:
+            dict: Totals, the jump host sessions of every broker, and each
+                broker's own statistics under "brokers"
+        """
+        brokers = [self.brokers.call(shard, 'stats') for shard in range(len(self.brokers.paths))]
+        totals = {}
+        for key in ('live', 'evicted', 'evictions', 'reconnects', 'restoring', 'restored', 'restore_failures'):
+            totals[key] = sum(stats[key] for stats in brokers)
+        return {
+            **totals,
+            "jump_hosts": [{**hop, "broker": shard}
+                           for shard, stats in enumerate(brokers) for hop in stats['jump_hosts']],
+            "max_sessions": brokers[0]['max_sessions'] if brokers else 0,
+            "idle_timeout": brokers[0]['idle_timeout'] if brokers else 0,
+            "brokers": brokers
+        }
+
+
+class _RemoteSpool:
+    """Result of a command captured in a broker, with the OutputSpool methods used by endpoints."""
+
+    def __init__(self, paged, output, result=None, exit_status=None, sizes=None):
+        self.paged = paged
+        self.exit_status = exit_status
+        self._output = tuple(output)
+        self._result = result
+        self._sizes = sizes or {}
+
+    def sizes(self):
+        return self._sizes
+
+    def text(self):
+        return self._output
+
+    def summary(self, page_size):
+        return self._output, self._result
+
+
+class BrokerSpools:
+    """Worker-side view of the spooled output in all brokers."""
+
+    def __init__(self, brokers):
+        self.brokers = brokers
+        # Brokers pick their own first page size
+        self.page_size = None
+
+    def _locate(self, result_id):
+        """Split a result ID into its broker shard and the broker's spool ID."""
+        shard, _, spool_id = str(result_id).partition(RESULT_ID_SEPARATOR)
+        if not shard.isdigit() or int(shard) >= len(self.brokers.paths) or not spool_id:
+            raise SpoolNotFound(f"Output {result_id} not found or expired")
+        return int(shard), spool_id
+
+    def capture_command(self, client, command):
+        """Run a command and capture its output in the broker owning the session."""
+        shard = client.shard
+        captured = self.brokers.call(shard, 'capture', connection_id=client.connection_id,
+                                     command=command)
+        result = captured.get('result')
+        if result:
+            result['result_id'] = f"{shard}{RESULT_ID_SEPARATOR}{result['result_id']}"
+        return _RemoteSpool(captured['paged'], captured['output'], result,
+                            captured.get('exit_status'), captured.get('sizes'))
+
+    def read(self, result_id, **args):
+        shard, spool_id = self._locate(result_id)
+        page = self.brokers.call(shard, 'read_output', result_id=spool_id, **args)
+        page['result_id'] = result_id
+        return page
+
+    def read_bytes(self, result_id, **args):
+        shard, spool_id = self._locate(result_id)
+        return self.brokers.call(shard, 'read_output', result_id=spool_id, raw=True, **args)
+
+    def delete(self, result_id):
+        shard, spool_id = self._locate(result_id)
+        self.brokers.call(shard, 'delete_output', result_id=spool_id)
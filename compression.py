@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Response compression module for MCP Server
+Negotiates gzip (or zstd, when the zstandard package is installed) with
+clients via Accept-Encoding and compresses responses, including streamed ones
+"""
+import zlib
+import logging
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Content types that are already compressed and not worth compressing again
+INCOMPRESSIBLE_TYPES = ('image/', 'video/', 'audio/', 'application/gzip',
+                        'application/zip', 'application/zstd')
+
+
+class ResponseCompressor:
+    """Compress Flask responses according to the client's Accept-Encoding."""
+
+    def __init__(self, min_size=1024, gzip_level=6, zstd_level=3, exclude_types=()):
+        """
+        Initialize the compressor.
+
+        Args:
+            min_size (int): Responses smaller than this many bytes are sent
+                uncompressed. Streamed responses have no known size and are
+                always compressed.
+            gzip_level (int): zlib compression level for gzip
+            zstd_level (int): Compression level for zstd
+            exclude_types (tuple): Further content types, or prefixes, that
+                are never compressed
+        """
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        self.skipped_types = INCOMPRESSIBLE_TYPES + tuple(exclude_types)
+
+    def init_app(self, app):
+        """Register the compressor as an after_request hook on a Flask app."""
+        app.after_request(self.compress_response)
+
+    def available_encodings(self):
+        """
+        Get the encodings this server can produce, fastest first.
+
+        Returns:
+            list: Encoding names
+        """
+        encodings = ['gzip']
+        if zstandard is not None:
+            encodings.insert(0, 'zstd')
+        return encodings
+
+    def choose_encoding(self, accept_encoding):
+        """
+        Pick the best encoding accepted by the client.
+
+        Args:
+            accept_encoding (str): The Accept-Encoding header value
+
+        Returns:
+            str: The chosen encoding, or None for identity
+        """
+        if not accept_encoding:
+            return None
+
+        accepted = {}
+        for item in accept_encoding.split(','):
+            parts = item.strip().split(';')
+            name = parts[0].strip().lower()
+            quality = 1.0
+            for param in parts[1:]:
+                key, _, value = param.strip().partition('=')
+                if key == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            accepted[name] = quality
+
+        best = None
+        best_quality = 0.0
+        for encoding in self.available_encodings():
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def _compressor(self, encoding):
+        """Create a streaming compressor object for an encoding."""
+        if encoding == 'zstd':
+            return zstandard.ZstdCompressor(level=self.zstd_level).compressobj()
+        # wbits=31 selects the gzip container
+        return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+
+    def _sync_flush(self, compressor, encoding):
+        """Flush pending data without ending the compressed stream."""
+        if encoding == 'zstd':
+            return compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def compress_bytes(self, data, encoding):
+        """
+        Compress a complete body.
+
+        Args:
+            data (bytes): The body to compress
+            encoding (str): The encoding to use
+
+        Returns:
+            bytes: The compressed body
+        """
+        compressor = self._compressor(encoding)
+        return compressor.compress(data) + compressor.flush()
+
+    def compress_stream(self, chunks, encoding):
+        """
+        Compress an iterable of body chunks.
+
+        Each input chunk is flushed as soon as it has been compressed so
+        streamed output keeps reaching the client incrementally.
+
+        Args:
+            chunks (iterable): Iterable of bytes chunks
+            encoding (str): The encoding to use
+
+        Yields:
+            bytes: Compressed chunks
+        """
+        compressor = self._compressor(encoding)
+        for chunk in chunks:
+            if not chunk:
+                continue
+            data = compressor.compress(chunk) + self._sync_flush(compressor, encoding)
+            if data:
+                yield data
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+    def should_compress(self, request, response):
+        """Check whether a response is eligible for compression."""
+        if request.method == 'HEAD':
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype and response.mimetype.startswith(self.skipped_types):
+            return False
+        if response.direct_passthrough:
+            # File responses (send_file) are left alone
+            return False
+        if not response.is_streamed:
+            length = response.content_length
+            if length is None or length < self.min_size:
+                return False
+        return True
+
+    def compress_response(self, response):
+        """
+        Compress a response in place if the client accepts it.
+
+        Args:
+            response (flask.Response): The outgoing response
+
+        Returns:
+            flask.Response: The (possibly compressed) response
+        """
+        # Imported here so the module can be used without a request context
+        from flask import request
+
+        response.vary.add('Accept-Encoding')
+
+        if not self.should_compress(request, response):
+            return response
+
+        encoding = self.choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if not encoding:
+            return response
+
+        try:
+            if response.is_streamed:
+                original = response.response
+                response.response = self.compress_stream(response.iter_encoded(), encoding)
+                if hasattr(original, 'close'):
+                    response.call_on_close(original.close)
+                response.headers.pop('Content-Length', None)
+            else:
+                response.set_data(self.compress_bytes(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+        except Exception as e:
+            logger.error(f"Response compression error: {str(e)}")
+
+        return response
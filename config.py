@@ -46,10 +46,24 @@ class Config:
             logger.error(f"Failed to load connections: {str(e)}")
             return []
     
+    def get_prewarm_connections(self):
+        """
+        Get saved SSH connections marked to be connected ahead of first use.
+        
+        Returns:
+            list: Saved connection dictionaries with `prewarm` set
+        """
+        return [conn for conn in self.get_connections()
+                if str(conn.get('prewarm', '')).lower() in ('1', 'true', 'yes', 'on')]
+    
     def add_connection(self, connection):
         """
         Add a new SSH connection to saved connections.
         
+        An existing connection to the same host, user and port is updated:
+        the given details replace its own, and settings not given, such as
+        `prewarm`, `jump_hosts` or `profile`, are kept.
+        
         Args:
             connection (dict): Connection details
         """
@@ -62,7 +76,7 @@ class Config:
                     conn.get('username') == connection.get('username') and
                     conn.get('port') == connection.get('port')):
                     # Update existing connection
-                    connections[i] = connection
+                    connections[i] = {**conn, **connection}
                     break
             else:
                 # Add new connection
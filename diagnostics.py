@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Diagnostics module for MCP Server
+Reports the memory, threads and file descriptors of the server process, and
+compares tracemalloc snapshots to find where memory is being allocated
+"""
+import os
+import re
+import sys
+import resource
+import threading
+import tracemalloc
+from collections import Counter
+
+TRACEMALLOC_GROUPINGS = ('lineno', 'filename', 'traceback')
+
+# Allocations made by tracemalloc itself and the import machinery are noise
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>')
+]
+
+
+def _rss():
+    """Get the current resident set size in bytes, or None where /proc isn't available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _open_fds():
+    """Count open file descriptors, or None where /proc isn't available."""
+    for path in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return None
+
+
+def process_stats():
+    """
+    Describe the resources used by the current process.
+
+    Threads are grouped by name with numbers replaced by "N", so a pool of
+    worker threads shows up as one entry with a count.
+
+    Returns:
+        dict: pid, current and peak RSS in bytes, open file descriptors,
+            and thread counts
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    if sys.platform != 'darwin':
+        peak *= 1024
+    threads = threading.enumerate()
+    groups = Counter(re.sub(r'\d+', 'N', thread.name) for thread in threads)
+    return {
+        "pid": os.getpid(),
+        "rss": _rss(),
+        "peak_rss": peak,
+        "open_fds": _open_fds(),
+        "threads": len(threads),
+        "thread_groups": dict(groups.most_common())
+    }
+
+
+class TracemallocTracker:
+    """
+    Compares tracemalloc snapshots against a baseline.
+
+    Tracing slows down every allocation, so it is off until started. Each
+    snapshot is compared with the previous one (or the one taken at start),
+    which shows what was allocated and not freed in between.
+    """
+
+    def __init__(self):
+        self._baseline = None
+        self._lock = threading.Lock()
+
+    def status(self):
+        """
+        Get the state of tracing.
+
+        Returns:
+            dict: Whether tracing is on, traced and peak bytes, and the
+                memory tracemalloc itself uses
+        """
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "frames": tracemalloc.get_traceback_limit(),
+            "traced_bytes": traced,
+            "peak_traced_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory()
+        }
+
+    def start(self, frames=1):
+        """
+        Start tracing and take the baseline snapshot.
+
+        Args:
+            frames (int): Stack frames stored per allocation
+
+        Returns:
+            dict: The tracing status
+        """
+        with self._lock:
+            if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() != frames:
+                tracemalloc.stop()
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._baseline = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        return self.status()
+
+    def stop(self):
+        """Stop tracing and drop the baseline."""
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+        return self.status()
+
+    def snapshot(self, limit=20, group_by='lineno', reset=True):
+        """
+        Take a snapshot and compare it with the baseline.
+
+        Args:
+            limit (int): Maximum entries returned, largest growth first
+            group_by (str): 'lineno', 'filename' or 'traceback'
+            reset (bool): Make this snapshot the new baseline
+
+        Returns:
+            dict: The tracing status and the top differences, each with its
+                location, current size and count, and their change
+
+        Raises:
+            ValueError: If tracing is not running or group_by is invalid
+        """
+        if group_by not in TRACEMALLOC_GROUPINGS:
+            raise ValueError(f"Invalid group_by: {group_by}. Expected one of {', '.join(TRACEMALLOC_GROUPINGS)}")
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._baseline is None:
+                raise ValueError("tracemalloc is not running; start it first")
+            snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+            differences = snapshot.compare_to(self._baseline, group_by)
+            if reset:
+                self._baseline = snapshot
+
+        return {
+            **self.status(),
+            "top": [
+                {
+                    "location": [f"{frame.filename}:{frame.lineno}" for frame in difference.traceback],
+                    "size": difference.size,
+                    "size_diff": difference.size_diff,
+                    "count": difference.count,
+                    "count_diff": difference.count_diff
+                }
+                for difference in differences[:limit]
+            ]
+        }
+
+
+# tracemalloc is per process, so there is one tracker per process
+tracemalloc_tracker = TracemallocTracker()
@@ -40,7 +40,9 @@ def load_mcp_config():
                     'port': env.get('SSH_DEFAULT_PORT', '22'),
                     'username': env.get('SSH_DEFAULT_USERNAME', ''),
                     'password': env.get('SSH_DEFAULT_PASSWORD', ''),
-                    'key_path': env.get('SSH_DEFAULT_KEY_PATH', '')
+                    'key_path': env.get('SSH_DEFAULT_KEY_PATH', ''),
+                    'key_passphrase': env.get('SSH_DEFAULT_KEY_PASSPHRASE', ''),
+                    'use_agent': env.get('SSH_USE_AGENT')
                 }
                 
                 return connection
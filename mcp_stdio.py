@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+MCP stdio transport for MCP Server
+Serves the SSH tools over JSON-RPC on stdin/stdout, for IDEs that launch the
+server as a subprocess instead of talking to it over HTTP
+
+Usage:
+    python mcp_stdio.py
+
+Messages are newline-delimited JSON-RPC 2.0. Tool calls run concurrently,
+so a client may send several requests without waiting and receives each
+response as soon as it is ready, possibly out of order. Sessions, admission
+control, spooled output and the audit log are the same as in app.py.
+"""
+import os
+import sys
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# JSON-RPC goes to the real stdout; anything else printing there would
+# corrupt the stream, so it goes to stderr with the logs
+protocol_out = sys.stdout.buffer
+sys.stdout = sys.stderr
+
+from app import (ssh_connections, output_spools, new_client, connect_options,
+                 run_captured_command, SpoolNotFound, Overloaded, init)
+from tuning import PROFILES
+
+logger = logging.getLogger('mcp_stdio')
+
+PROTOCOL_VERSION = '2024-11-05'
+SERVER_INFO = {"name": "mcp-ssh-server", "version": "1.0.0"}
+
+# Scheduling identity of the stdio client
+CLIENT_ID = 'stdio'
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+TOOLS = [
+    {
+        "name": "ssh_connect",
+        "description": "Connect to an SSH server. Returns the connection ID used by the other tools.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "hostname": {"type": "string"},
+                "port": {"type": "integer", "default": 22},
+                "username": {"type": "string"},
+                "password": {"type": "string"},
+                "key_path": {"type": "string"},
+                "key_passphrase": {"type": "string"},
+                "use_agent": {"type": "boolean"},
+                "jump_hosts": {"type": "array", "items": {"type": "string"},
+                               "description": "Bastions as user@host:port, outermost first"},
+                "profile": {"type": "string", "description": "Transport tuning profile"},
+                "idle_timeout": {"type": "integer"}
+            },
+            "required": ["hostname", "username"]
+        }
+    },
+    {
+        "name": "ssh_execute",
+        "description": "Run a command on a connection and return its stdout, stderr and exit status. "
+                       "Large output is truncated to a first page with a result_id for ssh_read_output.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "connection_id": {"type": "string"},
+                "command": {"type": "string"}
+            },
+            "required": ["connection_id", "command"]
+        }
+    },
+    {
+        "name": "ssh_read_output",
+        "description": "Read a page of large command output by byte or line range.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "result_id": {"type": "string"},
+                "stream": {"type": "string", "enum": ["stdout", "stderr"], "default": "stdout"},
+                "offset": {"type": "integer"},
+                "length": {"type": "integer"},
+                "start_line": {"type": "integer"},
+                "line_count": {"type": "integer"}
+            },
+            "required": ["result_id"]
+        }
+    },
+    {
+        "name": "ssh_disconnect",
+        "description": "Close a connection.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"connection_id": {"type": "string"}},
+            "required": ["connection_id"]
+        }
+    },
+    {
+        "name": "ssh_list_sessions",
+        "description": "List active SSH connections.",
+        "inputSchema": {"type": "object", "properties": {}}
+    }
+]
+
+
+class RpcError(Exception):
+    """A JSON-RPC error response."""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class ToolError(Exception):
+    """A tool failure, reported in the tool result rather than as a protocol error."""
+
+
+def tool_connect(args):
+    hostname = args.get('hostname')
+    username = args.get('username')
+    if not hostname or not username:
+        raise ToolError("Hostname and username are required")
+    if args.get('profile') and args.get('profile') not in PROFILES:
+        raise ToolError(f"Invalid profile: {args.get('profile')}. Expected one of {', '.join(PROFILES)}")
+    port = int(args.get('port', 22))
+    connection_id = f"{username}@{hostname}:{port}"
+
+    if connection_id in ssh_connections and ssh_connections[connection_id].is_connected():
+        return {"message": f"Already connected to {connection_id}", "connection_id": connection_id}
+
+    logger.info(f"Connecting to {connection_id}")
+    client = new_client()
+    client.connect(hostname, port, username, args.get('password', ''), args.get('key_path', ''),
+                   **connect_options(args))
+    ssh_connections[connection_id] = client
+    return {
+        "message": f"Connected to {connection_id}",
+        "connection_id": connection_id,
+        "transport": client.transport_info()
+    }
+
+
+def leased_client(connection_id):
+    """
+    Look up an active connection, or fail the tool call.
+
+    The session is leased so it can't be evicted before the command starts;
+    the caller must release the lease.
+    """
+    if not connection_id:
+        raise ToolError("Connection ID is required")
+    try:
+        client = ssh_connections.lease(connection_id)
+    except KeyError:
+        raise ToolError(f"Connection {connection_id} not found")
+    if not client.is_connected():
+        ssh_connections.release_lease(connection_id)
+        raise ToolError(f"Connection {connection_id} is not active")
+    return client
+
+
+def tool_execute(args):
+    connection_id = args.get('connection_id')
+    command = args.get('command')
+    if not command:
+        raise ToolError("Command is required")
+    client = leased_client(connection_id)
+
+    logger.info(f"Executing command on {connection_id}: {command}")
+    try:
+        spool = run_captured_command(CLIENT_ID, client, connection_id, command)
+    finally:
+        ssh_connections.release_lease(connection_id)
+    if not spool.paged:
+        return {"output": spool.text(), "exit_status": spool.exit_status}
+    output, result = spool.summary(output_spools.page_size)
+    return {"output": output, "exit_status": spool.exit_status, "result": result}
+
+
+def tool_read_output(args):
+    result_id = args.get('result_id')
+    if not result_id:
+        raise ToolError("Result ID is required")
+    return output_spools.read(
+        result_id,
+        stream=args.get('stream', 'stdout'),
+        offset=args.get('offset', 0),
+        length=args.get('length'),
+        start_line=args.get('start_line'),
+        line_count=args.get('line_count')
+    )
+
+
+def tool_disconnect(args):
+    connection_id = args.get('connection_id')
+    if not connection_id:
+        raise ToolError("Connection ID is required")
+    if connection_id not in ssh_connections:
+        return {"message": f"Connection {connection_id} not found or already disconnected"}
+    logger.info(f"Disconnecting from {connection_id}")
+    ssh_connections.pop(connection_id).close()
+    return {"message": f"Disconnected from {connection_id}"}
+
+
+def tool_list_sessions(args):
+    return {
+        "sessions": [
+            {"id": connection_id, "connected": client.is_connected()}
+            for connection_id, client in ssh_connections.items()
+        ]
+    }
+
+
+TOOL_HANDLERS = {
+    'ssh_connect': tool_connect,
+    'ssh_execute': tool_execute,
+    'ssh_read_output': tool_read_output,
+    'ssh_disconnect': tool_disconnect,
+    'ssh_list_sessions': tool_list_sessions
+}
+
+
+def call_tool(params):
+    """
+    Run a tools/call request.
+
+    Returns:
+        dict: MCP tool result; failures set isError instead of raising
+    """
+    name = params.get('name')
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
+        raise RpcError(INVALID_PARAMS, f"Unknown tool: {name}")
+    arguments = params.get('arguments') or {}
+    if not isinstance(arguments, dict):
+        raise RpcError(INVALID_PARAMS, "Tool arguments must be an object")
+
+    try:
+        result = handler(arguments)
+        is_error = False
+    except Overloaded as e:
+        result = {"message": str(e), "retry_after": e.retry_after}
+        is_error = True
+    except (ToolError, SpoolNotFound, ValueError) as e:
+        result = {"message": str(e)}
+        is_error = True
+    except Exception as e:
+        logger.error(f"Tool {name} failed: {str(e)}")
+        result = {"message": str(e)}
+        is_error = True
+
+    return {
+        "content": [{"type": "text", "text": json.dumps(result, default=str)}],
+        "isError": is_error
+    }
+
+
+class StdioServer:
+    """
+    JSON-RPC server over a pair of byte streams.
+
+    Requests are read one line at a time. Cheap methods are answered
+    inline; tool calls run on a thread pool and their responses are written
+    whenever they finish, so a slow command doesn't hold up the requests
+    behind it.
+    """
+
+    def __init__(self, reader, writer, max_workers=16):
+        """
+        Initialize the server.
+
+        Args:
+            reader (file-like): Binary stream of incoming messages
+            writer (file-like): Binary stream for outgoing messages
+            max_workers (int): Maximum tool calls running at once
+        """
+        self.reader = reader
+        self.writer = writer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mcp-tool')
+        self._write_lock = threading.Lock()
+
+    def send(self, message):
+        """Write one message. Safe to call from any thread."""
+        data = json.dumps(message, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+        with self._write_lock:
+            self.writer.write(data)
+            self.writer.flush()
+
+    def respond(self, request_id, result=None, error=None):
+        if error is not None:
+            self.send({"jsonrpc": "2.0", "id": request_id,
+                       "error": {"code": error.code, "message": str(error)}})
+        else:
+            self.send({"jsonrpc": "2.0", "id": request_id, "result": result})
+
+    def handle(self, method, params):
+        """
+        Answer a method that doesn't need a worker thread.
+
+        Returns:
+            dict: The result
+        """
+        if method == 'initialize':
+            return {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {"tools": {"listChanged": False}},
+                "serverInfo": SERVER_INFO
+            }
+        if method == 'ping':
+            return {}
+        if method == 'tools/list':
+            return {"tools": TOOLS}
+        raise RpcError(METHOD_NOT_FOUND, f"Method not found: {method}")
+
+    def run_call(self, request_id, params):
+        try:
+            self.respond(request_id, call_tool(params))
+        except RpcError as e:
+            self.respond(request_id, error=e)
+        except Exception as e:
+            logger.error(f"Internal error handling request {request_id}: {str(e)}")
+            self.respond(request_id, error=RpcError(INTERNAL_ERROR, str(e)))
+
+    def dispatch(self, message):
+        """Handle one parsed message."""
+        if not isinstance(message, dict) or message.get('jsonrpc') != '2.0' \
+                or not isinstance(message.get('method'), str):
+            request_id = message.get('id') if isinstance(message, dict) else None
+            self.respond(request_id, error=RpcError(INVALID_REQUEST, "Invalid request"))
+            return
+
+        method = message['method']
+        params = message.get('params') or {}
+        if 'id' not in message:
+            # Notifications (initialized, cancelled, ...) need no answer
+            return
+        request_id = message['id']
+
+        if method == 'tools/call':
+            self.executor.submit(self.run_call, request_id, params)
+            return
+        try:
+            self.respond(request_id, self.handle(method, params))
+        except RpcError as e:
+            self.respond(request_id, error=e)
+
+    def serve(self):
+        """Process messages until the input stream ends."""
+        for line in self.reader:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                self.respond(None, error=RpcError(PARSE_ERROR, f"Parse error: {str(e)}"))
+                continue
+            self.dispatch(message)
+
+        # Finish calls in flight before the process exits
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    # Only the background work: the IDE chooses which sessions to open,
+    # and the HTTP server owns the saved session state
+    init(connect=False)
+    server = StdioServer(sys.stdin.buffer, protocol_out,
+                         max_workers=int(os.getenv('MCP_STDIO_WORKERS', 16)))
+    logger.info("Serving MCP over stdio")
+    server.serve()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+"""
+Output spooling module for MCP Server
+Spools large command output to temporary files and serves it back in pages
+"""
+import os
+import mmap
+import time
+import uuid
+import array
+import codecs
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+STREAMS = ('stdout', 'stderr')
+
+# The line index records the offset of every LINE_INDEX_STEP-th line; lines
+# in between are found by scanning forward from the nearest entry
+LINE_INDEX_STEP = 1024
+
+# Bytes read at a time while building the line index
+INDEX_BLOCK_SIZE = 1024 * 1024
+
+
+class SpoolNotFound(Exception):
+    """Raised when a spool ID is unknown or has expired."""
+
+
+def _nth_newline(data, n, start=0):
+    """
+    Find the n-th newline (1-based) in data after start. There must be at
+    least n.
+
+    Widens the window from start until it holds n newlines, then bisects
+    it, counting with bytes.count so the scanning runs in C rather than
+    once per line.
+    """
+    width = max(n, 64)
+    while start + width < len(data) and data.count(b'\n', start, start + width) < n:
+        width *= 2
+    low, high = start, min(start + width, len(data)) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if data.count(b'\n', start, middle + 1) >= n:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class SpooledStream:
+    """One output stream of a command, held in memory until it grows too large."""
+
+    def __init__(self, name, directory, prefix):
+        self.name = name
+        self.directory = directory
+        self.prefix = prefix
+        self.size = 0
+        self.truncated = False
+        self.path = None
+        self._memory = bytearray()
+        self._file = None
+        self._mmap = None
+        self._line_index = None
+        self._line_total = 0
+        self._index_lock = threading.Lock()
+
+    @property
+    def spilled(self):
+        """bool: True if the stream has been written to disk."""
+        return self.path is not None
+
+    def spill(self):
+        """Move the in-memory buffer to a temporary file."""
+        fd, self.path = tempfile.mkstemp(dir=self.directory, prefix=f"{self.prefix}-{self.name}-")
+        self._file = os.fdopen(fd, 'wb')
+        self._file.write(self._memory)
+        self._memory = bytearray()
+
+    def write(self, data):
+        """Append data to the stream."""
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._memory += data
+        self.size += len(data)
+
+    def finish(self):
+        """Flush and close the writer."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _view(self):
+        """Get a buffer over the whole stream (a memory map if spilled)."""
+        if not self.spilled:
+            return self._memory
+        if self._mmap is None:
+            if self.size == 0:
+                return b''
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def read(self, offset, length):
+        """
+        Read a byte range.
+
+        Args:
+            offset (int): Start offset in bytes
+            length (int): Maximum number of bytes to read
+
+        Returns:
+            bytes: The data in the range
+        """
+        view = self._view()
+        return bytes(view[offset:offset + length])
+
+    def _blocks(self):
+        """Read the finished stream in blocks, without the memory map."""
+        if not self.spilled:
+            for offset in range(0, self.size, INDEX_BLOCK_SIZE):
+                yield self._memory[offset:offset + INDEX_BLOCK_SIZE]
+            return
+        # Reading an open file still works if the spool is deleted meanwhile
+        with open(self.path, 'rb') as f:
+            while True:
+                block = f.read(INDEX_BLOCK_SIZE)
+                if not block:
+                    return
+                yield block
+
+    def index_lines(self):
+        """
+        Build the sparse line index of a finished stream, once.
+
+        It reads the stream through its own file handle, so it does not
+        need the spool lock and doesn't hold up other reads while it runs.
+
+        Raises:
+            FileNotFoundError: If the spool was deleted before it started
+        """
+        with self._index_lock:
+            if self._line_index is not None:
+                return
+            index = array.array('Q', [0])
+            newlines = 0
+            offset = 0
+            last = b''
+            for block in self._blocks():
+                count = block.count(b'\n')
+                # Line k starts after the k-th newline
+                seen, position = 0, 0
+                while newlines + count >= len(index) * LINE_INDEX_STEP:
+                    target = len(index) * LINE_INDEX_STEP - newlines - seen
+                    position = _nth_newline(block, target, position) + 1
+                    seen += target
+                    index.append(offset + position)
+                newlines += count
+                offset += len(block)
+                last = block[-1:]
+            # A trailing newline does not start another line
+            if self.size and last != b'\n':
+                newlines += 1
+            if len(index) > 1 and index[-1] >= self.size:
+                index.pop()
+            self._line_total = newlines
+            self._line_index = index
+
+    def line_count(self):
+        """Get the number of lines in the stream."""
+        self.index_lines()
+        return self._line_total
+
+    def _line_offset(self, line):
+        """Get the byte offset at which a line starts, scanning from the nearest index entry."""
+        if line >= self._line_total:
+            return self.size
+        entry, remainder = divmod(line, LINE_INDEX_STEP)
+        view = self._view()
+        position = self._line_index[entry]
+        for _ in range(remainder):
+            position = view.find(b'\n', position) + 1
+        return position
+
+    def line_range(self, start, count):
+        """
+        Get the byte range covering a range of lines.
+
+        Args:
+            start (int): Index of the first line (0-based)
+            count (int): Number of lines
+
+        Returns:
+            tuple: (offset, length) in bytes
+        """
+        total = self.line_count()
+        start = max(0, min(start, total))
+        end = max(start, min(start + count, total))
+        offset = self._line_offset(start)
+        return offset, self._line_offset(end) - offset
+
+    def close(self):
+        """Release the memory map and delete the backing file."""
+        self.finish()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class OutputSpool:
+    """Captured stdout and stderr of a single command."""
+
+    def __init__(self, manager, spool_id):
+        self.manager = manager
+        self.spool_id = spool_id
+        self.created = time.time()
+        self.last_access = self.created
+        self.finished = False
+        self.closed = False
+        self.exit_status = None
+        self.lock = threading.Lock()
+        self.streams = {
+            name: SpooledStream(name, manager.directory, spool_id) for name in STREAMS
+        }
+
+    @property
+    def spilled(self):
+        """bool: True if any stream has been written to disk."""
+        return any(stream.spilled for stream in self.streams.values())
+
+    @property
+    def paged(self):
+        """bool: True if the output is too large to return in one response."""
+        return self.spilled or any(stream.truncated for stream in self.streams.values())
+
+    def sizes(self):
+        """Get the number of bytes captured from each stream."""
+        return {name: stream.size for name, stream in self.streams.items()}
+
+    def disk_usage(self):
+        """Get the number of bytes this spool holds on disk."""
+        return sum(stream.size for stream in self.streams.values() if stream.spilled)
+
+    def memory_usage(self):
+        """Get the number of bytes this spool holds in memory."""
+        return sum(stream.size for stream in self.streams.values() if not stream.spilled)
+
+    def write(self, name, data):
+        """
+        Append output to a stream, spilling it to disk past the threshold.
+
+        Args:
+            name (str): 'stdout' or 'stderr'
+            data (bytes): The data to append
+        """
+        stream = self.streams[name]
+        if stream.truncated:
+            return
+
+        if not stream.spilled and stream.size + len(data) > self.manager.threshold:
+            if not self.manager.reserve(self, stream.size + len(data)):
+                # Keep what fits in memory and drop the rest
+                stream.write(data[:max(0, self.manager.threshold - stream.size)])
+                stream.truncated = True
+                return
+            stream.spill()
+        elif stream.spilled and not self.manager.reserve(self, len(data)):
+            stream.truncated = True
+            return
+
+        stream.write(data)
+
+    def finish(self, exit_status):
+        """Mark the command as complete."""
+        for stream in self.streams.values():
+            stream.finish()
+        self.exit_status = exit_status
+        self.finished = True
+
+    def read_text(self, name, offset, length):
+        """
+        Read a byte range and decode it as UTF-8.
+
+        A multi-byte character cut off at the end of the range is left for
+        the next page rather than replaced.
+
+        Returns:
+            tuple: (text, next_offset)
+        """
+        data = self.streams[name].read(offset, length)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        text = decoder.decode(data)
+        pending, _ = decoder.getstate()
+        next_offset = offset + len(data) - len(pending)
+        if next_offset == offset and data:
+            # Nothing decodable in the range; don't get stuck on it
+            text = decoder.decode(b'', final=True)
+            next_offset = offset + len(data)
+        return text, next_offset
+
+    def text(self):
+        """
+        Decode the complete output of both streams.
+
+        Returns:
+            tuple: (stdout, stderr) strings
+        """
+        return tuple(
+            self.streams[name].read(0, self.streams[name].size).decode('utf-8', errors='replace')
+            for name in STREAMS
+        )
+
+    def summary(self, page_size):
+        """
+        Describe the spool and include the first page of each stream.
+
+        Args:
+            page_size (int): Size of the first page in bytes
+
+        Returns:
+            tuple: ((stdout_page, stderr_page), result dict)
+        """
+        pages = []
+        result = {
+            "result_id": self.spool_id,
+            "exit_status": self.exit_status,
+            "expires_in": self.manager.ttl
+        }
+        with self.lock:
+            if self.closed:
+                raise SpoolNotFound(f"Output {self.spool_id} not found or expired")
+            for name in STREAMS:
+                stream = self.streams[name]
+                text, next_offset = self.read_text(name, 0, page_size)
+                pages.append(text)
+                result[name] = {
+                    "size": stream.size,
+                    "next_offset": next_offset if next_offset < stream.size else None,
+                    "truncated": stream.truncated
+                }
+        return tuple(pages), result
+
+    def close(self):
+        """Delete the spool's files."""
+        self.closed = True
+        for stream in self.streams.values():
+            stream.close()
+
+
+class SpoolManager:
+    """Keeps spooled command output on disk with a TTL and a total quota."""
+
+    def __init__(self, directory=None, threshold=1024 * 1024, ttl=600,
+                 quota=1024 * 1024 * 1024, page_size=64 * 1024, max_page_size=1024 * 1024):
+        """
+        Initialize the spool manager.
+
+        Args:
+            directory (str, optional): Directory for spool files. A private
+                temporary directory is created when not given.
+            threshold (int): Streams larger than this many bytes are spooled
+            ttl (int): Seconds a spool is kept after it was last read
+            quota (int): Maximum total bytes of spool files on disk
+            page_size (int): Default page size in bytes
+            max_page_size (int): Largest page a read may return, in bytes
+        """
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix='mcp-spool-', dir=directory)
+        else:
+            self.directory = tempfile.mkdtemp(prefix='mcp-spool-')
+        self.threshold = threshold
+        self.ttl = ttl
+        self.quota = quota
+        self.page_size = page_size
+        self.max_page_size = max(page_size, max_page_size)
+        self.disk_usage = 0
+        self.spools = {}
+        # Spools whose command is still running
+        self.capturing = set()
+        self.lock = threading.Lock()
+        self._reaper = None
+        atexit.register(self.close)
+
+    def capture(self, chunks):
+        """
+        Capture command output, spooling large streams to disk as they arrive.
+
+        Args:
+            chunks (iterable): (stream, data) pairs as produced by
+                SSHClient.iter_command_output
+
+        Returns:
+            OutputSpool: The finished spool. It is only registered for paged
+                retrieval if its output was spilled to disk or truncated.
+        """
+        self.cleanup()
+        spool = OutputSpool(self, uuid.uuid4().hex)
+        exit_status = -1
+
+        with self.lock:
+            self.capturing.add(spool)
+        try:
+            for stream, data in chunks:
+                if stream == 'exit':
+                    exit_status = data
+                else:
+                    spool.write(stream, data)
+        except Exception:
+            self.release(spool)
+            raise
+        finally:
+            with self.lock:
+                self.capturing.discard(spool)
+
+        spool.finish(exit_status)
+        if spool.paged:
+            with self.lock:
+                self.spools[spool.spool_id] = spool
+            logger.info(f"Spooled output {spool.spool_id} ({spool.disk_usage()} bytes on disk)")
+        return spool
+
+    def capture_command(self, client, command):
+        """
+        Run a command and capture its output.
+
+        Args:
+            client (SSHClient): The connected client
+            command (str): The command to execute
+
+        Returns:
+            OutputSpool: The finished spool, as returned by capture
+        """
+        return self.capture(client.iter_command_output(command))
+
+    def reserve(self, spool, size):
+        """
+        Reserve disk space for a spool, evicting the oldest spools if needed.
+
+        Args:
+            spool (OutputSpool): The spool that wants to write
+            size (int): Number of bytes to reserve
+
+        Returns:
+            bool: True if the space was reserved, False if over quota
+        """
+        evicted = []
+        with self.lock:
+            if self.disk_usage + size > self.quota:
+                candidates = sorted(
+                    (s for s in self.spools.values() if s is not spool),
+                    key=lambda s: s.last_access
+                )
+                # Only evict if that actually makes enough room
+                evictable = sum(candidate.disk_usage() for candidate in candidates)
+                if self.disk_usage + size - evictable <= self.quota:
+                    for candidate in candidates:
+                        if self.disk_usage + size <= self.quota:
+                            break
+                        del self.spools[candidate.spool_id]
+                        self.disk_usage -= candidate.disk_usage()
+                        candidate.closed = True
+                        evicted.append(candidate)
+
+            reserved = self.disk_usage + size <= self.quota
+            if reserved:
+                self.disk_usage += size
+
+        for candidate in evicted:
+            logger.info(f"Evicted spooled output {candidate.spool_id} to stay within quota")
+            # Wait for reads in progress before unmapping and deleting the files
+            with candidate.lock:
+                candidate.close()
+        if not reserved:
+            logger.warning(f"Spool quota exceeded, truncating output {spool.spool_id}")
+        return reserved
+
+    def get(self, spool_id):
+        """
+        Get a spool by ID and refresh its TTL.
+
+        Raises:
+            SpoolNotFound: If the spool doesn't exist or has expired
+        """
+        self.cleanup()
+        with self.lock:
+            spool = self.spools.get(spool_id)
+        if spool is None:
+            raise SpoolNotFound(f"Output {spool_id} not found or expired")
+        spool.last_access = time.time()
+        return spool
+
+    def _resolve_range(self, spool, stream, offset, length, start_line, line_count):
+        """
+        Turn a byte or line range request into a byte range.
+
+        The range is cut to max_page_size bytes; the page's next_offset
+        says where to carry on.
+        """
+        if start_line is not None:
+            offset, length = spool.streams[stream].line_range(int(start_line), int(line_count or 100))
+        else:
+            offset = int(offset or 0)
+            length = int(length or self.page_size)
+            if offset < 0 or length < 0:
+                raise ValueError("Offset and length must not be negative")
+        return offset, min(length, self.max_page_size)
+
+    def _prepare(self, spool_id, stream, start_line):
+        """Get a spool for reading, with the line index built for line ranges."""
+        if stream not in STREAMS:
+            raise ValueError(f"Invalid stream: {stream}")
+        spool = self.get(spool_id)
+        if start_line is not None:
+            # Outside the spool lock, which reads and eviction wait for
+            try:
+                spool.streams[stream].index_lines()
+            except FileNotFoundError:
+                raise SpoolNotFound(f"Output {spool_id} not found or expired")
+        return spool
+
+    def read_bytes(self, spool_id, stream='stdout', offset=0, length=None,
+                   start_line=None, line_count=None):
+        """
+        Read raw bytes from a spool by byte or line range.
+
+        Args:
+            spool_id (str): The spool ID
+            stream (str): 'stdout' or 'stderr'
+            offset (int): Start offset in bytes (ignored for line ranges)
+            length (int, optional): Page size in bytes, at most max_page_size
+            start_line (int, optional): First line of a line range (0-based)
+            line_count (int, optional): Number of lines in a line range
+
+        Returns:
+            bytes: The data in the range
+
+        Raises:
+            SpoolNotFound: If the spool doesn't exist or has expired
+            ValueError: If the stream or range is invalid
+        """
+        spool = self._prepare(spool_id, stream, start_line)
+        with spool.lock:
+            if spool.closed:
+                raise SpoolNotFound(f"Output {spool_id} not found or expired")
+            offset, length = self._resolve_range(spool, stream, offset, length,
+                                                 start_line, line_count)
+            return spool.streams[stream].read(offset, length)
+
+    def read(self, spool_id, stream='stdout', offset=0, length=None,
+             start_line=None, line_count=None):
+        """
+        Read a page of decoded text from a spool by byte or line range.
+
+        Takes the same arguments as read_bytes.
+
+        Returns:
+            dict: The page, with the offset to continue from
+
+        Raises:
+            SpoolNotFound: If the spool doesn't exist or has expired
+            ValueError: If the stream or range is invalid
+        """
+        spool = self._prepare(spool_id, stream, start_line)
+        with spool.lock:
+            if spool.closed:
+                raise SpoolNotFound(f"Output {spool_id} not found or expired")
+            offset, length = self._resolve_range(spool, stream, offset, length,
+                                                 start_line, line_count)
+            text, next_offset = spool.read_text(stream, offset, length)
+            size = spool.streams[stream].size
+            return {
+                "result_id": spool_id,
+                "stream": stream,
+                "offset": offset,
+                "size": size,
+                "next_offset": next_offset if next_offset < size else None,
+                "data": text
+            }
+
+    def release(self, spool):
+        """Forget a spool and delete its files."""
+        with self.lock:
+            if spool.closed:
+                return
+            self.spools.pop(spool.spool_id, None)
+            self.disk_usage -= spool.disk_usage()
+        with spool.lock:
+            spool.close()
+
+    def delete(self, spool_id):
+        """
+        Delete a spool by ID.
+
+        Raises:
+            SpoolNotFound: If the spool doesn't exist or has expired
+        """
+        self.release(self.get(spool_id))
+
+    def stats(self):
+        """
+        Get spool counts and the bytes they hold.
+
+        Returns:
+            dict: Stored and capturing spools, with their memory and disk usage
+        """
+        with self.lock:
+            stored = list(self.spools.values())
+            capturing = list(self.capturing)
+            disk_usage = self.disk_usage
+        return {
+            "spools": len(stored),
+            "capturing": len(capturing),
+            "memory_bytes": sum(spool.memory_usage() for spool in stored),
+            "capturing_memory_bytes": sum(spool.memory_usage() for spool in capturing),
+            "disk_bytes": disk_usage,
+            "quota": self.quota
+        }
+
+    def cleanup(self):
+        """Delete spools that have not been read within the TTL."""
+        now = time.time()
+        with self.lock:
+            expired = [s for s in self.spools.values() if now - s.last_access > self.ttl]
+        for spool in expired:
+            logger.info(f"Spooled output {spool.spool_id} expired")
+            self.release(spool)
+
+    def start_reaper(self, interval=60):
+        """Start a background thread that runs cleanup periodically."""
+        if self._reaper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.cleanup()
+                except Exception as e:
+                    logger.error(f"Spool cleanup error: {str(e)}")
+
+        self._reaper = threading.Thread(target=run, name='spool-reaper', daemon=True)
+        self._reaper.start()
+
+    def close(self):
+        """Delete all spools and the spool directory."""
+        with self.lock:
+            spools = list(self.spools.values())
+            self.spools.clear()
+            self.disk_usage = 0
+        for spool in spools:
+            spool.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Port forwarding module for MCP Server
+Local and remote port forwards over existing SSH sessions, relayed by a
+single selector-based thread
+"""
+import time
+import uuid
+import socket
+import logging
+import weakref
+import selectors
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per recv, and the most data buffered for one direction of a
+# forwarded connection before reading from its source is paused
+BUFFER_SIZE = 256 * 1024
+
+# Kernel socket buffer size for forwarded sockets
+SOCKET_BUFFER_SIZE = 1024 * 1024
+
+# How often the relay retries sends to channels whose SSH window is full
+CHANNEL_RETRY_INTERVAL = 0.02
+
+
+class ForwardNotFound(Exception):
+    """Raised when a forward ID is unknown."""
+
+
+class PortForward:
+    """One local or remote port forward and its traffic counters."""
+
+    def __init__(self, connection_id, client, direction, bind, target):
+        """
+        Initialize a forward.
+
+        Args:
+            connection_id (str): ID of the SSH session carrying the forward
+            client (SSHClient): The SSH session
+            direction (str): 'local' (listen here, connect from the remote
+                host) or 'remote' (listen on the remote host, connect from here)
+            bind (tuple): (host, port) the forward listens on
+            target (tuple): (host, port) forwarded connections are made to
+        """
+        self.forward_id = uuid.uuid4().hex[:12]
+        self.connection_id = connection_id
+        self.client = client
+        self.direction = direction
+        self.bind = bind
+        self.target = target
+        self.created = time.time()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.active_connections = 0
+        self.total_connections = 0
+        self.closed = False
+        self.listener = None
+        self._last_sample = (self.created, 0)
+        self._rate = 0.0
+
+    def stats(self):
+        """
+        Get the forward's description and traffic counters.
+
+        bytes_sent counts data sent towards the forward's target and
+        bytes_received data coming back from it.
+
+        Returns:
+            dict: Forward details, byte counters and throughput in bytes/second
+        """
+        now = time.time()
+        total = self.bytes_sent + self.bytes_received
+        last_time, last_total = self._last_sample
+        if now - last_time >= 1.0:
+            self._rate = (total - last_total) / (now - last_time)
+            self._last_sample = (now, total)
+        elapsed = max(now - self.created, 1e-6)
+        return {
+            "forward_id": self.forward_id,
+            "connection_id": self.connection_id,
+            "direction": self.direction,
+            "bind_host": self.bind[0],
+            "bind_port": self.bind[1],
+            "target_host": self.target[0],
+            "target_port": self.target[1],
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "active_connections": self.active_connections,
+            "total_connections": self.total_connections,
+            "throughput": self._rate,
+            "average_throughput": total / elapsed,
+            "uptime": now - self.created
+        }
+
+
+class _Endpoint:
+    """One side of a forwarded connection: a socket or an SSH channel."""
+
+    def __init__(self, conn, is_channel):
+        self.conn = conn
+        self.is_channel = is_channel
+        self.pending = bytearray()  # data waiting to be written to this endpoint
+        self.peer = None
+        self.pair = None
+        self.eof = False            # the endpoint has no more data to read
+        self.shut = False           # we have shut down writing to this endpoint
+        self.events = 0
+
+
+class _Pair:
+    """A forwarded connection: a local socket paired with an SSH channel."""
+
+    def __init__(self, forward, sock, channel):
+        self.forward = forward
+        self.sock = _Endpoint(sock, False)
+        self.channel = _Endpoint(channel, True)
+        self.sock.peer = self.channel
+        self.channel.peer = self.sock
+        self.sock.pair = self
+        self.channel.pair = self
+
+
+class ForwardRelay:
+    """
+    Relays data for all forwarded connections on one selector thread.
+
+    Listening sockets and forwarded sockets are watched for readiness, and
+    paramiko channels through their pollable file descriptors. Each
+    direction buffers up to BUFFER_SIZE bytes; past that, reading from the
+    source stops until the destination catches up.
+    """
+
+    def __init__(self):
+        """Initialize the relay. The thread starts on first use."""
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._calls = []
+        self._calls_lock = threading.Lock()
+        self._pairs = set()
+        self._listeners = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Opening a channel or connecting a socket waits on the network, so
+        # it is done off the relay thread
+        self._connector = ThreadPoolExecutor(max_workers=8, thread_name_prefix='forward-connect')
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='forward-relay', daemon=True)
+                self._thread.start()
+
+    def call(self, fn, *args):
+        """Run fn on the relay thread."""
+        self._start()
+        with self._calls_lock:
+            self._calls.append((fn, args))
+        try:
+            self._wake_w.send(b'\0')
+        except OSError:
+            pass
+
+    # registration (relay thread only)
+
+    def _set_events(self, endpoint, events):
+        """Update which events an endpoint is watched for."""
+        if endpoint.events == events:
+            return
+        if endpoint.events and events:
+            self.selector.modify(endpoint.conn, events, endpoint)
+        elif events:
+            self.selector.register(endpoint.conn, events, endpoint)
+        else:
+            self.selector.unregister(endpoint.conn)
+        endpoint.events = events
+
+    def _update_interest(self, endpoint):
+        """Watch an endpoint for reads unless its peer is backed up, and for writes if it has pending data."""
+        events = 0
+        if not endpoint.eof and len(endpoint.peer.pending) < BUFFER_SIZE:
+            events |= selectors.EVENT_READ
+        # Channels have no writable fd; their pending data is retried on a timer
+        if endpoint.pending and not endpoint.is_channel:
+            events |= selectors.EVENT_WRITE
+        self._set_events(endpoint, events)
+
+    def _add_pair(self, pair):
+        if pair.forward.closed:
+            self._close_conn(pair.sock.conn)
+            self._close_conn(pair.channel.conn)
+            return
+        pair.sock.conn.setblocking(False)
+        pair.channel.conn.settimeout(0.0)
+        for opt in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                pair.sock.conn.setsockopt(socket.SOL_SOCKET, opt, SOCKET_BUFFER_SIZE)
+            except OSError:
+                pass
+        pair.forward.active_connections += 1
+        pair.forward.total_connections += 1
+        self._pairs.add(pair)
+        self._update_interest(pair.sock)
+        self._update_interest(pair.channel)
+
+    def add_pair(self, forward, sock, channel):
+        """Start relaying between a socket and a channel."""
+        self.call(self._add_pair, _Pair(forward, sock, channel))
+
+    def _add_listener(self, forward, listener):
+        listener.setblocking(False)
+        self._listeners[listener] = forward
+        self.selector.register(listener, selectors.EVENT_READ, forward)
+
+    def add_listener(self, forward, listener):
+        """Start accepting connections for a local forward."""
+        self.call(self._add_listener, forward, listener)
+
+    def _close_forward(self, forward):
+        if forward.listener is not None and forward.listener in self._listeners:
+            self.selector.unregister(forward.listener)
+            del self._listeners[forward.listener]
+            forward.listener.close()
+        for pair in [p for p in self._pairs if p.forward is forward]:
+            self._close_pair(pair)
+
+    def close_forward(self, forward):
+        """Stop accepting for a forward and close its connections."""
+        self.call(self._close_forward, forward)
+
+    # data movement (relay thread only)
+
+    @staticmethod
+    def _close_conn(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _close_pair(self, pair):
+        if pair not in self._pairs:
+            return
+        self._pairs.discard(pair)
+        for endpoint in (pair.sock, pair.channel):
+            self._set_events(endpoint, 0)
+            self._close_conn(endpoint.conn)
+        pair.forward.active_connections -= 1
+
+    def _read(self, pair, endpoint):
+        """Read from an endpoint into its peer's pending buffer."""
+        try:
+            data = endpoint.conn.recv(BUFFER_SIZE)
+        except (BlockingIOError, socket.timeout):
+            return
+        except OSError:
+            self._close_pair(pair)
+            return
+
+        if not data:
+            endpoint.eof = True
+        else:
+            endpoint.peer.pending += data
+            if endpoint.is_channel:
+                pair.forward.bytes_received += len(data)
+            else:
+                pair.forward.bytes_sent += len(data)
+        self._flush(pair, endpoint.peer)
+
+    def _flush(self, pair, endpoint):
+        """Write as much pending data to an endpoint as it accepts."""
+        while endpoint.pending:
+            try:
+                sent = endpoint.conn.send(endpoint.pending)
+            except (BlockingIOError, socket.timeout):
+                break
+            except OSError:
+                self._close_pair(pair)
+                return
+            if not sent:
+                break
+            del endpoint.pending[:sent]
+
+        # Pass EOF along once everything before it has been written
+        if endpoint.peer.eof and not endpoint.pending and not endpoint.shut:
+            endpoint.shut = True
+            try:
+                if endpoint.is_channel:
+                    endpoint.conn.shutdown_write()
+                else:
+                    endpoint.conn.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+        if pair.sock.shut and pair.channel.shut:
+            self._close_pair(pair)
+            return
+        self._update_interest(endpoint)
+        self._update_interest(endpoint.peer)
+
+    def _accept(self, forward, listener):
+        try:
+            sock, origin = listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        self._connector.submit(self._open_local_channel, forward, sock, origin)
+
+    def _open_local_channel(self, forward, sock, origin):
+        """Open the SSH channel for a connection accepted by a local forward."""
+        try:
+            transport = forward.client.client.get_transport()
+            if transport is None or not transport.is_active():
+                raise Exception("SSH session is not active")
+            channel = transport.open_channel('direct-tcpip', forward.target, origin)
+            self.add_pair(forward, sock, channel)
+        except Exception as e:
+            logger.warning(f"Forward {forward.forward_id}: failed to open channel to "
+                           f"{forward.target[0]}:{forward.target[1]}: {str(e)}")
+            self._close_conn(sock)
+
+    def _run(self):
+        while True:
+            waiting = any(p.sock.pending or p.channel.pending for p in self._pairs)
+            timeout = CHANNEL_RETRY_INTERVAL if waiting else 1.0
+            for key, events in self.selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.fileobj in self._listeners:
+                    self._accept(key.data, key.fileobj)
+                else:
+                    endpoint = key.data
+                    pair = endpoint.pair
+                    if pair not in self._pairs:
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self._flush(pair, endpoint)
+                    if events & selectors.EVENT_READ and pair in self._pairs:
+                        self._read(pair, endpoint)
+
+            # Retry channels whose SSH window was full
+            for pair in list(self._pairs):
+                if pair.channel.pending:
+                    self._flush(pair, pair.channel)
+
+            with self._calls_lock:
+                calls, self._calls = self._calls, []
+            for fn, args in calls:
+                try:
+                    fn(*args)
+                except Exception as e:
+                    logger.error(f"Forward relay error: {str(e)}")
+
+
+class ForwardManager:
+    """Opens, tracks and closes port forwards over SSH sessions."""
+
+    def __init__(self):
+        """Initialize the manager with its relay."""
+        self.relay = ForwardRelay()
+        self.forwards = {}
+        self._remote_handlers = {}
+        # Sessions whose close already closes their forwards
+        self._watched = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def open_local(self, connection_id, client, remote_host, remote_port,
+                   bind_host='127.0.0.1', bind_port=0):
+        """
+        Listen on a local port and forward connections to a host reachable
+        from the SSH server.
+
+        Args:
+            connection_id (str): ID of the SSH session
+            client (SSHClient): The connected SSH session
+            remote_host (str): Target host, as seen from the SSH server
+            remote_port (int): Target port
+            bind_host (str): Local address to listen on
+            bind_port (int): Local port to listen on (0 picks a free port)
+
+        Returns:
+            PortForward: The new forward
+
+        Raises:
+            Exception: If the local port can't be bound
+        """
+        listener = socket.socket(socket.AF_INET6 if ':' in bind_host else socket.AF_INET)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind((bind_host, int(bind_port)))
+            listener.listen(128)
+        except OSError as e:
+            listener.close()
+            raise Exception(f"Failed to listen on {bind_host}:{bind_port}: {str(e)}")
+
+        forward = PortForward(connection_id, client, 'local',
+                              (bind_host, listener.getsockname()[1]),
+                              (remote_host, int(remote_port)))
+        forward.listener = listener
+        self._register(forward)
+        self.relay.add_listener(forward, listener)
+        logger.info(f"Opened local forward {forward.forward_id}: {bind_host}:{forward.bind[1]} -> "
+                    f"{remote_host}:{remote_port} via {connection_id}")
+        return forward
+
+    def open_remote(self, connection_id, client, local_host, local_port,
+                    bind_host='127.0.0.1', bind_port=0):
+        """
+        Ask the SSH server to listen on a port and forward connections back
+        to a host reachable from this server.
+
+        Args:
+            connection_id (str): ID of the SSH session
+            client (SSHClient): The connected SSH session
+            local_host (str): Target host, as seen from this server
+            local_port (int): Target port
+            bind_host (str): Address for the SSH server to listen on
+            bind_port (int): Port for the SSH server to listen on (0 lets
+                the server pick one)
+
+        Returns:
+            PortForward: The new forward
+
+        Raises:
+            Exception: If the SSH server refuses the forward
+        """
+        transport = client.client.get_transport()
+        try:
+            port = transport.request_port_forward(bind_host, int(bind_port),
+                                                  handler=self._remote_handler(transport))
+        except Exception as e:
+            raise Exception(f"Remote port forward request failed: {str(e)}")
+
+        forward = PortForward(connection_id, client, 'remote', (bind_host, port),
+                              (local_host, int(local_port)))
+        self._register(forward)
+        logger.info(f"Opened remote forward {forward.forward_id}: {bind_host}:{port} -> "
+                    f"{local_host}:{local_port} via {connection_id}")
+        return forward
+
+    def _remote_handler(self, transport):
+        """
+        Get the handler for forwarded channels on a transport.
+
+        paramiko keeps one handler per transport, so it looks up the forward
+        by the address the server reports it listening on.
+        """
+        def handler(channel, origin, server):
+            forward = self._find_remote(transport, server)
+            if forward is None:
+                channel.close()
+                return
+            self.relay._connector.submit(self._connect_remote_target, forward, channel)
+
+        return handler
+
+    def _find_remote(self, transport, server):
+        with self._lock:
+            for forward in self.forwards.values():
+                if (forward.direction == 'remote'
+                        and forward.client.client.get_transport() is transport
+                        and forward.bind[1] == server[1]):
+                    return forward
+        return None
+
+    def _connect_remote_target(self, forward, channel):
+        """Connect to the local target for a channel opened by a remote forward."""
+        try:
+            sock = socket.create_connection(forward.target, timeout=10)
+            self.relay.add_pair(forward, sock, channel)
+        except Exception as e:
+            logger.warning(f"Forward {forward.forward_id}: failed to connect to "
+                           f"{forward.target[0]}:{forward.target[1]}: {str(e)}")
+            channel.close()
+
+    def _register(self, forward):
+        client = forward.client
+        with self._lock:
+            self.forwards[forward.forward_id] = forward
+            watched = client in self._watched
+            self._watched.add(client)
+        # A session with open forwards must not be evicted as idle
+        client.forwards.add(forward.forward_id)
+        if not watched:
+            client.add_close_callback(self._closed_callback(weakref.ref(client), forward.connection_id))
+
+    def _closed_callback(self, client_ref, connection_id):
+        """Build the close callback of a session with forwards."""
+        def closed():
+            # Callbacks run once, so a reconnected session needs a new one
+            client = client_ref()
+            if client is not None:
+                with self._lock:
+                    self._watched.discard(client)
+            self.close_for_connection(connection_id)
+
+        return closed
+
+    def close(self, forward_id):
+        """
+        Close a forward and all connections through it.
+
+        Raises:
+            ForwardNotFound: If the forward doesn't exist
+        """
+        with self._lock:
+            forward = self.forwards.pop(forward_id, None)
+        if forward is None:
+            raise ForwardNotFound(f"Forward {forward_id} not found")
+
+        forward.closed = True
+        forward.client.forwards.discard(forward_id)
+        if forward.direction == 'remote':
+            try:
+                transport = forward.client.client.get_transport()
+                if transport is not None and transport.is_active():
+                    transport.cancel_port_forward(*forward.bind)
+            except Exception as e:
+                logger.warning(f"Failed to cancel remote forward {forward_id}: {str(e)}")
+        self.relay.close_forward(forward)
+        logger.info(f"Closed forward {forward_id}")
+
+    def close_for_connection(self, connection_id):
+        """Close all forwards over an SSH session."""
+        for forward in self.list(connection_id):
+            try:
+                self.close(forward['forward_id'])
+            except ForwardNotFound:
+                pass
+
+    def list(self, connection_id=None):
+        """
+        Get stats for all forwards, or those of one SSH session.
+
+        Returns:
+            list: Forward stats dicts
+        """
+        with self._lock:
+            forwards = list(self.forwards.values())
+        return [f.stats() for f in forwards
+                if connection_id is None or f.connection_id == connection_id]
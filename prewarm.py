@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Connection pre-warming module for MCP Server
+Connects to saved connections marked for pre-warming in the background
+"""
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPrewarmer:
+    """Keeps saved connections marked `prewarm` connected ahead of first use."""
+
+    def __init__(self, config, connect, max_workers=8, interval=300):
+        """
+        Initialize the prewarmer.
+
+        Args:
+            config (Config): Configuration holding the saved connections
+            connect (callable): Called with a saved connection dict; connects
+                it and stores it in the connection registry if it isn't
+                already connected. Returns the connection ID.
+            max_workers (int): Maximum number of concurrent handshakes
+            interval (int): Seconds between pre-warm rounds. 0 means only
+                pre-warm once, at startup.
+        """
+        self.config = config
+        self.connect = connect
+        self.max_workers = max_workers
+        self.interval = interval
+        self.last_run = None
+        self.last_results = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def warm(self):
+        """
+        Connect to all pre-warm connections in parallel.
+
+        Returns:
+            dict: Connection label -> "ok" or an error message
+        """
+        connections = self.config.get_prewarm_connections()
+        if not connections:
+            return {}
+
+        logger.info(f"Pre-warming {len(connections)} connection(s)")
+        started = time.time()
+        results = {}
+
+        def warm_one(connection):
+            label = f"{connection.get('username')}@{connection.get('hostname')}:{connection.get('port', 22)}"
+            try:
+                self.connect(connection)
+                return label, "ok"
+            except Exception as e:
+                logger.warning(f"Pre-warm of {label} failed: {str(e)}")
+                return label, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers,
+                                thread_name_prefix='prewarm') as executor:
+            for label, result in executor.map(warm_one, connections):
+                results[label] = result
+
+        self.last_run = time.time()
+        self.last_results = results
+        warmed = sum(1 for result in results.values() if result == "ok")
+        logger.info(f"Pre-warmed {warmed}/{len(results)} connection(s) in {self.last_run - started:.2f}s")
+        return results
+
+    @property
+    def running(self):
+        """bool: True if background pre-warming has been started."""
+        return self._thread is not None and not self._stop.is_set()
+
+    def start(self):
+        """Pre-warm in a background thread now and then every interval."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.warm()
+                except Exception as e:
+                    logger.error(f"Pre-warm error: {str(e)}")
+                if not self.interval or self._stop.wait(self.interval):
+                    break
+
+        self._thread = threading.Thread(target=run, name='prewarm', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop scheduling further pre-warm rounds."""
+        self._stop.set()
+
+    def status(self):
+        """
+        Get the result of the most recent pre-warm round.
+
+        Returns:
+            dict: Time of the last run and per-connection results
+        """
+        return {
+            "interval": self.interval,
+            "last_run": self.last_run,
+            "results": self.last_results
+        }
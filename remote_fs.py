@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Remote filesystem module for MCP Server
+Structured, cached directory listings and metadata over SFTP
+"""
+import stat
+import time
+import logging
+import posixpath
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Cap on the entries a single walk may return
+MAX_WALK_ENTRIES = 100000
+
+
+def _entry_type(mode):
+    """Classify a file mode."""
+    if mode is None:
+        return 'unknown'
+    if stat.S_ISDIR(mode):
+        return 'dir'
+    if stat.S_ISREG(mode):
+        return 'file'
+    if stat.S_ISLNK(mode):
+        return 'link'
+    return 'other'
+
+
+def describe(attrs, path):
+    """
+    Convert SFTP attributes to a JSON-friendly entry.
+
+    Args:
+        attrs (paramiko.SFTPAttributes): The attributes
+        path (str): Full path of the entry
+
+    Returns:
+        dict: name, path, type, size, mode, uid, gid and mtime
+    """
+    return {
+        "name": posixpath.basename(path) or path,
+        "path": path,
+        "type": _entry_type(attrs.st_mode),
+        "size": attrs.st_size,
+        "mode": stat.filemode(attrs.st_mode) if attrs.st_mode is not None else None,
+        "uid": attrs.st_uid,
+        "gid": attrs.st_gid,
+        "mtime": attrs.st_mtime
+    }
+
+
+class RemoteFS:
+    """
+    Cached SFTP view of one connection's filesystem.
+
+    Directory listings and stat results are cached for `ttl` seconds.
+    Changes made through this object invalidate the affected entries; other
+    changes on the host show up once the TTL expires. Walks list the
+    directories of each level in parallel over a small pool of SFTP
+    channels, so a deep tree costs one round of requests per level rather
+    than one per directory.
+    """
+
+    def __init__(self, client, ttl=10, max_channels=4):
+        """
+        Initialize the filesystem view.
+
+        Args:
+            client (SSHClient): The connected client
+            ttl (float): Seconds cached metadata stays valid (0 to disable caching)
+            max_channels (int): Maximum SFTP channels open at once. Each
+                counts towards the server's MaxSessions limit.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.max_channels = max(1, max_channels)
+        self.hits = 0
+        self.misses = 0
+        self._idle = []
+        self._open_channels = 0
+        self._channel_available = threading.Condition()
+        self._stats = {}
+        self._listings = {}
+        self._cache_lock = threading.Lock()
+        self.closed = False
+
+    # SFTP channel pool
+
+    @contextmanager
+    def _sftp(self):
+        """Borrow an SFTP channel, opening one if the pool isn't full."""
+        with self._channel_available:
+            while not self._idle and self._open_channels >= self.max_channels:
+                self._channel_available.wait()
+            if self._idle:
+                sftp = self._idle.pop()
+            else:
+                self._open_channels += 1
+                sftp = None
+
+        if sftp is None:
+            try:
+                sftp = self.client.get_sftp()
+            except Exception:
+                with self._channel_available:
+                    self._open_channels -= 1
+                    self._channel_available.notify()
+                raise
+
+        healthy = True
+        try:
+            yield sftp
+        except IOError:
+            # File-level errors leave the channel usable
+            raise
+        except Exception:
+            healthy = False
+            raise
+        finally:
+            with self._channel_available:
+                if healthy and not self.closed and not sftp.get_channel().closed:
+                    self._idle.append(sftp)
+                else:
+                    self._open_channels -= 1
+                    sftp.close()
+                self._channel_available.notify()
+
+    # Cache
+
+    def _cached(self, cache, path):
+        with self._cache_lock:
+            entry = cache.get(path)
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _store(self, cache, path, value):
+        if self.ttl:
+            with self._cache_lock:
+                cache[path] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, path=None):
+        """
+        Drop cached metadata.
+
+        Args:
+            path (str, optional): Drop this path, everything below it and
+                its parent's listing. Drops everything if omitted.
+        """
+        with self._cache_lock:
+            if path is None:
+                self._stats.clear()
+                self._listings.clear()
+                return
+            path = posixpath.normpath(path)
+            prefix = path.rstrip('/') + '/'
+            for cache in (self._stats, self._listings):
+                for key in [key for key in cache if key == path or key.startswith(prefix)]:
+                    del cache[key]
+            self._listings.pop(posixpath.dirname(path), None)
+
+    # Reads
+
+    def stat(self, path):
+        """
+        Get metadata of a path, following symlinks.
+
+        Returns:
+            dict: The entry, as returned by describe
+        """
+        path = posixpath.normpath(path)
+        entry = self._cached(self._stats, path)
+        if entry is None:
+            with self._sftp() as sftp:
+                entry = describe(sftp.stat(path), path)
+            self._store(self._stats, path, entry)
+        return entry
+
+    def listdir(self, path):
+        """
+        List a directory with the metadata of each entry.
+
+        Symlinks are reported as links, not followed.
+
+        Returns:
+            list: Entries sorted by name
+        """
+        path = posixpath.normpath(path)
+        entries = self._cached(self._listings, path)
+        if entries is None:
+            with self._sftp() as sftp:
+                # READDIR returns names and attributes together, so this is
+                # a few round trips however many entries there are
+                attrs = sftp.listdir_attr(path)
+            entries = sorted((describe(attr, posixpath.join(path, attr.filename)) for attr in attrs),
+                             key=lambda entry: entry['name'])
+            self._store(self._listings, path, entries)
+        return entries
+
+    def walk(self, path, max_depth=None, max_entries=10000):
+        """
+        List a directory tree breadth first. Symlinked directories are not followed.
+
+        Args:
+            path (str): Root of the tree
+            max_depth (int, optional): Deepest level to list (1 lists only the root)
+            max_entries (int): Stop after this many entries
+
+        Returns:
+            dict: entries (each with its depth), the directories that
+                couldn't be read under errors, and truncated if a limit
+                stopped the walk early
+        """
+        root = posixpath.normpath(path)
+        max_entries = min(max_entries, MAX_WALK_ENTRIES)
+        entries = []
+        errors = {}
+        truncated = False
+        level = [root]
+        depth = 1
+
+        with ThreadPoolExecutor(max_workers=self.max_channels, thread_name_prefix='sftp-walk') as executor:
+            while level and not truncated:
+                futures = [(directory, executor.submit(self.listdir, directory)) for directory in level]
+                next_level = []
+                for directory, future in futures:
+                    try:
+                        listing = future.result()
+                    except IOError as e:
+                        errors[directory] = str(e)
+                        continue
+                    for entry in listing:
+                        if len(entries) >= max_entries:
+                            truncated = True
+                            break
+                        entries.append({**entry, "depth": depth})
+                        if entry['type'] == 'dir':
+                            next_level.append(entry['path'])
+                    if truncated:
+                        break
+                if max_depth is not None and depth >= max_depth:
+                    truncated = truncated or bool(next_level)
+                    break
+                level = next_level
+                depth += 1
+
+        return {
+            "root": root,
+            "entries": entries,
+            "errors": errors,
+            "truncated": truncated
+        }
+
+    # Writes
+
+    def write_file(self, path, data):
+        """Create or replace a file with the given bytes."""
+        path = posixpath.normpath(path)
+        try:
+            with self._sftp() as sftp:
+                with sftp.open(path, 'wb') as f:
+                    f.set_pipelined(True)
+                    f.write(data)
+        finally:
+            self.invalidate(path)
+
+    def mkdir(self, path):
+        """Create a directory."""
+        path = posixpath.normpath(path)
+        try:
+            with self._sftp() as sftp:
+                sftp.mkdir(path)
+        finally:
+            self.invalidate(path)
+
+    def remove(self, path):
+        """Remove a file, or an empty directory."""
+        path = posixpath.normpath(path)
+        try:
+            with self._sftp() as sftp:
+                if stat.S_ISDIR(sftp.lstat(path).st_mode):
+                    sftp.rmdir(path)
+                else:
+                    sftp.remove(path)
+        finally:
+            self.invalidate(path)
+
+    def rename(self, source, target):
+        """Rename a file or directory."""
+        source = posixpath.normpath(source)
+        target = posixpath.normpath(target)
+        try:
+            with self._sftp() as sftp:
+                sftp.posix_rename(source, target)
+        finally:
+            self.invalidate(source)
+            self.invalidate(target)
+
+    def stats(self):
+        """
+        Get cache and channel statistics.
+
+        Returns:
+            dict: Cached entry counts, hits, misses and open channels
+        """
+        with self._cache_lock:
+            return {
+                "cached_stats": len(self._stats),
+                "cached_listings": len(self._listings),
+                "hits": self.hits,
+                "misses": self.misses,
+                "open_channels": self._open_channels,
+                "ttl": self.ttl
+            }
+
+    def close(self):
+        """Close all SFTP channels and drop the cache."""
+        with self._channel_available:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._open_channels -= len(idle)
+            self._channel_available.notify_all()
+        for sftp in idle:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        self.invalidate()
+
+
+class FilesystemManager:
+    """Keeps one RemoteFS per connection, dropped when the session closes."""
+
+    def __init__(self, ttl=10, max_channels=4):
+        """
+        Initialize the manager.
+
+        Args:
+            ttl (float): Cache TTL passed to each RemoteFS
+            max_channels (int): SFTP channel limit passed to each RemoteFS
+        """
+        self.ttl = ttl
+        self.max_channels = max_channels
+        self._filesystems = {}
+        self._lock = threading.Lock()
+
+    def get(self, connection_id, client):
+        """
+        Get the filesystem view of a connection, creating it on first use.
+
+        Args:
+            connection_id (str): The connection ID
+            client (SSHClient): The connected client
+
+        Returns:
+            RemoteFS: The filesystem view
+        """
+        with self._lock:
+            fs = self._filesystems.get(connection_id)
+            if fs is not None and fs.client is client and not fs.closed:
+                return fs
+            fs = self._filesystems[connection_id] = RemoteFS(client, self.ttl, self.max_channels)
+        # Channels die with the transport, on disconnect or reconnect
+        client.add_close_callback(lambda: self.drop(connection_id, fs))
+        return fs
+
+    def drop(self, connection_id, fs=None):
+        """
+        Close and forget a connection's filesystem view.
+
+        Args:
+            connection_id (str): The connection ID
+            fs (RemoteFS, optional): Only drop it if it is still this view
+        """
+        with self._lock:
+            current = self._filesystems.get(connection_id)
+            if current is None or (fs is not None and current is not fs):
+                return
+            del self._filesystems[connection_id]
+        current.close()
+
+    def invalidate(self, connection_id):
+        """Drop all cached metadata of a connection, if it has a view."""
+        with self._lock:
+            fs = self._filesystems.get(connection_id)
+        if fs is not None:
+            fs.invalidate()
+
+    def stats(self):
+        """
+        Get per-connection cache statistics.
+
+        Returns:
+            dict: Connection ID -> RemoteFS stats
+        """
+        with self._lock:
+            filesystems = dict(self._filesystems)
+        return {connection_id: fs.stats() for connection_id, fs in filesystems.items()}
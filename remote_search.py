@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Remote search module for MCP Server
+Runs ripgrep (or grep where it isn't installed) on the remote host and turns
+its output into structured matches, grouped per file
+"""
+import json
+import base64
+import shlex
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TOOLS = ('auto', 'rg', 'grep')
+
+# Longest line text returned per match; minified files can have huge lines
+MAX_LINE_LENGTH = 1000
+
+# Most stderr kept for the summary
+MAX_ERROR_OUTPUT = 4096
+
+
+def search_command(pattern, path='.', ignore_case=False, fixed_strings=False, glob=None, tool='auto'):
+    """
+    Build the remote shell command for a search.
+
+    The command prints the name of the tool it runs on the first line. Both
+    tools list files in the same order, sorted by path component, so a
+    cursor from one page stays meaningful on the next. For ripgrep that
+    means --sort path, which searches files one at a time.
+
+    Args:
+        pattern (str): Regular expression (extended syntax for grep), or a
+            literal string with fixed_strings
+        path (str): File or directory to search
+        ignore_case (bool): Case-insensitive matching
+        fixed_strings (bool): Treat the pattern as a literal string
+        glob (str, optional): Only search files whose name matches
+        tool (str): 'rg', 'grep', or 'auto' for ripgrep if installed
+
+    Returns:
+        str: The shell command
+    """
+    if tool not in SEARCH_TOOLS:
+        raise ValueError(f"Invalid search tool: {tool}. Expected one of {', '.join(SEARCH_TOOLS)}")
+    if not isinstance(pattern, str) or not isinstance(path, str) or not isinstance(glob, (str, type(None))):
+        raise ValueError("Pattern, path and glob must be strings")
+    # find has no "--"; a path starting with "-" would be parsed as an expression
+    if path.startswith('-'):
+        path = './' + path
+
+    rg = ['rg', '--json', '--sort', 'path']
+    grep = ['grep', '-nHZI', '-F' if fixed_strings else '-E']
+    if ignore_case:
+        rg.append('-i')
+        grep.append('-i')
+    if fixed_strings:
+        rg.append('-F')
+    if glob:
+        rg += ['--glob', glob]
+    rg += ['-e', pattern, '--', path]
+    grep += ['-e', pattern, '--']
+
+    find = ['find', path, '-type', 'f']
+    if glob:
+        find += ['-name', glob]
+    rg_command = 'echo rg; exec ' + shlex.join(rg)
+    # Swapping '/' for \001 while sorting orders paths by component, like ripgrep
+    grep_command = ('echo grep; ' + shlex.join(find) + " -print0 | tr '/' '\\001' | LC_ALL=C sort -z"
+                    " | tr '\\001' '/' | xargs -0 -r " + shlex.join(grep))
+
+    if tool == 'rg':
+        return rg_command
+    if tool == 'grep':
+        return grep_command
+    return f"if command -v rg >/dev/null 2>&1; then {rg_command}; else {grep_command}; fi"
+
+
+def search_key(pattern, path, ignore_case, fixed_strings, glob):
+    """Fingerprint of the search parameters, so cursors can't cross searches."""
+    spec = json.dumps([pattern, path, bool(ignore_case), bool(fixed_strings), glob])
+    return hashlib.sha1(spec.encode('utf-8')).hexdigest()[:12]
+
+
+def _position(path, line):
+    """Sort key matching the order the search tools list files in."""
+    return tuple(path.split('/')), line
+
+
+def encode_cursor(key, path, line):
+    """Encode the position after a match as an opaque cursor."""
+    data = json.dumps({"search": key, "path": path, "line": line})
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, key):
+    """
+    Decode a cursor returned by a previous page.
+
+    Returns:
+        tuple: Position of the last match already returned
+
+    Raises:
+        ValueError: If the cursor is malformed or belongs to another search
+    """
+    if not isinstance(cursor, str):
+        raise ValueError("Invalid cursor")
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        position = _position(data['path'], int(data['line']))
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if data.get('search') != key:
+        raise ValueError("Cursor belongs to a different search")
+    return position
+
+
+def _iter_lines(output):
+    """Split stdout chunks into lines, yielding stderr and exit events unchanged."""
+    buffer = b''
+    try:
+        for stream, data in output:
+            if stream != 'stdout':
+                yield stream, data
+                continue
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield 'line', line
+        if buffer:
+            yield 'line', buffer
+    finally:
+        if hasattr(output, 'close'):
+            output.close()
+
+
+def _rg_text(field):
+    """Get text from a ripgrep JSON field, which holds bytes if not valid UTF-8."""
+    if 'text' in field:
+        return field['text']
+    return base64.b64decode(field.get('bytes', '')).decode('utf-8', errors='replace')
+
+
+def _parse_rg(line):
+    """Parse a ripgrep --json line into (path, match), or None if it isn't a match."""
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return None
+    if message.get('type') != 'match':
+        return None
+    data = message['data']
+    text = _rg_text(data['lines']).rstrip('\r\n')
+    return _rg_text(data['path']), {
+        "line": data['line_number'],
+        "text": text,
+        "submatches": [{"start": submatch['start'], "end": submatch['end']}
+                       for submatch in data.get('submatches', [])]
+    }
+
+
+def _parse_grep(line):
+    """Parse a grep -nHZ line ("path\\0line:text") into (path, match)."""
+    path, separator, rest = line.partition(b'\0')
+    number, colon, text = rest.partition(b':')
+    if not separator or not colon or not number.isdigit():
+        return None
+    return path.decode('utf-8', errors='replace'), {
+        "line": int(number),
+        "text": text.decode('utf-8', errors='replace').rstrip('\r')
+    }
+
+
+def iter_search_results(output, pattern, path='.', ignore_case=False, fixed_strings=False,
+                        glob=None, max_results=1000, cursor=None):
+    """
+    Turn the output of a search command into records, grouped per file.
+
+    Stop consuming the output (and close it) once max_results matches have
+    been produced and another one arrives; closing the command's channel
+    stops the remote search.
+
+    Args:
+        output (iterable): (stream, data) pairs of the command built by
+            search_command with the same parameters
+        pattern, path, ignore_case, fixed_strings, glob: The search parameters
+        max_results (int): Maximum matches to return
+        cursor (str, optional): Cursor from the previous page; matches up
+            to and including its position are skipped
+
+    Yields:
+        dict: {"type": "file", "path", "matches"} records, then a
+            {"type": "summary"} record with the tool, counts, whether the
+            results were truncated, the cursor for the next page, the exit
+            status and any error output
+    """
+    key = search_key(pattern, path, ignore_case, fixed_strings, glob)
+    after = decode_cursor(cursor, key) if cursor else None
+    tool = None
+    parse = None
+    count = 0
+    files = 0
+    group = None
+    last = None
+    truncated = False
+    exit_status = None
+    errors = b''
+
+    lines = _iter_lines(output)
+    try:
+        for stream, data in lines:
+            if stream == 'exit':
+                exit_status = data
+                continue
+            if stream == 'stderr':
+                errors = (errors + data)[:MAX_ERROR_OUTPUT]
+                continue
+            if tool is None:
+                tool = data.decode('utf-8', errors='replace').strip()
+                parse = _parse_rg if tool == 'rg' else _parse_grep
+                continue
+
+            parsed = parse(data)
+            if parsed is None:
+                continue
+            match_path, match = parsed
+            if after is not None and _position(match_path, match['line']) <= after:
+                continue
+            if count >= max_results:
+                truncated = True
+                break
+
+            if len(match['text']) > MAX_LINE_LENGTH:
+                match['text'] = match['text'][:MAX_LINE_LENGTH]
+                match['truncated'] = True
+            if group is not None and group['path'] != match_path:
+                yield group
+                group = None
+            if group is None:
+                group = {"type": "file", "path": match_path, "matches": []}
+                files += 1
+            group['matches'].append(match)
+            count += 1
+            last = (match_path, match['line'])
+    finally:
+        # Closes the channel when we stop early, ending the remote search
+        lines.close()
+
+    if group is not None:
+        yield group
+
+    yield {
+        "type": "summary",
+        "tool": tool,
+        "match_count": count,
+        "file_count": files,
+        "truncated": truncated,
+        "cursor": encode_cursor(key, *last) if truncated else None,
+        "exit_status": exit_status,
+        "errors": errors.decode('utf-8', errors='replace')
+    }
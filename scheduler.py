@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Scheduler module for MCP Server
+Admission control and weighted fair scheduling of commands across clients
+"""
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest sample in the moving average of command run time
+RUN_TIME_SMOOTHING = 0.2
+
+
+class Overloaded(Exception):
+    """Raised when a command is not admitted. Carries a retry hint in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` commands per second with bursts of `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """
+        Take a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until one is available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def full(self):
+        """bool: True if the bucket has refilled completely, so forgetting it loses nothing."""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.burst
+
+
+class _Ticket:
+    """One command waiting for or holding a slot."""
+
+    def __init__(self, client_id, connection_id):
+        self.client_id = client_id
+        self.connection_id = connection_id
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.granted = False
+        self.released = False
+        self.event = threading.Event()
+
+
+class _ClientState:
+    """Queue and counters of one client."""
+
+    def __init__(self, weight, virtual_time):
+        self.weight = weight
+        self.queue = deque()
+        self.running = 0
+        # Service received so far, scaled by weight; lowest goes next
+        self.virtual_time = virtual_time
+        self.admitted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class AdmissionScheduler:
+    """
+    Admits commands under global and per-connection concurrency limits.
+
+    Commands that can't start right away wait in a queue per client. When a
+    slot frees up, the waiting client with the least weighted service so far
+    goes next, so a client looping on execute can't starve the others. Each
+    source (the caller's address) also has an optional token-bucket rate
+    limit, so a caller can't escape it by naming itself differently. Commands
+    that are rate limited, find their client's queue full or wait too long
+    are rejected with Overloaded.
+
+    At most max_clients clients and rate-limited sources are tracked at once.
+    When the limit is reached, idle clients and full buckets are forgotten
+    to make room; if none are idle, new clients are rejected.
+    """
+
+    def __init__(self, max_running=32, max_per_connection=8, queue_size=64,
+                 rate=0, burst=10, max_wait=60, weights=None, max_clients=1024):
+        """
+        Initialize the scheduler.
+
+        Args:
+            max_running (int): Maximum commands running at once (0 for no limit)
+            max_per_connection (int): Maximum commands running at once on one
+                connection (0 for no limit)
+            queue_size (int): Maximum commands queued per client
+            rate (float): Commands per second allowed per client (0 for no limit)
+            burst (int): Commands a client may start in a burst above its rate
+            max_wait (float): Seconds a command may wait in the queue
+            weights (dict, optional): Client ID -> scheduling weight (default 1)
+            max_clients (int): Maximum clients with state at once
+        """
+        self.max_running = max_running
+        self.max_per_connection = max_per_connection
+        self.queue_size = queue_size
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.weights = weights or {}
+        self.max_clients = max_clients
+        self.running = 0
+        self.average_run_time = 1.0
+        self.forgotten_clients = 0
+        self._clients = {}
+        # Source -> TokenBucket
+        self._buckets = {}
+        # Connection ID -> [running, queued]
+        self._connections = {}
+        self._virtual_clock = 0.0
+        self._lock = threading.Lock()
+
+    def _client(self, client_id):
+        """Get a client's state, creating it if there is room. Call with the lock held."""
+        client = self._clients.get(client_id)
+        if client is None:
+            if len(self._clients) >= self.max_clients:
+                self._prune()
+                if len(self._clients) >= self.max_clients:
+                    raise Overloaded("Too many active clients", self._retry_after())
+            # A new client starts level with the others rather than ahead of them
+            client = self._clients[client_id] = _ClientState(self.weights.get(client_id, 1),
+                                                             self._virtual_clock)
+        return client
+
+    def _take_token(self, source):
+        """
+        Take a token from a source's bucket. Call with the lock held.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until one is available
+        """
+        if not self.rate:
+            return 0
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            if len(self._buckets) >= self.max_clients:
+                self._prune()
+                if len(self._buckets) >= self.max_clients:
+                    raise Overloaded("Too many active clients", 1 / self.rate)
+            bucket = self._buckets[source] = TokenBucket(self.rate, self.burst)
+        return bucket.take()
+
+    def _prune(self):
+        """Forget idle clients and full buckets. Call with the lock held."""
+        for client_id, client in list(self._clients.items()):
+            if not client.queue and not client.running:
+                del self._clients[client_id]
+                self.forgotten_clients += 1
+        for source, bucket in list(self._buckets.items()):
+            if bucket.full():
+                del self._buckets[source]
+
+    def _connection(self, connection_id):
+        return self._connections.setdefault(connection_id, [0, 0])
+
+    def _can_run(self, ticket):
+        if self.max_running and self.running >= self.max_running:
+            return False
+        running = self._connections.get(ticket.connection_id, (0, 0))[0]
+        return not self.max_per_connection or running < self.max_per_connection
+
+    def _start(self, ticket):
+        """Give a ticket its slot. Call with the lock held."""
+        client = self._clients[ticket.client_id]
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        wait = ticket.started - ticket.enqueued
+        client.running += 1
+        client.admitted += 1
+        client.total_wait += wait
+        client.max_wait = max(client.max_wait, wait)
+        self._virtual_clock = client.virtual_time
+        client.virtual_time += 1.0 / client.weight
+        self._connection(ticket.connection_id)[0] += 1
+        self.running += 1
+        ticket.event.set()
+
+    def _dispatch(self):
+        """Start queued tickets while slots are free. Call with the lock held."""
+        while True:
+            best = None
+            for client in self._clients.values():
+                if not client.queue or (best and client.virtual_time >= best[0].virtual_time):
+                    continue
+                # Skip tickets whose connection is at its limit
+                for ticket in client.queue:
+                    if self._can_run(ticket):
+                        best = (client, ticket)
+                        break
+            if best is None:
+                return
+            client, ticket = best
+            client.queue.remove(ticket)
+            self._connection(ticket.connection_id)[1] -= 1
+            self._start(ticket)
+
+    def _retry_after(self):
+        """Estimate how long until a rejected command could be admitted."""
+        queued = sum(len(client.queue) for client in self._clients.values())
+        return self.average_run_time * (queued + 1) / max(1, self.max_running)
+
+    def _forget_connection(self, connection_id):
+        counts = self._connections.get(connection_id)
+        if counts is not None and counts == [0, 0]:
+            del self._connections[connection_id]
+
+    def admit(self, client_id, connection_id, source=None):
+        """
+        Wait for a slot to run a command.
+
+        Args:
+            client_id (str): Identifies the requesting client
+            connection_id (str): The connection the command runs on
+            source (str, optional): Where the request came from, for rate
+                limiting (default: the client ID)
+
+        Returns:
+            _Ticket: The slot, to be passed to release when the command ends
+
+        Raises:
+            Overloaded: If the command was rate limited, the client's queue
+                is full or it waited longer than max_wait
+        """
+        ticket = _Ticket(client_id, connection_id)
+        with self._lock:
+            # Before looking up the client, since making room for a new
+            # bucket may forget idle clients
+            wait = self._take_token(source or client_id)
+            client = self._client(client_id)
+            if wait:
+                client.rate_limited += 1
+                raise Overloaded(f"Rate limit exceeded for client {client_id}", wait)
+
+            # Anything queued is blocked on a limit, so a ticket that can run
+            # now isn't jumping ahead of anyone
+            if self._can_run(ticket):
+                self._start(ticket)
+                return ticket
+
+            if len(client.queue) >= self.queue_size:
+                client.rejected += 1
+                logger.warning(f"Rejected command from {client_id}: queue full")
+                raise Overloaded(f"Too many queued commands for client {client_id}",
+                                 self._retry_after())
+
+            if not client.queue and not client.running:
+                # A returning client doesn't get credit for time spent idle
+                client.virtual_time = max(client.virtual_time, self._virtual_clock)
+            client.queue.append(ticket)
+            self._connection(connection_id)[1] += 1
+
+        if ticket.event.wait(self.max_wait):
+            return ticket
+
+        with self._lock:
+            if ticket.granted:
+                return ticket
+            client.queue.remove(ticket)
+            self._connection(connection_id)[1] -= 1
+            self._forget_connection(connection_id)
+            client.timed_out += 1
+            logger.warning(f"Command from {client_id} timed out waiting for {connection_id}")
+            raise Overloaded(f"Timed out after {self.max_wait}s waiting to run on {connection_id}",
+                             self._retry_after())
+
+    def release(self, ticket):
+        """Free a ticket's slot and start the next queued command. Safe to call twice."""
+        with self._lock:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            run_time = time.monotonic() - ticket.started
+            self.average_run_time += RUN_TIME_SMOOTHING * (run_time - self.average_run_time)
+            self._clients[ticket.client_id].running -= 1
+            self._connection(ticket.connection_id)[0] -= 1
+            self.running -= 1
+            self._dispatch()
+            self._forget_connection(ticket.connection_id)
+
+    @contextmanager
+    def slot(self, client_id, connection_id, source=None):
+        """Context manager that holds a slot while its block runs."""
+        ticket = self.admit(client_id, connection_id, source)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self):
+        """
+        Get queue depths and wait times.
+
+        Returns:
+            dict: Limits, totals, and per-client and per-connection counters
+        """
+        with self._lock:
+            clients = {}
+            for client_id, client in self._clients.items():
+                clients[client_id] = {
+                    "weight": client.weight,
+                    "running": client.running,
+                    "queued": len(client.queue),
+                    "admitted": client.admitted,
+                    "rejected": client.rejected,
+                    "rate_limited": client.rate_limited,
+                    "timed_out": client.timed_out,
+                    "average_wait_ms": round(client.total_wait / client.admitted * 1000, 2)
+                    if client.admitted else 0,
+                    "max_wait_ms": round(client.max_wait * 1000, 2)
+                }
+            return {
+                "max_running": self.max_running,
+                "max_per_connection": self.max_per_connection,
+                "queue_size": self.queue_size,
+                "rate": self.rate,
+                "burst": self.burst,
+                "max_wait": self.max_wait,
+                "running": self.running,
+                "queued": sum(len(client.queue) for client in self._clients.values()),
+                "average_run_time_ms": round(self.average_run_time * 1000, 2),
+                "rate_limited_sources": len(self._buckets),
+                "forgotten_clients": self.forgotten_clients,
+                "clients": clients,
+                "connections": {
+                    connection_id: {"running": running, "queued": queued}
+                    for connection_id, (running, queued) in self._connections.items()
+                }
+            }
+
+
+def parse_weights(spec):
+    """
+    Parse client weights from "client=weight,client=weight".
+
+    Returns:
+        dict: Client ID -> weight
+    """
+    weights = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            client_id, weight = item.rsplit('=', 1)
+            weight = float(weight)
+            if weight <= 0:
+                raise ValueError(f"Client weight must be positive: {item}")
+            weights[client_id.strip()] = weight
+    return weights
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Multi-process server for MCP Server
+Runs several HTTP worker processes that share SSH sessions owned by broker
+processes, so request handling scales across cores
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5050] [--workers 4] [--brokers 2]
+
+Each connection ID always maps to the same broker. Workers accept
+connections from one shared listening socket.
+"""
+import os
+import sys
+import time
+import socket
+import signal
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from broker import run_broker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('serve')
+
+# How long to wait for brokers to start listening
+BROKER_START_TIMEOUT = 10
+
+# Processes are forked so workers inherit the listening socket
+context = multiprocessing.get_context('fork')
+
+
+def run_worker(listener, host, port, index):
+    """Serve HTTP requests from the shared listening socket."""
+    # Only the first worker pre-warms, so saved connections are warmed once
+    if index:
+        os.environ['MCP_PREWARM'] = ''
+    # A restarted worker keeps its index, and with it its audit log files
+    os.environ['MCP_WORKER_INDEX'] = str(index)
+
+    from werkzeug.serving import make_server
+    from app import app, init
+    init()
+
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving on {host}:{port}")
+    server.serve_forever()
+
+
+def wait_for_socket(path, process, timeout=BROKER_START_TIMEOUT):
+    """Wait until a broker accepts connections on its socket."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if not process.is_alive():
+            raise Exception(f"Broker for {path} exited with code {process.exitcode}")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            return
+        except OSError:
+            time.sleep(0.05)
+        finally:
+            probe.close()
+    raise Exception(f"Broker for {path} did not start within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the MCP SSH server with multiple processes")
+    parser.add_argument('--host', default=os.getenv('MCP_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MCP_PORT', 5050)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MCP_WORKERS', os.cpu_count() or 2)),
+                        help="HTTP worker processes")
+    parser.add_argument('--brokers', type=int, default=int(os.getenv('MCP_BROKERS', 1)),
+                        help="SSH broker processes; sessions are sharded across them")
+    parser.add_argument('--socket-dir', default=os.getenv('MCP_BROKER_DIR'),
+                        help="Directory for the broker sockets (default: a private temporary directory)")
+    args = parser.parse_args()
+
+    socket_dir = args.socket_dir or tempfile.mkdtemp(prefix='mcp-broker-')
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    paths = [os.path.join(socket_dir, f'broker-{index}.sock') for index in range(args.brokers)]
+
+    brokers = []
+    for path in paths:
+        process = context.Process(target=run_broker, args=(path,), name=f'broker-{len(brokers)}')
+        process.start()
+        brokers.append(process)
+    for path, process in zip(paths, brokers):
+        wait_for_socket(path, process)
+
+    # Workers find the brokers through the environment when app is imported
+    os.environ['MCP_BROKER_SOCKETS'] = ','.join(paths)
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+
+    def start_worker(index):
+        process = context.Process(target=run_worker, name=f'worker-{index}',
+                                  args=(listener, args.host, args.port, index))
+        process.start()
+        return process
+
+    workers = {index: start_worker(index) for index in range(args.workers)}
+    logger.info(f"Serving on {args.host}:{args.port} with {args.workers} worker(s) "
+                f"and {args.brokers} broker(s)")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while not stopping:
+            time.sleep(1)
+            for process in brokers:
+                if not process.is_alive():
+                    # Its sessions are gone and workers can't reach its shard
+                    logger.error(f"{process.name} exited with code {process.exitcode}; shutting down")
+                    stopping = True
+            for index, process in list(workers.items()):
+                if not stopping and not process.is_alive():
+                    logger.warning(f"Worker {index} exited with code {process.exitcode}; restarting")
+                    workers[index] = start_worker(index)
+    finally:
+        for process in list(workers.values()) + brokers:
+            if process.is_alive():
+                process.terminate()
+        for process in list(workers.values()) + brokers:
+            process.join(5)
+        listener.close()
+        if not args.socket_dir:
+            for path in paths:
+                if os.path.exists(path):
+                    os.unlink(path)
+            os.rmdir(socket_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
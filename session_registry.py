@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Session registry module for MCP Server
+Tracks live SSH sessions, closes idle ones and caps the number kept open
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRegistry:
+    """
+    Thread-safe mapping of connection IDs to SSHClient objects.
+
+    Behaves like the plain dict it replaces. Sessions are kept in
+    least-recently-used order; when there are more than max_sessions live
+    transports, or a session has been idle longer than its idle timeout, it
+    is closed and remembered as evicted. Looking up an evicted session
+    reconnects it transparently. Sessions with commands in flight, or leased
+    by a request that is about to use them, are never evicted.
+    """
+
+    def __init__(self, max_sessions=0, idle_timeout=0):
+        """
+        Initialize the registry.
+
+        Args:
+            max_sessions (int): Maximum number of live sessions (0 for no limit)
+            idle_timeout (int): Default seconds a session may be idle before it
+                is closed (0 to keep idle sessions open). Clients can override
+                this with their own idle_timeout.
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.evictions = 0
+        self.reconnects = 0
+        self._live = OrderedDict()
+        self._evicted = {}
+        self._reconnecting = {}
+        self._restoring = {}
+        # Connection ID -> number of requests using the session
+        self._leases = {}
+        self.restore_wait = 10
+        self.restored = 0
+        self.restore_failures = 0
+        self._store = None
+        # Held from snapshot to write, so saves land in the order they were taken
+        self._save_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._reaper = None
+
+    # dict interface
+
+    def __contains__(self, connection_id):
+        with self._lock:
+            return (connection_id in self._live or connection_id in self._evicted
+                    or connection_id in self._reconnecting or connection_id in self._restoring)
+
+    def _wait_restoring(self, connection_id):
+        """Wait briefly for a session that is being restored after a restart."""
+        with self._lock:
+            restoring = self._restoring.get(connection_id)
+        if restoring is not None and not restoring.wait(self.restore_wait):
+            raise KeyError(f"{connection_id} is still being restored")
+
+    def __getitem__(self, connection_id):
+        """Get a session, marking it used and reconnecting it if it was evicted."""
+        self._wait_restoring(connection_id)
+        while True:
+            with self._lock:
+                client = self._live.get(connection_id)
+                if client is not None:
+                    self._live.move_to_end(connection_id)
+                    client.last_used = time.time()
+                    return client
+
+                pending = self._reconnecting.get(connection_id)
+                if pending is None:
+                    client = self._evicted.pop(connection_id, None)
+                    if client is None:
+                        raise KeyError(connection_id)
+                    done = threading.Event()
+                    self._reconnecting[connection_id] = done
+                    break
+
+            # Another request is reconnecting this session; wait for it
+            pending.wait()
+
+        try:
+            logger.info(f"Reconnecting evicted session {connection_id}")
+            client.reconnect()
+            self.reconnects += 1
+        except Exception:
+            with self._lock:
+                self._evicted[connection_id] = client
+            raise
+        finally:
+            with self._lock:
+                self._reconnecting.pop(connection_id, None)
+            done.set()
+
+        self[connection_id] = client
+        return client
+
+    def lease(self, connection_id):
+        """
+        Get a session and keep it from being evicted until release_lease.
+
+        A session is otherwise only protected once a command channel is
+        open, so a request between looking up its client and starting its
+        command could see the session closed under it.
+
+        Returns:
+            SSHClient: The session, reconnected if it was evicted
+        """
+        while True:
+            client = self[connection_id]
+            with self._lock:
+                # Evicted again between the lookup and here; look it up again
+                if self._live.get(connection_id) is client:
+                    self._leases[connection_id] = self._leases.get(connection_id, 0) + 1
+                    return client
+
+    def release_lease(self, connection_id):
+        """Release a lease taken with lease."""
+        with self._lock:
+            count = self._leases.get(connection_id, 0) - 1
+            if count > 0:
+                self._leases[connection_id] = count
+            else:
+                self._leases.pop(connection_id, None)
+
+    def _in_use(self, connection_id, client):
+        """Check whether a session is leased or busy. Call with the lock held."""
+        return bool(self._leases.get(connection_id)) or client.is_busy()
+
+    def __setitem__(self, connection_id, client):
+        with self._lock:
+            self._evicted.pop(connection_id, None)
+            changed = self._live.get(connection_id) is not client
+            self._live[connection_id] = client
+            self._live.move_to_end(connection_id)
+        self._enforce_capacity()
+        if changed:
+            self.save()
+
+    def __delitem__(self, connection_id):
+        with self._lock:
+            if connection_id in self._live:
+                del self._live[connection_id]
+            elif connection_id in self._evicted:
+                del self._evicted[connection_id]
+            else:
+                raise KeyError(connection_id)
+        self.save()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live)
+
+    def get(self, connection_id, default=None):
+        try:
+            return self[connection_id]
+        except KeyError:
+            return default
+
+    def pop(self, connection_id, *default):
+        try:
+            self._wait_restoring(connection_id)
+        except KeyError:
+            pass
+        with self._lock:
+            client = self._live.pop(connection_id, None) or self._evicted.pop(connection_id, None)
+        if client is not None:
+            self.save()
+            return client
+        if default:
+            return default[0]
+        raise KeyError(connection_id)
+
+    def keys(self):
+        """Get the IDs of live sessions (a snapshot)."""
+        with self._lock:
+            return list(self._live.keys())
+
+    def values(self):
+        """Get the live sessions (a snapshot)."""
+        with self._lock:
+            return list(self._live.values())
+
+    def items(self):
+        """Get (connection ID, client) pairs of live sessions (a snapshot)."""
+        with self._lock:
+            return list(self._live.items())
+
+    # persistence
+
+    def attach_store(self, store):
+        """
+        Save sessions to a SessionStore whenever one is added or removed.
+
+        Args:
+            store (SessionStore): Where to save them
+        """
+        self._store = store
+
+    def save(self):
+        """Save the live and evicted sessions, if a store is attached."""
+        if self._store is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                clients = list(self._live.items()) + list(self._evicted.items())
+            try:
+                self._store.save(clients)
+            except Exception as e:
+                logger.error(f"Failed to save session state: {str(e)}")
+
+    def restore(self, factory, concurrency=8, wait=10):
+        """
+        Reconnect the sessions saved in the attached store, in the background.
+
+        Sessions keep their connection IDs. Until a session's reconnect has
+        finished, lookups wait up to `wait` seconds for it. A session that
+        fails to reconnect is kept as evicted, so it is retried on next use;
+        one whose secrets weren't saved is dropped.
+
+        Args:
+            factory (callable): Creates an unconnected client
+            concurrency (int): Maximum reconnects in parallel
+            wait (float): Seconds a lookup waits for a session being restored
+
+        Returns:
+            threading.Thread: The thread running the restore, or None if
+                there was nothing to restore
+        """
+        self.restore_wait = wait
+        pending = []
+        for entry in self._store.load() if self._store else []:
+            connection_id = entry.get('connection_id')
+            args = self._store.resolve(entry)
+            if args is None:
+                logger.warning(f"Not restoring {connection_id}: its credentials were not saved")
+                continue
+            with self._lock:
+                if connection_id in self:
+                    continue
+                self._restoring[connection_id] = threading.Event()
+            pending.append((connection_id, args))
+        if not pending:
+            return None
+
+        def restore_one(connection_id, args):
+            client = factory()
+            try:
+                client.connect(**args)
+            except Exception as e:
+                logger.warning(f"Failed to restore session {connection_id}: {str(e)}")
+                self.restore_failures += 1
+                with self._lock:
+                    if connection_id not in self._live:
+                        # connect() kept its arguments, so a lookup can reconnect it
+                        self._evicted[connection_id] = client
+                return
+            with self._lock:
+                taken = connection_id in self._live
+            if taken:
+                # Someone connected it while we were restoring
+                client.close()
+                return
+            self[connection_id] = client
+            self.restored += 1
+            logger.info(f"Restored session {connection_id}")
+
+        def run():
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='session-restore') as executor:
+                futures = {executor.submit(restore_one, connection_id, args): connection_id
+                           for connection_id, args in pending}
+                for future, connection_id in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Error restoring session {connection_id}: {str(e)}")
+                    finally:
+                        with self._lock:
+                            done = self._restoring.pop(connection_id, None)
+                        if done is not None:
+                            done.set()
+            logger.info(f"Restored {self.restored} of {len(pending)} saved session(s)")
+
+        logger.info(f"Restoring {len(pending)} saved session(s)")
+        thread = threading.Thread(target=run, name='session-restore', daemon=True)
+        thread.start()
+        return thread
+
+    # eviction
+
+    def _evict(self, connection_id, reason):
+        """
+        Move a live session to the evicted set. Call with the lock held, then
+        pass the result to _close_evicted after releasing it.
+        """
+        client = self._live.pop(connection_id)
+        self._evicted[connection_id] = client
+        # Lookups wait until the close has finished before reconnecting
+        self._reconnecting[connection_id] = threading.Event()
+        self.evictions += 1
+        logger.info(f"Evicting session {connection_id} ({reason})")
+        return connection_id, client
+
+    def _close_evicted(self, evicted):
+        """Close evicted sessions outside the lock."""
+        for connection_id, client in evicted:
+            try:
+                client.close()
+            except Exception as e:
+                logger.error(f"Error closing evicted session {connection_id}: {str(e)}")
+            with self._lock:
+                done = self._reconnecting.pop(connection_id, None)
+            if done is not None:
+                done.set()
+
+    def _enforce_capacity(self):
+        """Evict least recently used idle sessions while over capacity."""
+        to_close = []
+        with self._lock:
+            if self.max_sessions:
+                for connection_id, client in list(self._live.items()):
+                    if len(self._live) <= self.max_sessions:
+                        break
+                    if not self._in_use(connection_id, client):
+                        to_close.append(self._evict(connection_id, "capacity"))
+                if len(self._live) > self.max_sessions:
+                    logger.warning(f"{len(self._live)} live sessions exceed the limit of "
+                                   f"{self.max_sessions}; all are busy")
+        self._close_evicted(to_close)
+
+    def reap(self):
+        """
+        Close sessions that have been idle longer than their idle timeout.
+
+        Returns:
+            list: IDs of the evicted sessions
+        """
+        to_close = []
+        with self._lock:
+            for connection_id, client in list(self._live.items()):
+                timeout = client.idle_timeout if client.idle_timeout is not None else self.idle_timeout
+                if timeout and client.idle_seconds() > timeout and not self._in_use(connection_id, client):
+                    to_close.append(self._evict(connection_id, "idle"))
+        self._close_evicted(to_close)
+        return [connection_id for connection_id, _ in to_close]
+
+    def start_reaper(self, interval=30):
+        """Start a background thread that reaps idle sessions periodically."""
+        if self._reaper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reap()
+                except Exception as e:
+                    logger.error(f"Session reaper error: {str(e)}")
+
+        self._reaper = threading.Thread(target=run, name='session-reaper', daemon=True)
+        self._reaper.start()
+
+    def stats(self):
+        """
+        Get registry statistics.
+
+        Returns:
+            dict: Session counts, limits and eviction counters
+        """
+        with self._lock:
+            return {
+                "live": len(self._live),
+                "evicted": len(self._evicted),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+                "evictions": self.evictions,
+                "reconnects": self.reconnects,
+                "restoring": len(self._restoring),
+                "restored": self.restored,
+                "restore_failures": self.restore_failures
+            }
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Session state module for MCP Server
+Saves the connection parameters of live sessions so they can be restored
+after a restart, without writing secrets to disk
+"""
+import os
+import json
+import logging
+import tempfile
+import threading
+from mcp_loader import load_mcp_config
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+# Connect arguments that hold secrets and are never written
+SECRET_FIELDS = ('password', 'key_passphrase')
+
+# Credential references: where a session's secrets come from on restore
+CREDENTIALS_NONE = None            # key file, agent or default keys
+CREDENTIALS_MCP_CONFIG = 'mcp_config'
+CREDENTIALS_UNAVAILABLE = 'unavailable'
+
+
+class SessionStore:
+    """
+    JSON state file of the sessions in a SessionRegistry.
+
+    Each session is saved as its connection ID and connect arguments minus
+    passwords and key passphrases. Instead, a credential reference records
+    where the secrets can be found again: nowhere needed (keys and agent),
+    the MCP config file (for the auto-connect host), or unavailable, in
+    which case the session is not restored.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize the store.
+
+        Args:
+            path (str): Path of the state file
+        """
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    def credential_reference(self, args, settings):
+        """
+        Decide how a session's secrets can be found again.
+
+        Args:
+            args (dict): The session's connect arguments
+            settings (dict): MCP config settings, from load_mcp_config
+
+        Returns:
+            str: One of the CREDENTIALS_* references
+        """
+        hops = [hop for hop in args.get('jump_hosts') or [] if isinstance(hop, dict)]
+        if any(hop.get(field) for hop in hops for field in SECRET_FIELDS):
+            return CREDENTIALS_UNAVAILABLE
+        if not any(args.get(field) for field in SECRET_FIELDS):
+            return CREDENTIALS_NONE
+
+        if (settings and settings.get('host') == args.get('hostname')
+                and settings.get('username') == args.get('username')
+                and all((args.get(field) or '') == (settings.get(field) or '') for field in SECRET_FIELDS)):
+            return CREDENTIALS_MCP_CONFIG
+        return CREDENTIALS_UNAVAILABLE
+
+    def resolve(self, entry):
+        """
+        Rebuild the connect arguments of a saved session.
+
+        Args:
+            entry (dict): A saved session
+
+        Returns:
+            dict: Connect arguments, or None if its secrets are unavailable
+        """
+        args = dict(entry['connect_args'])
+        reference = entry.get('credentials')
+        if reference == CREDENTIALS_MCP_CONFIG:
+            settings = load_mcp_config()
+            for field in SECRET_FIELDS:
+                args[field] = settings.get(field) or None
+        elif reference is not CREDENTIALS_NONE:
+            return None
+        return args
+
+    def save(self, clients):
+        """
+        Write the sessions to the state file, replacing it atomically.
+
+        Args:
+            clients (list): (connection ID, SSHClient) pairs
+        """
+        sessions = []
+        settings = None
+        for connection_id, client in clients:
+            args = getattr(client, '_connect_args', None)
+            if not args:
+                continue
+            saved = {key: value for key, value in args.items() if key not in SECRET_FIELDS}
+            if saved.get('jump_hosts'):
+                saved['jump_hosts'] = [
+                    {key: value for key, value in hop.items() if key not in SECRET_FIELDS}
+                    if isinstance(hop, dict) else hop
+                    for hop in saved['jump_hosts']
+                ]
+            if settings is None and any(args.get(field) for field in SECRET_FIELDS):
+                # Read once per save, and only if some session needs it
+                settings = load_mcp_config()
+            sessions.append({
+                "connection_id": connection_id,
+                "connect_args": saved,
+                "credentials": self.credential_reference(args, settings)
+            })
+
+        data = json.dumps({"version": STATE_VERSION, "sessions": sessions}, indent=2)
+        directory = os.path.dirname(self.path) or '.'
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.sessions-')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(data)
+                os.replace(temp_path, self.path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
+
+    def load(self):
+        """
+        Read the saved sessions.
+
+        Returns:
+            list: Saved session entries, empty if there is no usable state file
+        """
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable session state {self.path}: {str(e)}")
+            return []
+        if data.get('version') != STATE_VERSION:
+            logger.warning(f"Ignoring session state {self.path} with version {data.get('version')}")
+            return []
+        return data.get('sessions', [])
@@ -4,11 +4,24 @@ SSH Client module for MCP Server
 Handles SSH connections to remote servers
 """
 import paramiko
-import os
+import codecs
+import time
+import select
+import socket
 import logging
+import weakref
+import threading
+from key_manager import key_manager
+from tuning import get_profile, transport_factory
 
 logger = logging.getLogger(__name__)
 
+# Size of each read from a command channel
+CHUNK_SIZE = 32768
+
+# How long to wait for channel activity before re-checking its state
+POLL_INTERVAL = 1.0
+
 class SSHClient:
     """Class to handle SSH connections and commands."""
     
@@ -17,8 +30,22 @@ class SSHClient:
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self.connected = False
+        self.idle_timeout = None
+        self.profile = None
+        self.last_used = time.time()
+        self.jump_chain = None
+        self._connect_args = None
+        self._channels = weakref.WeakSet()
+        self._close_callbacks = []
+        # IDs of port forwards using this session
+        self.forwards = set()
+        # Command output received and stdin sent over this client's lifetime
+        self.bytes_received = 0
+        self.bytes_sent = 0
     
-    def connect(self, hostname, port, username, password=None, key_path=None):
+    def connect(self, hostname, port, username, password=None, key_path=None,
+                key_passphrase=None, use_agent=True, idle_timeout=None,
+                jump_hosts=None, profile=None, sock=None):
         """
         Connect to a remote server via SSH.
         
@@ -27,40 +54,91 @@ class SSHClient:
             port (int): The SSH port (default 22)
             username (str): The username to authenticate with
             password (str, optional): The password for authentication
-            key_path (str, optional): Path to private key file
+            key_path (str, optional): Path to private key file (RSA, ECDSA
+                or Ed25519)
+            key_passphrase (str, optional): Passphrase for an encrypted key
+            use_agent (bool): Also try keys from a local ssh-agent
+            idle_timeout (int, optional): Seconds this session may sit idle
+                before the server closes it (it reconnects on next use)
+            jump_hosts (list, optional): Jump hosts to tunnel through, in
+                order, as dicts or "user@host:port" strings. Strings use this
+                connection's key and agent settings.
+            profile (str, optional): Name of the transport tuning profile
+                (see tuning.PROFILES)
+            sock (optional): An open socket or channel to run the SSH
+                session over instead of a new TCP connection
             
         Raises:
             Exception: If connection fails
         """
+        # Remembered so an idle session can be closed and reconnected later
+        self._connect_args = {
+            'hostname': hostname,
+            'port': port,
+            'username': username,
+            'password': password,
+            'key_path': key_path,
+            'key_passphrase': key_passphrase,
+            'use_agent': use_agent,
+            'idle_timeout': idle_timeout,
+            'jump_hosts': jump_hosts,
+            'profile': profile
+        }
+        self.idle_timeout = idle_timeout
+        self.profile = profile
+        self.jump_chain = None
+        
         try:
+            factory = transport_factory(profile)
+            
             # Authentication options
-            auth_args = {}
+            auth_args = {'allow_agent': use_agent and key_manager.agent_available()}
             
             if password:
                 auth_args['password'] = password
                 logger.info(f"Using password authentication for {username}@{hostname}")
                 
-            elif key_path and os.path.isfile(key_path):
+            elif key_path:
                 try:
-                    private_key = paramiko.RSAKey.from_private_key_file(key_path)
-                    auth_args['pkey'] = private_key
+                    auth_args['pkey'] = key_manager.load_key(key_path, key_passphrase)
+                    # The given key replaces the default ~/.ssh key search
+                    auth_args['look_for_keys'] = False
                     logger.info(f"Using key authentication for {username}@{hostname}")
                 except Exception as e:
                     logger.error(f"Failed to load private key: {str(e)}")
                     raise Exception(f"Failed to load private key: {str(e)}")
             
+            elif auth_args['allow_agent']:
+                logger.info(f"Using ssh-agent authentication for {username}@{hostname}")
+            
+            if jump_hosts:
+                chain = [parse_jump_host(spec, self._connect_args) for spec in jump_hosts]
+                sock = bastion_pool.open_channel(chain, hostname, port)
+                self.jump_chain = chain
+            
             # Connect to the server
-            self.client.connect(
-                hostname=hostname,
-                port=port,
-                username=username,
-                **auth_args,
-                timeout=10
-            )
+            try:
+                self.client.connect(
+                    hostname=hostname,
+                    port=port,
+                    username=username,
+                    **auth_args,
+                    sock=sock,
+                    timeout=10,
+                    compress=get_profile(profile)['compress'],
+                    transport_factory=factory
+                )
+            except Exception:
+                if self.jump_chain:
+                    bastion_pool.release(self.jump_chain)
+                    self.jump_chain = None
+                raise
             
             self.connected = True
             self.hostname = hostname
+            self.port = port
             self.username = username
+            self.last_used = time.time()
             
             logger.info(f"Successfully connected to {username}@{hostname}:{port}")
             
@@ -68,10 +146,134 @@ class SSHClient:
             logger.error(f"SSH connection error: {str(e)}")
             raise Exception(f"Connection failed: {str(e)}")
     
+    def open_command(self, command):
+        """
+        Start a command on the remote server without reading its output.
+        
+        Args:
+            command (str): The command to execute
+            
+        Returns:
+            paramiko.Channel: The channel the command is running on
+            
+        Raises:
+            Exception: If the command cannot be started
+        """
+        if not self.connected:
+            raise Exception("Not connected to any server")
+        
+        try:
+            channel = self.client.get_transport().open_session()
+            self._channels.add(channel)
+            self.last_used = time.time()
+            channel.exec_command(command)
+            return channel
+        except Exception as e:
+            logger.error(f"Failed to start command: {str(e)}")
+            raise Exception(f"Failed to start command: {str(e)}")
+    
+    def iter_channel_output(self, channel, chunk_size=CHUNK_SIZE):
+        """
+        Read a command's output from its channel as it arrives.
+        
+        Chunks are yielded as the raw bytes received from the channel, with no
+        decoding. The channel is closed when the generator finishes or is
+        closed early, which stops the remote command from producing more output.
+        
+        Args:
+            channel (paramiko.Channel): Channel returned by open_command
+            chunk_size (int): Maximum size of each chunk
+            
+        Yields:
+            tuple: ('stdout', bytes) and ('stderr', bytes) chunks, followed by
+                a final ('exit', int) with the exit status (-1 if unknown)
+        """
+        stdout_open = True
+        stderr_open = True
+        
+        try:
+            while stdout_open or stderr_open:
+                # The channel's pipe fires for both stdout and stderr data
+                select.select([channel], [], [], POLL_INTERVAL)
+                finished = channel.eof_received or channel.closed
+                
+                if stdout_open and (channel.recv_ready() or finished):
+                    data = channel.recv(chunk_size)
+                    if data:
+                        self.bytes_received += len(data)
+                        yield 'stdout', data
+                    else:
+                        stdout_open = False
+                
+                if stderr_open and (channel.recv_stderr_ready() or finished):
+                    data = channel.recv_stderr(chunk_size)
+                    if data:
+                        self.bytes_received += len(data)
+                        yield 'stderr', data
+                    else:
+                        stderr_open = False
+            
+            yield 'exit', channel.recv_exit_status()
+        
+        finally:
+            channel.close()
+            self.last_used = time.time()
+    
+    def write_stdin(self, channel, stream, chunk_size=CHUNK_SIZE):
+        """
+        Copy a stream into a command's stdin, then close stdin.
+
+        Data is sent a chunk at a time. Sending blocks while the remote
+        side's SSH window is full, so a slow command slows down reading from
+        the stream instead of data piling up in memory.
+
+        Args:
+            channel (paramiko.Channel): Channel returned by open_command
+            stream (file-like): Binary stream to read until EOF
+            chunk_size (int): Maximum size of each read
+
+        Returns:
+            int: Number of bytes sent
+
+        Raises:
+            OSError: If the command closed its channel before reading everything
+        """
+        sent = 0
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            channel.sendall(data)
+            sent += len(data)
+            self.bytes_sent += len(data)
+            self.last_used = time.time()
+        channel.shutdown_write()
+        return sent
+
+    def iter_command_output(self, command, chunk_size=CHUNK_SIZE):
+        """
+        Execute a command and read its raw output as it arrives.
+        
+        Args:
+            command (str): The command to execute
+            chunk_size (int): Maximum size of each chunk
+            
+        Yields:
+            tuple: (stream, data) pairs as described in iter_channel_output
+            
+        Raises:
+            Exception: If command execution fails
+        """
+        channel = self.open_command(command)
+        yield from self.iter_channel_output(channel, chunk_size)
+    
     def execute_command(self, command):
         """
         Execute a command on the remote server.
         
+        Output is decoded incrementally as UTF-8; invalid bytes are replaced
+        rather than failing the whole command.
+        
         Args:
             command (str): The command to execute
             
@@ -81,15 +283,21 @@ class SSHClient:
         Raises:
             Exception: If command execution fails
         """
-        if not self.connected:
-            raise Exception("Not connected to any server")
+        decoders = {
+            'stdout': codecs.getincrementaldecoder('utf-8')(errors='replace'),
+            'stderr': codecs.getincrementaldecoder('utf-8')(errors='replace')
+        }
+        output = {'stdout': [], 'stderr': []}
         
         try:
-            stdin, stdout, stderr = self.client.exec_command(command)
-            stdout_str = stdout.read().decode('utf-8')
-            stderr_str = stderr.read().decode('utf-8')
+            for stream, data in self.iter_command_output(command):
+                if stream in output:
+                    output[stream].append(decoders[stream].decode(data))
             
-            return stdout_str, stderr_str
+            for stream, decoder in decoders.items():
+                output[stream].append(decoder.decode(b'', final=True))
+            
+            return ''.join(output['stdout']), ''.join(output['stderr'])
             
         except Exception as e:
             logger.error(f"Command execution error: {str(e)}")
@@ -132,9 +340,305 @@ class SSHClient:
             self.connected = False
             return False
             
+    def is_busy(self):
+        """
+        Check if the client has commands in flight or open port forwards.
+        
+        Returns:
+            bool: True if any command channel or port forward is open
+        """
+        if self.forwards:
+            return True
+        return any(not channel.closed for channel in list(self._channels))
+    
+    def idle_seconds(self):
+        """
+        Get how long the client has been idle.
+        
+        Returns:
+            float: Seconds since the client was last used
+        """
+        return time.time() - self.last_used
+
+    def transport_info(self):
+        """
+        Describe the negotiated transport settings.
+
+        Returns:
+            dict: Tuning profile, cipher, MAC, compression and window sizes,
+                or None if not connected
+        """
+        transport = self.client.get_transport() if self.connected else None
+        if transport is None:
+            return None
+        return {
+            "profile": self.profile or "default",
+            "cipher": transport.local_cipher,
+            "mac": transport.local_mac,
+            "compression": transport.local_compression,
+            "window_size": transport.default_window_size,
+            "max_packet_size": transport.default_max_packet_size
+        }
+
+    def resources(self):
+        """
+        Describe what this session holds on to, for diagnostics.
+
+        Returns:
+            dict: Transport thread, socket file descriptor, open channels
+                with the bytes buffered in each, and bytes transferred
+        """
+        transport = self.client.get_transport() if self.connected else None
+        info = {
+            "connected": self.is_connected(),
+            "idle_seconds": round(time.time() - self.last_used, 1),
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "forwards": len(self.forwards),
+            "jump_hosts": len(self.jump_chain or []),
+            "transport_thread": None,
+            "fd": None,
+            "channels": [],
+            "buffered_bytes": 0
+        }
+        if transport is None:
+            return info
+
+        info["transport_thread"] = {
+            "name": transport.name,
+            "ident": transport.ident,
+            "alive": transport.is_alive()
+        }
+        # Behind a jump host the transport runs over a channel, not a socket
+        if isinstance(transport.sock, socket.socket):
+            info["fd"] = transport.sock.fileno()
+
+        # Every channel on the transport, including SFTP and forwarding
+        # channels this client didn't open itself
+        for channel in transport._channels.values():
+            buffered = len(channel.in_buffer) + len(channel.in_stderr_buffer)
+            info["channels"].append({
+                "id": channel.get_id(),
+                "closed": channel.closed,
+                "eof_received": channel.eof_received,
+                "buffered_bytes": buffered,
+                "in_window": channel.in_window_size,
+                "out_window": channel.out_window_size
+            })
+            info["buffered_bytes"] += buffered
+        return info
+
+    def reconnect(self):
+        """
+        Reconnect using the arguments of the last connect call.
+        
+        Raises:
+            Exception: If the client was never connected or reconnecting fails
+        """
+        if self._connect_args is None:
+            raise Exception("Cannot reconnect a client that was never connected")
+        
+        self.close()
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.connect(**self._connect_args)
+    
+    def add_close_callback(self, callback):
+        """
+        Register a function to call the next time the connection is closed.
+        
+        Callbacks are called once and also run when the client reconnects,
+        since anything tied to the old transport is gone.
+        
+        Args:
+            callback (callable): Called with no arguments
+        """
+        self._close_callbacks.append(callback)
+    
     def close(self):
         """Close the SSH connection."""
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Close callback error: {str(e)}")
+        
         if self.connected:
             self.client.close()
             self.connected = False
             logger.info(f"Disconnected from {self.username}@{self.hostname}")
+        if self.jump_chain:
+            bastion_pool.release(self.jump_chain)
+            self.jump_chain = None
+
+
+def parse_jump_host(spec, defaults=None):
+    """
+    Normalize a jump host specification.
+    
+    Args:
+        spec (dict or str): A dict with hostname, port, username and optional
+            credentials, or a "user@host:port" string
+        defaults (dict, optional): Connect arguments of the target connection;
+            their key_path, key_passphrase and use_agent are used for string specs
+            
+    Returns:
+        dict: Jump host connect arguments
+        
+    Raises:
+        Exception: If the specification is invalid
+    """
+    if isinstance(spec, str):
+        username, _, address = spec.strip().rpartition('@')
+        hostname, _, port = address.partition(':')
+        defaults = defaults or {}
+        spec = {
+            'hostname': hostname,
+            'port': port,
+            'username': username or defaults.get('username'),
+            'key_path': defaults.get('key_path'),
+            'key_passphrase': defaults.get('key_passphrase'),
+            'use_agent': defaults.get('use_agent', True)
+        }
+    
+    if not spec.get('hostname') or not spec.get('username'):
+        raise Exception(f"Invalid jump host: {spec}")
+    
+    return {
+        'hostname': spec['hostname'],
+        'port': int(spec.get('port') or 22),
+        'username': spec['username'],
+        'password': spec.get('password'),
+        'key_path': spec.get('key_path'),
+        'key_passphrase': spec.get('key_passphrase'),
+        'use_agent': spec.get('use_agent', True)
+    }
+
+
+class BastionPool:
+    """
+    Shared transports to jump hosts.
+    
+    Every connection through the same chain of jump hosts reuses one SSH
+    session per hop, so reaching many internal hosts costs one handshake per
+    bastion plus a cheap direct-tcpip channel per target. Hops are reference
+    counted and closed when the last connection through them is closed.
+    """
+    
+    def __init__(self):
+        """Initialize an empty pool."""
+        self._hops = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _hop_keys(chain):
+        """Get the pool key of each hop: the chain of addresses leading to it."""
+        keys = []
+        path = ()
+        for hop in chain:
+            path = path + ((hop['username'], hop['hostname'], hop['port']),)
+            keys.append(path)
+        return keys
+    
+    def _acquire_hop(self, key, hop, via):
+        """Get (or connect) the client for one hop and take a reference to it."""
+        with self._lock:
+            entry = self._hops.get(key)
+            if entry is None:
+                entry = {'client': None, 'refs': 0, 'lock': threading.Lock()}
+                self._hops[key] = entry
+            entry['refs'] += 1
+        
+        try:
+            # Only one thread performs the handshake for a hop
+            with entry['lock']:
+                client = entry['client']
+                if client is None or not client.is_connected():
+                    sock = None
+                    if via is not None:
+                        sock = via.client.get_transport().open_channel(
+                            'direct-tcpip', (hop['hostname'], hop['port']), ('127.0.0.1', 0))
+                    client = SSHClient()
+                    client.connect(sock=sock, **hop)
+                    client.client.get_transport().set_keepalive(30)
+                    entry['client'] = client
+                    logger.info(f"Opened jump host session to {hop['username']}@{hop['hostname']}:{hop['port']}")
+            return client
+        except Exception:
+            self._release_hop(key)
+            raise
+    
+    def _release_hop(self, key):
+        """Drop a reference to a hop, closing it when unused."""
+        with self._lock:
+            entry = self._hops.get(key)
+            if entry is None:
+                return
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return
+            del self._hops[key]
+        if entry['client'] is not None:
+            entry['client'].close()
+    
+    def open_channel(self, chain, hostname, port):
+        """
+        Open a direct-tcpip channel to a target through a chain of jump hosts.
+        
+        Takes a reference to every hop; call release with the same chain
+        when the connection over the channel is closed.
+        
+        Args:
+            chain (list): Jump host dicts from parse_jump_host
+            hostname (str): Target hostname as seen from the last jump host
+            port (int): Target port
+            
+        Returns:
+            paramiko.Channel: A channel connected to the target
+            
+        Raises:
+            Exception: If a jump host can't be reached
+        """
+        acquired = []
+        try:
+            via = None
+            for key, hop in zip(self._hop_keys(chain), chain):
+                via = self._acquire_hop(key, hop, via)
+                acquired.append(key)
+            return via.client.get_transport().open_channel(
+                'direct-tcpip', (hostname, int(port)), ('127.0.0.1', 0))
+        except Exception as e:
+            for key in reversed(acquired):
+                self._release_hop(key)
+            raise Exception(f"Jump host connection failed: {str(e)}")
+    
+    def release(self, chain):
+        """
+        Release the references taken by open_channel.
+        
+        Args:
+            chain (list): The chain passed to open_channel
+        """
+        for key in reversed(self._hop_keys(chain)):
+            self._release_hop(key)
+    
+    def stats(self):
+        """
+        Get the open jump host sessions.
+        
+        Returns:
+            list: One dict per hop with its address and reference count
+        """
+        with self._lock:
+            return [
+                {
+                    "hop": " -> ".join(f"{user}@{host}:{port}" for user, host, port in key),
+                    "references": entry['refs']
+                }
+                for key, entry in self._hops.items()
+            ]
+
+
+# Shared by all SSH clients in the process
+bastion_pool = BastionPool()
@@ -0,0 +1,133 @@
+"""Tests for batched /ssh requests: references, ordering and skipped dependents."""
+import threading
+
+import pytest
+from flask import jsonify
+
+import app
+from app import resolve_references, batch_references, BatchReferenceError
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """Replace the operations with fakes that echo their parameters."""
+    calls = []
+    lock = threading.Lock()
+
+    def dispatch(params):
+        with lock:
+            calls.append(params)
+        if params.get('fail'):
+            return jsonify({"status": "error", "message": "failed"}), params['fail']
+        return jsonify({"status": "ok", "connection_id": f"conn-{params.get('n')}",
+                        "output": ["first", "second"], "params": params})
+
+    monkeypatch.setattr(app, 'dispatch_operation', dispatch)
+    return calls
+
+
+def test_batch_references():
+    data = {"operation": "execute", "connection_id": {"$ref": "c1.connection_id"},
+            "env": [{"$ref": "c2"}], "literal": {"$ref": "x", "other": 1}}
+    # An object with other keys beside $ref is not a reference
+    assert sorted(batch_references(data)) == ['c1', 'c2']
+
+
+def test_resolve_references():
+    results = {"c1": {"connection_id": "u@h:22", "output": ["a", "b"]}}
+    assert resolve_references({"id": {"$ref": "c1.connection_id"}, "line": [{"$ref": "c1.output.1"}]},
+                              results) == {"id": "u@h:22", "line": ["b"]}
+    assert resolve_references({"$ref": "c1"}, results) is results["c1"]
+    for ref in ("c1.missing", "c1.output.5", "c1.output.x", "c1.connection_id.0.0"):
+        with pytest.raises(BatchReferenceError):
+            resolve_references({"$ref": ref}, results)
+
+
+def test_batch_runs_operations_with_resolved_references(client, dispatched):
+    response = client.post('/ssh', json=[
+        {"id": "c1", "operation": "connect", "n": 1},
+        {"id": "e1", "operation": "execute", "connection_id": {"$ref": "c1.connection_id"},
+         "after": ["c1"]},
+        {"id": 3, "operation": "execute", "line": {"$ref": "c1.output.0"}},
+    ])
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [result['id'] for result in results] == ['c1', 'e1', 3]
+    assert [result['status_code'] for result in results] == [200, 200, 200]
+    assert results[1]['params'] == {"operation": "execute", "connection_id": "conn-1"}
+    assert results[2]['params']['line'] == 'first'
+
+
+def test_dependents_of_a_failed_operation_are_skipped(client, dispatched):
+    results = client.post('/ssh', json=[
+        {"id": "c1", "operation": "connect", "fail": 401},
+        {"id": "e1", "operation": "execute", "connection_id": {"$ref": "c1.connection_id"}},
+        {"id": "e2", "operation": "execute", "after": "e1"},
+        {"id": "e3", "operation": "execute"},
+    ]).get_json()
+    assert [result['status_code'] for result in results] == [401, 424, 424, 200]
+    assert results[1]['message'] == "Skipped: operation c1 failed"
+    assert results[2]['message'] == "Skipped: operation e1 failed"
+    assert [params['operation'] for params in dispatched] == ['connect', 'execute']
+
+
+def test_unresolvable_reference_fails_only_its_operation(client, dispatched):
+    results = client.post('/ssh', json=[
+        {"id": "c1", "operation": "connect"},
+        {"id": "e1", "operation": "execute", "connection_id": {"$ref": "c1.nope"}},
+    ]).get_json()
+    assert [result['status_code'] for result in results] == [200, 400]
+    assert 'c1.nope' in results[1]['message']
+
+
+def test_dependencies_wait_for_earlier_operations(client, monkeypatch):
+    independent_done = threading.Event()
+    order = []
+
+    def dispatch(params):
+        # The slow operation can't finish before the independent one, and
+        # its dependent must still wait for it
+        if params['operation'] == 'slow':
+            independent_done.wait(5)
+        order.append(params['operation'])
+        if params['operation'] == 'independent':
+            independent_done.set()
+        return jsonify({"status": "ok"})
+
+    monkeypatch.setattr(app, 'dispatch_operation', dispatch)
+    monkeypatch.setattr(app, 'BATCH_CONCURRENCY', 3)
+    results = client.post('/ssh', json=[
+        {"id": "a", "operation": "slow"},
+        {"id": "b", "operation": "dependent", "after": ["a"]},
+        {"id": "c", "operation": "independent"},
+    ]).get_json()
+    assert [result['status_code'] for result in results] == [200, 200, 200]
+    assert order == ['independent', 'slow', 'dependent']
+
+
+@pytest.mark.parametrize('operations, message', [
+    ([{"operation": "connect"}], "must be an object with an id"),
+    (["connect"], "must be an object with an id"),
+    ([{"id": "a"}, {"id": "a"}], "Duplicate operation id: a"),
+    ([{"id": "a", "after": ["b"]}, {"id": "b"}], "which must be earlier in the batch"),
+    ([{"id": "a", "x": {"$ref": "a.y"}}], "which must be earlier in the batch"),
+    ([{"id": "a", "operation": "search"}], "can't be batched"),
+    ([{"id": "a", "operation": "execute", "mode": "stream"}], "can't be batched"),
+])
+def test_invalid_batches_are_rejected(client, dispatched, operations, message):
+    response = client.post('/ssh', json=operations)
+    assert response.status_code == 400
+    assert message in response.get_json()['message']
+    assert dispatched == []
+
+
+def test_batch_size_limit(client, dispatched, monkeypatch):
+    monkeypatch.setattr(app, 'MAX_BATCH_SIZE', 2)
+    response = client.post('/ssh', json=[{"id": i} for i in range(3)])
+    assert response.status_code == 400
+    assert client.post('/ssh', json=[]).get_json() == []
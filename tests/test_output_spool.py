@@ -0,0 +1,138 @@
+"""Tests for spooled command output: byte ranges, line ranges and the sparse line index."""
+import os
+import random
+
+import pytest
+
+import output_spool
+from output_spool import SpoolManager, SpooledStream, SpoolNotFound, _nth_newline, LINE_INDEX_STEP
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = SpoolManager(directory=str(tmp_path), threshold=16, page_size=8, max_page_size=32)
+    yield manager
+    manager.close()
+
+
+def capture(manager, stdout, stderr=b'', exit_status=0):
+    chunks = [('stdout', stdout[i:i + 5]) for i in range(0, len(stdout), 5)]
+    chunks += [('stderr', stderr), ('exit', exit_status)]
+    return manager.capture(chunks)
+
+
+def expected_lines(data):
+    """Split like the spool does: a trailing newline doesn't start another line."""
+    return data.splitlines(keepends=True)
+
+
+def test_small_output_is_not_registered(manager):
+    spool = capture(manager, b'short')
+    assert not spool.paged
+    assert spool.text() == ('short', '')
+    with pytest.raises(SpoolNotFound):
+        manager.read(spool.spool_id)
+
+
+def test_byte_ranges(manager):
+    data = bytes(range(48, 48 + 40))
+    spool = capture(manager, data, exit_status=3)
+    assert spool.spilled and spool.exit_status == 3
+
+    page = manager.read(spool.spool_id)
+    assert (page['offset'], page['data'], page['next_offset']) == (0, data[:8].decode(), 8)
+    page = manager.read(spool.spool_id, offset=36, length=8)
+    assert (page['data'], page['next_offset'], page['size']) == (data[36:].decode(), None, 40)
+    assert manager.read_bytes(spool.spool_id, offset=100) == b''
+
+
+def test_length_is_capped_at_max_page_size(manager):
+    spool = capture(manager, b'x' * 100)
+    assert len(manager.read_bytes(spool.spool_id, length=10 ** 12)) == 32
+    page = manager.read(spool.spool_id, start_line=0, line_count=1)
+    assert (len(page['data']), page['next_offset']) == (32, 32)
+
+
+@pytest.mark.parametrize('args', [{'offset': -1}, {'length': -1}, {'stream': 'stdin'}])
+def test_invalid_ranges_are_rejected(manager, args):
+    spool = capture(manager, b'x' * 100)
+    with pytest.raises(ValueError):
+        manager.read(spool.spool_id, **args)
+
+
+def test_unknown_spool(manager):
+    with pytest.raises(SpoolNotFound):
+        manager.read('missing')
+
+
+def test_multibyte_character_is_not_split(manager):
+    data = 'aaaaaaaébbbbbbbbbbbb'.encode('utf-8')
+    spool = capture(manager, data)
+    page = manager.read(spool.spool_id, length=8)
+    assert (page['data'], page['next_offset']) == ('aaaaaaa', 7)
+    page = manager.read(spool.spool_id, offset=7, length=8)
+    assert page['data'].startswith('é')
+
+
+def test_line_ranges(manager):
+    data = b'zero\none\ntwo\nthree\nfour'
+    spool = capture(manager, data)
+    assert spool.streams['stdout'].line_count() == 5
+    assert manager.read(spool.spool_id, start_line=1, line_count=2)['data'] == 'one\ntwo\n'
+    assert manager.read(spool.spool_id, start_line=4, line_count=10)['data'] == 'four'
+    page = manager.read(spool.spool_id, start_line=9, line_count=1)
+    assert (page['data'], page['offset']) == ('', len(data))
+
+
+def test_trailing_newline_does_not_add_a_line(tmp_path):
+    for data, count in [(b'', 0), (b'\n', 1), (b'a\n', 1), (b'a\nb', 2), (b'\n\n', 2)]:
+        stream = SpooledStream('stdout', str(tmp_path), 'test')
+        stream.write(data)
+        stream.finish()
+        assert stream.line_count() == count, data
+
+
+@pytest.mark.parametrize('spilled', [False, True])
+def test_sparse_index_matches_a_full_split(tmp_path, monkeypatch, spilled):
+    # Small blocks so index entries fall at every position within a block
+    monkeypatch.setattr(output_spool, 'INDEX_BLOCK_SIZE', 997)
+    rng = random.Random(1)
+    lines = [b'x' * rng.choice([0, 1, 3, 40, 2000]) + b'\n' for _ in range(3 * LINE_INDEX_STEP + 17)]
+    data = b''.join(lines) + b'tail'
+
+    stream = SpooledStream('stdout', str(tmp_path), 'test')
+    if spilled:
+        stream.spill()
+    for i in range(0, len(data), 4096):
+        stream.write(data[i:i + 4096])
+    stream.finish()
+
+    expected = expected_lines(data)
+    assert stream.line_count() == len(expected)
+    offsets = [0]
+    for line in expected:
+        offsets.append(offsets[-1] + len(line))
+    for start in [0, 1, LINE_INDEX_STEP - 1, LINE_INDEX_STEP, LINE_INDEX_STEP + 1,
+                  2 * LINE_INDEX_STEP + 5, len(expected) - 1]:
+        offset, length = stream.line_range(start, 3)
+        assert offset == offsets[start]
+        assert stream.read(offset, length) == b''.join(expected[start:start + 3])
+    stream.close()
+
+
+def test_indexing_a_deleted_spool_fails(tmp_path):
+    stream = SpooledStream('stdout', str(tmp_path), 'test')
+    stream.spill()
+    stream.write(b'a\nb\n')
+    stream.finish()
+    os.remove(stream.path)
+    with pytest.raises(FileNotFoundError):
+        stream.index_lines()
+
+
+@pytest.mark.parametrize('n', [1, 2, 5, 63, 64, 65, 500])
+def test_nth_newline(n):
+    data = b''.join(b'y' * (i % 7) + b'\n' for i in range(600))
+    positions = [i for i, byte in enumerate(data) if byte == ord('\n')]
+    assert _nth_newline(data, n) == positions[n - 1]
+    assert _nth_newline(data, n, positions[9] + 1) == positions[9 + n]
@@ -0,0 +1,125 @@
+"""Tests for remote_search: command building, cursors and output parsing."""
+import json
+import shlex
+
+import pytest
+
+from remote_search import (search_command, search_key, encode_cursor, decode_cursor,
+                           iter_search_results, MAX_LINE_LENGTH)
+
+
+def rg_match(path, line, text):
+    return json.dumps({"type": "match", "data": {
+        "path": {"text": path},
+        "lines": {"text": text + "\n"},
+        "line_number": line,
+        "submatches": [{"start": 0, "end": 3}]
+    }}).encode('utf-8')
+
+
+def output(tool, lines, exit_status=0, chunk_size=7):
+    """Command output as (stream, data) chunks, split at arbitrary points."""
+    data = b'\n'.join([tool.encode('ascii')] + lines) + b'\n'
+    for start in range(0, len(data), chunk_size):
+        yield 'stdout', data[start:start + chunk_size]
+    yield 'exit', exit_status
+
+
+def test_search_command_rejects_unknown_tool():
+    with pytest.raises(ValueError):
+        search_command('x', tool='ack')
+
+
+@pytest.mark.parametrize('args', [
+    {'pattern': ['x']},
+    {'pattern': 'x', 'path': 1},
+    {'pattern': 'x', 'glob': {'a': 1}},
+])
+def test_search_command_rejects_non_string_arguments(args):
+    with pytest.raises(ValueError):
+        search_command(**args)
+
+
+def test_search_command_keeps_dash_paths_from_being_options():
+    command = search_command('x', path='-delete', tool='grep')
+    assert shlex.split(command.split(';', 1)[1])[:2] == ['find', './-delete']
+    assert '-- ./-delete' in search_command('x', path='-delete', tool='rg')
+
+
+def test_cursor_round_trip():
+    key = search_key('x', '.', False, False, None)
+    cursor = encode_cursor(key, 'src/a.py', 12)
+    assert decode_cursor(cursor, key) == (('src', 'a.py'), 12)
+
+
+def test_cursor_from_another_search_is_rejected():
+    cursor = encode_cursor(search_key('x', '.', False, False, None), 'a', 1)
+    with pytest.raises(ValueError, match='different search'):
+        decode_cursor(cursor, search_key('y', '.', False, False, None))
+
+
+@pytest.mark.parametrize('cursor', ['not base64!', 'e30=', 123, None, ['a']])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor, 'key')
+
+
+def test_rg_output_is_grouped_per_file():
+    lines = [b'{"type": "begin"}', rg_match('a', 1, 'foo'), rg_match('a', 5, 'foo'), rg_match('b', 2, 'foo')]
+    records = list(iter_search_results(output('rg', lines), 'foo'))
+    assert [(r['path'], [m['line'] for m in r['matches']]) for r in records[:-1]] == [('a', [1, 5]), ('b', [2])]
+    summary = records[-1]
+    assert summary['tool'] == 'rg'
+    assert (summary['match_count'], summary['file_count'], summary['truncated']) == (3, 2, False)
+    assert summary['cursor'] is None
+
+
+def test_grep_output_is_parsed():
+    lines = [b'dir/a\x003:foo bar', b'dir/a\x00not a match', b'dir/b\x0010:foo']
+    records = list(iter_search_results(output('grep', lines), 'foo'))
+    assert records[0] == {"type": "file", "path": "dir/a", "matches": [{"line": 3, "text": "foo bar"}]}
+    assert records[1]['matches'] == [{"line": 10, "text": "foo"}]
+    assert records[-1]['match_count'] == 2
+
+
+def test_long_lines_are_truncated():
+    lines = [b'a\x001:' + b'x' * (MAX_LINE_LENGTH + 10)]
+    match = list(iter_search_results(output('grep', lines), 'x'))[0]['matches'][0]
+    assert len(match['text']) == MAX_LINE_LENGTH
+    assert match['truncated']
+
+
+def test_pages_continue_from_the_cursor():
+    lines = [b'a\x001:x', b'a\x002:x', b'a/b\x001:x', b'b\x001:x']
+    first = list(iter_search_results(output('grep', lines), 'x', max_results=2))
+    summary = first[-1]
+    assert summary['truncated'] and summary['match_count'] == 2
+
+    second = list(iter_search_results(output('grep', lines), 'x', max_results=2, cursor=summary['cursor']))
+    assert [(r['path'], r['matches'][0]['line']) for r in second[:-1]] == [('a/b', 1), ('b', 1)]
+    assert not second[-1]['truncated']
+
+
+def test_stopping_early_closes_the_output():
+    closed = []
+
+    def chunks():
+        try:
+            yield from output('grep', [b'a\x00%d:x' % line for line in range(1, 100)], chunk_size=1000)
+        finally:
+            closed.append(True)
+
+    records = list(iter_search_results(chunks(), 'x', max_results=3))
+    assert records[-1]['truncated']
+    assert closed == [True]
+
+
+def test_stderr_and_exit_status_are_reported():
+    def chunks():
+        yield 'stdout', b'grep\n'
+        yield 'stderr', b'grep: x: Permission denied\n'
+        yield 'exit', 2
+
+    summary = list(iter_search_results(chunks(), 'x'))[-1]
+    assert summary['exit_status'] == 2
+    assert 'Permission denied' in summary['errors']
@@ -0,0 +1,194 @@
+"""Tests for the admission scheduler: token buckets, limits and fair queueing."""
+import queue
+import threading
+import time
+
+import pytest
+
+import scheduler
+from scheduler import AdmissionScheduler, Overloaded, TokenBucket, parse_weights
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock)
+    return clock
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class Waiters:
+    """Queues commands from background threads and hands out their tickets as they are granted."""
+
+    def __init__(self, sched):
+        self.sched = sched
+        self.granted = queue.Queue()
+        self.threads = []
+
+    def add(self, client_id, connection_id='c'):
+        queued = self.sched.stats()['queued']
+        thread = threading.Thread(target=lambda: self.granted.put(self.sched.admit(client_id, connection_id)),
+                                  daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        wait_for(lambda: self.sched.stats()['queued'] == queued + 1)
+
+    def next(self):
+        return self.granted.get(timeout=5)
+
+
+def test_token_bucket_allows_a_burst_then_refills(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    assert not bucket.full()
+
+    clock.now += 0.5
+    assert bucket.take() == 0
+    clock.now += 10
+    assert bucket.full()
+    # Refilling stops at the burst size
+    assert [bucket.take() for _ in range(4)][:3] == [0, 0, 0]
+    assert bucket.take() > 0
+
+
+def test_rate_limit_is_per_source(clock):
+    sched = AdmissionScheduler(rate=1, burst=2)
+    for _ in range(2):
+        sched.release(sched.admit('a', 'c', source='10.0.0.1'))
+    with pytest.raises(Overloaded) as excinfo:
+        sched.admit('b', 'c', source='10.0.0.1')
+    assert excinfo.value.retry_after == 1
+    assert sched.stats()['clients']['b']['rate_limited'] == 1
+
+    # Another source has its own bucket, whatever client name it uses
+    sched.release(sched.admit('a', 'c', source='10.0.0.2'))
+    clock.now += 1
+    sched.release(sched.admit('b', 'c', source='10.0.0.1'))
+
+
+def test_retry_after_is_at_least_one_second():
+    assert Overloaded('x', 0.01).retry_after == 1
+    assert Overloaded('x', 2.5).retry_after == 3
+
+
+def test_per_connection_limit_does_not_block_other_connections():
+    sched = AdmissionScheduler(max_running=4, max_per_connection=1, max_wait=5)
+    held = sched.admit('a', 'c1')
+    waiters = Waiters(sched)
+    waiters.add('a', 'c1')
+    other = sched.admit('a', 'c2')
+    assert sched.stats()['connections']['c1'] == {"running": 1, "queued": 1}
+
+    sched.release(held)
+    assert waiters.next().connection_id == 'c1'
+    sched.release(other)
+
+
+def test_full_queue_is_rejected():
+    sched = AdmissionScheduler(max_running=1, queue_size=1, max_wait=5)
+    held = sched.admit('a', 'c')
+    waiters = Waiters(sched)
+    waiters.add('a')
+    with pytest.raises(Overloaded, match='Too many queued'):
+        sched.admit('a', 'c')
+    # The queue limit is per client
+    waiters.add('b')
+    assert sched.stats()['clients']['a']['rejected'] == 1
+
+    sched.release(held)
+    sched.release(waiters.next())
+    sched.release(waiters.next())
+
+
+def test_waiting_too_long_is_rejected():
+    sched = AdmissionScheduler(max_running=1, max_wait=0.05)
+    held = sched.admit('a', 'c')
+    with pytest.raises(Overloaded, match='Timed out'):
+        sched.admit('b', 'c')
+    stats = sched.stats()
+    assert stats['clients']['b']['timed_out'] == 1
+    assert stats['queued'] == 0
+    sched.release(held)
+    assert sched.stats()['connections'] == {}
+
+
+def test_busy_client_does_not_starve_others():
+    sched = AdmissionScheduler(max_running=1, max_wait=5)
+    held = sched.admit('busy', 'c')
+    waiters = Waiters(sched)
+    for _ in range(3):
+        waiters.add('busy')
+    waiters.add('quiet')
+
+    order = []
+    sched.release(held)
+    for _ in range(4):
+        ticket = waiters.next()
+        order.append(ticket.client_id)
+        sched.release(ticket)
+    # busy has already had a command run, so quiet goes first
+    assert order == ['quiet', 'busy', 'busy', 'busy']
+
+
+def test_weights_share_slots_in_proportion():
+    sched = AdmissionScheduler(max_running=1, max_wait=5, weights={'heavy': 2})
+    held = sched.admit('x', 'c')
+    waiters = Waiters(sched)
+    for _ in range(4):
+        waiters.add('heavy')
+    for _ in range(2):
+        waiters.add('light')
+
+    order = []
+    sched.release(held)
+    for _ in range(6):
+        ticket = waiters.next()
+        order.append(ticket.client_id)
+        sched.release(ticket)
+    assert order[:3].count('heavy') == 2
+    assert order.count('light') == 2
+
+
+def test_release_twice_frees_one_slot():
+    sched = AdmissionScheduler(max_running=2)
+    ticket = sched.admit('a', 'c')
+    sched.admit('a', 'c')
+    sched.release(ticket)
+    sched.release(ticket)
+    assert sched.stats()['running'] == 1
+
+
+def test_idle_clients_are_forgotten_to_make_room():
+    sched = AdmissionScheduler(max_clients=2)
+    busy = sched.admit('a', 'c')
+    sched.release(sched.admit('b', 'c'))
+    sched.release(sched.admit('c', 'c'))
+    assert set(sched.stats()['clients']) == {'a', 'c'}
+    assert sched.stats()['forgotten_clients'] == 1
+
+    sched.admit('c', 'c')
+    with pytest.raises(Overloaded, match='Too many active clients'):
+        sched.admit('d', 'c')
+    sched.release(busy)
+
+
+def test_parse_weights():
+    assert parse_weights('a=2, b=0.5') == {'a': 2.0, 'b': 0.5}
+    assert parse_weights('') == {}
+    with pytest.raises(ValueError):
+        parse_weights('a=0')
@@ -0,0 +1,99 @@
+"""Tests for saved session state: secrets stay out of the file, credential references."""
+import json
+import os
+
+import pytest
+
+import session_state
+from session_state import SessionStore, CREDENTIALS_MCP_CONFIG, CREDENTIALS_UNAVAILABLE
+
+
+class FakeClient:
+    def __init__(self, **connect_args):
+        self._connect_args = connect_args
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = {"host": "db", "username": "admin", "password": "from-config"}
+    monkeypatch.setattr(session_state, 'load_mcp_config', lambda: dict(settings))
+    return settings
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(str(tmp_path / 'state' / 'sessions.json'))
+
+
+def saved_sessions(store):
+    with open(store.path) as f:
+        return json.load(f)['sessions']
+
+
+def test_secrets_are_never_written(store, settings):
+    clients = [
+        ('admin@db:22', FakeClient(hostname='db', username='admin', password='from-config')),
+        ('u@web:22', FakeClient(hostname='web', username='u', key_path='~/.ssh/id',
+                                key_passphrase='hunter2',
+                                jump_hosts=[{"hostname": "bastion", "password": "bastion-secret"},
+                                            "v@inner:22"])),
+    ]
+    store.save(clients)
+    with open(store.path) as f:
+        text = f.read()
+    for secret in ('from-config', 'hunter2', 'bastion-secret'):
+        assert secret not in text
+
+    sessions = saved_sessions(store)
+    assert sessions[1]['connect_args']['jump_hosts'] == [{"hostname": "bastion"}, "v@inner:22"]
+    assert sessions[1]['connect_args']['key_path'] == '~/.ssh/id'
+    # The client's own arguments are left alone
+    assert clients[1][1]._connect_args['jump_hosts'][0]['password'] == 'bastion-secret'
+
+
+def test_clients_without_connect_args_are_skipped(store):
+    store.save([('a', object()), ('b', FakeClient())])
+    assert saved_sessions(store) == []
+
+
+def test_credential_references(store, settings):
+    reference = store.credential_reference
+    assert reference({"hostname": "db", "username": "admin", "key_path": "k"}, None) is None
+    assert reference({"hostname": "db", "username": "admin", "password": "from-config"},
+                     settings) == CREDENTIALS_MCP_CONFIG
+    assert reference({"hostname": "db", "username": "admin", "password": "other"},
+                     settings) == CREDENTIALS_UNAVAILABLE
+    assert reference({"hostname": "web", "username": "admin", "password": "from-config"},
+                     settings) == CREDENTIALS_UNAVAILABLE
+    assert reference({"hostname": "db", "username": "admin",
+                      "jump_hosts": [{"hostname": "b", "key_passphrase": "p"}]},
+                     settings) == CREDENTIALS_UNAVAILABLE
+
+
+def test_saved_sessions_resolve_their_secrets(store, settings):
+    store.save([
+        ('admin@db:22', FakeClient(hostname='db', username='admin', password='from-config')),
+        ('u@web:22', FakeClient(hostname='web', username='u', password='typed-in')),
+        ('v@agent:22', FakeClient(hostname='agent', username='v', use_agent=True)),
+    ])
+    resolved = [store.resolve(entry) for entry in store.load()]
+    assert resolved[0]['password'] == 'from-config'
+    assert resolved[1] is None
+    assert resolved[2] == {"hostname": "agent", "username": "v", "use_agent": True}
+
+
+def test_load_ignores_missing_unreadable_and_other_versions(store):
+    assert store.load() == []
+    os.makedirs(os.path.dirname(store.path))
+    with open(store.path, 'w') as f:
+        f.write('{not json')
+    assert store.load() == []
+    with open(store.path, 'w') as f:
+        json.dump({"version": session_state.STATE_VERSION + 1, "sessions": [{"connection_id": "a"}]}, f)
+    assert store.load() == []
+
+
+def test_state_file_is_private(store):
+    store.save([('a', FakeClient(hostname='h', username='u'))])
+    assert os.stat(store.path).st_mode & 0o077 == 0
+    assert [name for name in os.listdir(os.path.dirname(store.path))] == ['sessions.json']
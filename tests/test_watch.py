@@ -0,0 +1,86 @@
+"""Tests for watches: subscriber backlogs, diffs and interval limits."""
+import math
+import threading
+
+import pytest
+
+from watch import Subscription, WatchManager, WatchEnded, MAX_PENDING_EVENTS, diff_text
+
+
+class FakeWatch:
+    def __init__(self):
+        self.seq = 0
+
+    def snapshot(self):
+        return {"type": "snapshot", "seq": self.seq, "stdout": "current"}
+
+
+def test_deliver_queues_events_in_order():
+    subscription = Subscription(FakeWatch())
+    for seq in range(3):
+        subscription.deliver({"type": "diff", "seq": seq})
+    assert [event['seq'] for event in subscription.events(duration=0.01)] == [0, 1, 2]
+
+
+def test_full_backlog_is_replaced_by_a_snapshot():
+    watch = FakeWatch()
+    subscription = Subscription(watch)
+    for seq in range(MAX_PENDING_EVENTS):
+        subscription.deliver({"type": "diff", "seq": seq})
+    watch.seq = MAX_PENDING_EVENTS
+    subscription.deliver({"type": "diff", "seq": MAX_PENDING_EVENTS})
+    assert list(subscription.events(duration=0.01)) == [watch.snapshot()]
+
+    # Later events follow the snapshot as usual
+    subscription.deliver({"type": "unchanged", "seq": MAX_PENDING_EVENTS + 1})
+    assert [event['type'] for event in subscription.events(duration=0.01)] == ['unchanged']
+
+
+def test_events_stop_at_the_end_event_and_limits():
+    subscription = Subscription(FakeWatch())
+    for event in [{"type": "unchanged"}, {"type": "end"}, {"type": "unchanged"}]:
+        subscription.deliver(event)
+    assert [event['type'] for event in subscription.events()] == ['unchanged', 'end']
+    assert len(list(subscription.events(max_events=1))) == 1
+
+
+def test_diff_text():
+    assert diff_text('a\nb', 'a\nb') is None
+    diff = diff_text('a\nb', 'a\nc')
+    assert '-b' in diff.splitlines() and '+c' in diff.splitlines()
+
+
+@pytest.mark.parametrize('interval', [0.5, 86401, math.nan, math.inf, -math.inf])
+def test_invalid_intervals_are_rejected(interval):
+    manager = WatchManager(lambda *args: None)
+    with pytest.raises(ValueError):
+        manager.subscribe('c', 'uptime', interval)
+    assert manager.stats() == []
+
+
+def test_runs_publish_snapshot_diff_and_unchanged_as_the_subscriber():
+    outputs = iter(['one', 'two', 'two'])
+    calls = []
+    subscribed = threading.Event()
+    done = threading.Event()
+
+    def run(connection_id, command, client_id, source):
+        # Wait until the subscriber is listening, so it sees every run
+        subscribed.wait(5)
+        calls.append((connection_id, command, client_id, source))
+        try:
+            return next(outputs), '', 0, False
+        except StopIteration:
+            done.set()
+            raise WatchEnded("Connection closed")
+
+    manager = WatchManager(run, min_interval=0)
+    subscription = manager.subscribe('c', 'cat x', 0, client_id='watch:a', source='10.0.0.1')
+    subscribed.set()
+    events = list(subscription.events(duration=5))
+    assert done.is_set()
+    assert [event['type'] for event in events] == ['snapshot', 'diff', 'unchanged', 'end']
+    assert events[0]['stdout'] == 'one'
+    assert events[1]['stdout_diff'].splitlines()[-2:] == ['-one', '+two']
+    assert set(calls) == {('c', 'cat x', 'watch:a', '10.0.0.1')}
+    assert [event['seq'] for event in events] == [1, 2, 3, 4]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Transport tuning module for MCP Server
+Named SSH transport profiles for different kinds of links
+"""
+import paramiko
+
+DEFAULT_PROFILE = 'default'
+
+# Each profile sets the per-channel receive window, the largest packet we
+# accept, whether to compress, and algorithms to prefer. Preferred algorithms
+# are moved to the front of paramiko's list rather than replacing it, so a
+# server that supports none of them still negotiates something.
+PROFILES = {
+    'default': {
+        'description': "paramiko defaults",
+        'window_size': None,
+        'max_packet_size': None,
+        'compress': False,
+        'ciphers': (),
+        'macs': (),
+        'kex': ()
+    },
+    'lan-fast': {
+        'description': "Fast, low-latency links: cheap ciphers, no compression, big windows",
+        'window_size': 16 * 1024 * 1024,
+        'max_packet_size': 64 * 1024,
+        'compress': False,
+        'ciphers': ('aes128-ctr', 'aes256-ctr'),
+        'macs': ('hmac-sha2-256-etm@openssh.com', 'hmac-sha2-256'),
+        'kex': ('curve25519-sha256@libssh.org', 'ecdh-sha2-nistp256')
+    },
+    'wan': {
+        'description': "Slow or high-latency links: compression, large windows",
+        'window_size': 32 * 1024 * 1024,
+        'max_packet_size': 32 * 1024,
+        'compress': True,
+        'ciphers': ('aes128-ctr', 'aes256-ctr'),
+        'macs': ('hmac-sha2-256-etm@openssh.com', 'hmac-sha2-256'),
+        'kex': ('curve25519-sha256@libssh.org', 'ecdh-sha2-nistp256')
+    }
+}
+
+
+def get_profile(name):
+    """
+    Look up a tuning profile.
+
+    Args:
+        name (str): Profile name, or None for the default profile
+
+    Returns:
+        dict: The profile settings
+
+    Raises:
+        Exception: If there is no profile with that name
+    """
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise Exception(f"Unknown tuning profile '{name}' "
+                        f"(available: {', '.join(sorted(PROFILES))})")
+    return PROFILES[name]
+
+
+def _prefer(available, preferred):
+    """Move the supported algorithms in preferred to the front of available."""
+    first = [name for name in preferred if name in available]
+    return tuple(first) + tuple(name for name in available if name not in first)
+
+
+def transport_factory(name):
+    """
+    Build a transport factory for paramiko.SSHClient.connect.
+
+    Args:
+        name (str): Profile name, or None for the default profile
+
+    Returns:
+        callable: Creates a paramiko.Transport tuned for the profile
+    """
+    profile = get_profile(name)
+
+    def create(sock, **kwargs):
+        transport_args = {}
+        if profile['window_size']:
+            transport_args['default_window_size'] = profile['window_size']
+        if profile['max_packet_size']:
+            transport_args['default_max_packet_size'] = profile['max_packet_size']
+        transport = paramiko.Transport(sock, **transport_args, **kwargs)
+
+        options = transport.get_security_options()
+        if profile['ciphers']:
+            options.ciphers = _prefer(options.ciphers, profile['ciphers'])
+        if profile['macs']:
+            options.digests = _prefer(options.digests, profile['macs'])
+        if profile['kex']:
+            options.kex = _prefer(options.kex, profile['kex'])
+        return transport
+
+    return create
+
+
+def describe_profiles():
+    """
+    Describe the available profiles.
+
+    Returns:
+        dict: Profile name -> settings
+    """
+    return {name: {key: list(value) if isinstance(value, tuple) else value
+                   for key, value in profile.items()}
+            for name, profile in PROFILES.items()}
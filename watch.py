@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Watch module for MCP Server
+Re-runs a command at an interval and sends subscribers only what changed
+"""
+import math
+import time
+import queue
+import difflib
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Events a subscriber may fall behind by before it is sent a fresh snapshot
+MAX_PENDING_EVENTS = 100
+
+
+class WatchEnded(Exception):
+    """Raised by a watch's run function when the command can't run any more."""
+
+
+def diff_text(old, new):
+    """
+    Diff two outputs line by line.
+
+    Returns:
+        str: Unified diff without context lines, or None if they are equal
+    """
+    if old == new:
+        return None
+    return '\n'.join(difflib.unified_diff(old.splitlines(), new.splitlines(),
+                                          'before', 'after', n=0, lineterm=''))
+
+
+class Subscription:
+    """One subscriber's queue of watch events."""
+
+    def __init__(self, watch):
+        self.watch = watch
+        self.queue = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+
+    def deliver(self, event):
+        """Queue an event, replacing the backlog with a snapshot if it is full."""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Diffs only make sense in order, so a subscriber that fell
+            # behind skips them and starts again from the current output
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(self.watch.snapshot())
+
+    def events(self, max_events=None, duration=None):
+        """
+        Yield events until the watch ends or a limit is reached.
+
+        Args:
+            max_events (int, optional): Stop after this many events
+            duration (float, optional): Stop after this many seconds
+        """
+        deadline = time.monotonic() + duration if duration else None
+        count = 0
+        while max_events is None or count < max_events:
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return
+            try:
+                event = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return
+            yield event
+            count += 1
+            if event['type'] == 'end':
+                return
+
+    def close(self):
+        """Stop receiving events."""
+        self.watch.unsubscribe(self)
+
+
+class Watch:
+    """
+    A command re-run on one connection at a fixed interval.
+
+    Each run is compared with the previous one, and subscribers receive a
+    diff, or an "unchanged" event, instead of the full output. All
+    subscribers share the same runs. The watch stops when its last
+    subscriber leaves.
+    """
+
+    def __init__(self, manager, connection_id, command, interval, run, client_id=None, source=None):
+        """
+        Initialize the watch.
+
+        Args:
+            manager (WatchManager): The manager that owns it
+            connection_id (str): The connection to run on
+            command (str): The command to run
+            interval (float): Seconds between the starts of runs
+            run (callable): Called with (connection_id, command, client_id,
+                source); returns (stdout, stderr, exit_status, truncated)
+            client_id (str, optional): Scheduling identity of the runs
+            source (str, optional): Address the runs are rate limited as
+        """
+        self.manager = manager
+        self.connection_id = connection_id
+        self.command = command
+        self.interval = interval
+        self.run = run
+        self.client_id = client_id
+        self.source = source
+        self.key = (connection_id, command, interval)
+        self.seq = 0
+        self.runs = 0
+        self.changes = 0
+        self.state = None
+        self.subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='watch', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def snapshot(self):
+        """Event with the full current output. Call with the lock held or from deliver."""
+        if self.state is None:
+            return {"type": "pending", "seq": self.seq}
+        return {"type": "snapshot", "seq": self.seq, **self.state}
+
+    def subscribe(self):
+        """
+        Add a subscriber. It first receives the current output, if any.
+
+        Returns:
+            Subscription: The subscriber's events
+        """
+        subscription = Subscription(self)
+        with self._lock:
+            self.subscribers.add(subscription)
+            if self.state is not None:
+                subscription.deliver(self.snapshot())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscribers.discard(subscription)
+            if self.subscribers:
+                return
+            self._stop.set()
+        self.manager.remove(self)
+
+    def _publish(self, event):
+        """Send an event to all subscribers. Call with the lock held."""
+        for subscription in self.subscribers:
+            subscription.deliver(event)
+
+    def _run_once(self):
+        """Run the command once and publish what changed."""
+        now = datetime.datetime.utcnow().isoformat(timespec='milliseconds') + 'Z'
+        try:
+            stdout, stderr, exit_status, truncated = self.run(self.connection_id, self.command,
+                                                              self.client_id, self.source)
+        except WatchEnded as e:
+            with self._lock:
+                self.seq += 1
+                self._publish({"type": "end", "seq": self.seq, "time": now, "message": str(e)})
+            return False
+        except Exception as e:
+            logger.warning(f"Watch of {self.command!r} on {self.connection_id} failed: {str(e)}")
+            with self._lock:
+                self.seq += 1
+                self._publish({"type": "error", "seq": self.seq, "time": now, "message": str(e)})
+            return True
+
+        state = {"time": now, "exit_status": exit_status, "stdout": stdout, "stderr": stderr,
+                 "truncated": truncated}
+        with self._lock:
+            self.seq += 1
+            self.runs += 1
+            previous, self.state = self.state, state
+            if previous is None:
+                event = self.snapshot()
+            else:
+                stdout_diff = diff_text(previous['stdout'], stdout)
+                stderr_diff = diff_text(previous['stderr'], stderr)
+                if stdout_diff is None and stderr_diff is None and previous['exit_status'] == exit_status:
+                    event = {"type": "unchanged", "seq": self.seq, "time": now}
+                else:
+                    self.changes += 1
+                    event = {"type": "diff", "seq": self.seq, "time": now, "exit_status": exit_status,
+                             "stdout_diff": stdout_diff, "stderr_diff": stderr_diff,
+                             "truncated": truncated}
+            # Under the same lock as the state change, so a new subscriber
+            # gets either the snapshot before this run or this run's event
+            self._publish(event)
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            if not self._run_once():
+                break
+            self._stop.wait(max(0, self.interval - (time.monotonic() - started)))
+        self.manager.remove(self)
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connection_id": self.connection_id,
+                "command": self.command,
+                "interval": self.interval,
+                "subscribers": len(self.subscribers),
+                "runs": self.runs,
+                "changes": self.changes,
+                "last_run": self.state['time'] if self.state else None
+            }
+
+
+class WatchManager:
+    """Shares one Watch between all subscribers of the same command, connection and interval."""
+
+    def __init__(self, run, min_interval=1, max_interval=86400):
+        """
+        Initialize the manager.
+
+        Args:
+            run (callable): Runs a command for a watch, see Watch
+            min_interval (float): Shortest interval a watch may use
+            max_interval (float): Longest interval a watch may use
+        """
+        self.run = run
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, connection_id, command, interval, client_id=None, source=None):
+        """
+        Subscribe to a watch, starting it if nobody is watching yet.
+
+        A new watch runs as the subscriber that started it: client_id and
+        source are passed to the run function for scheduling and rate
+        limiting.
+
+        Returns:
+            Subscription: The new subscriber's events
+
+        Raises:
+            ValueError: If the interval is not a number between the minimum
+                and the maximum
+        """
+        # NaN passes every comparison, and infinity can't be waited for
+        if not math.isfinite(interval) or not self.min_interval <= interval <= self.max_interval:
+            raise ValueError(f"Interval must be between {self.min_interval} and {self.max_interval} seconds")
+        key = (connection_id, command, interval)
+        with self._lock:
+            watch = self._watches.get(key)
+            if watch is None or watch.stopped:
+                watch = self._watches[key] = Watch(self, connection_id, command, interval, self.run,
+                                                   client_id, source)
+                watch.start()
+                logger.info(f"Started watch of {command!r} on {connection_id} every {interval}s")
+            # Subscribe under the manager lock so the watch can't be removed in between
+            return watch.subscribe()
+
+    def remove(self, watch):
+        """Forget a watch that stopped or lost its last subscriber."""
+        watch.stop()
+        with self._lock:
+            if self._watches.get(watch.key) is watch:
+                del self._watches[watch.key]
+                logger.info(f"Stopped watch of {watch.command!r} on {watch.connection_id}")
+
+    def stats(self):
+        with self._lock:
+            watches = list(self._watches.values())
+        return [watch.stats() for watch in watches]